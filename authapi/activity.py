@@ -0,0 +1,235 @@
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class LastActivityRecorder:
+    """
+    Write-behind buffer for User.last_activity.
+
+    record() keeps only the newest timestamp per user and ignores updates
+    closer than LAST_ACTIVITY_RESOLUTION seconds to the last known value.
+    Buffered values are written with a single UPDATE ... CASE statement every
+    LAST_ACTIVITY_FLUSH_INTERVAL seconds, when LAST_ACTIVITY_BUFFER_SIZE users
+    are pending, and at interpreter exit. Readers on other workers therefore
+    see values at most resolution + flush interval behind.
+
+    Recorded values are also put in the shared cache at once, so
+    last_activity_for() can answer from the cache without reading the user.
+    """
+    CACHE_KEY = 'authapi:last_activity:%s'
+
+    def __init__(self):
+        self._pending = {}
+        # Values flushed recently, so users served from a cache holding an
+        # older last_activity are still held to the resolution.
+        self._written = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+        atexit.register(self.shutdown)
+
+    @property
+    def resolution(self):
+        return timedelta(seconds=getattr(settings, 'LAST_ACTIVITY_RESOLUTION', 60))
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'LAST_ACTIVITY_FLUSH_INTERVAL', 30)
+
+    @property
+    def buffer_size(self):
+        return getattr(settings, 'LAST_ACTIVITY_BUFFER_SIZE', 500)
+
+    @property
+    def inactivity_timeout(self):
+        return timedelta(seconds=getattr(settings, 'TOKEN_INACTIVITY_TIMEOUT', 3600))
+
+    def record(self, user, when=None):
+        """Note that `user` was active at `when` (default now)."""
+        when = when or timezone.now()
+        if self.record_id(user.pk, when, self.last_activity(user)):
+            user.last_activity = when
+
+    async def arecord(self, user, when=None):
+        when = when or timezone.now()
+        if await self.arecord_id(user.pk, when, self.last_activity(user)):
+            user.last_activity = when
+
+    def record_id(self, user_id, when=None, known=None):
+        """
+        record() for a user that is not loaded; `known` is its last activity
+        if already looked up. Returns False when `known` is within the
+        resolution and nothing was recorded.
+        """
+        when = when or timezone.now()
+        if known is not None and when - known < self.resolution:
+            return False
+        cache.set(self.CACHE_KEY % user_id, when.timestamp(), self._cache_timeout())
+        if self._buffer(user_id, when):
+            self.flush()
+        return True
+
+    async def arecord_id(self, user_id, when=None, known=None):
+        when = when or timezone.now()
+        if known is not None and when - known < self.resolution:
+            return False
+        await cache.aset(self.CACHE_KEY % user_id, when.timestamp(), self._cache_timeout())
+        if self._buffer(user_id, when):
+            await sync_to_async(self.flush)()
+        return True
+
+    def _buffer(self, user_id, when):
+        """Buffer the timestamp; returns True when the buffer should be flushed now."""
+        with self._lock:
+            self._merge(user_id, when)
+            full = len(self._pending) >= self.buffer_size
+        self._ensure_flusher()
+        return full
+
+    def last_activity(self, user):
+        """Newest known activity for `user`, including values not yet flushed."""
+        return self._newest(user.pk, user.last_activity)
+
+    def last_activity_for(self, user_id):
+        """
+        Newest known activity of the user with `user_id`, from the shared
+        cache or, on a miss, the database. Raises User.DoesNotExist when there
+        is no such user.
+        """
+        stored = cache.get(self.CACHE_KEY % user_id)
+        if stored is None:
+            stored = self._load(self._user_rows(user_id).first())
+        return self._newest(user_id, self._from_timestamp(stored))
+
+    async def alast_activity_for(self, user_id):
+        stored = await cache.aget(self.CACHE_KEY % user_id)
+        if stored is None:
+            stored = await sync_to_async(self._load)(await self._user_rows(user_id).afirst())
+        return self._newest(user_id, self._from_timestamp(stored))
+
+    def forget(self, user_id):
+        """Drop the cached value, e.g. when the user is deleted."""
+        cache.delete(self.CACHE_KEY % user_id)
+
+    def _user_rows(self, user_id):
+        from .models import User
+        return User.objects.filter(pk=user_id).values_list('pk', 'last_activity')
+
+    def _load(self, row):
+        from .models import User
+        if row is None:
+            raise User.DoesNotExist
+        user_id, last_activity = row
+        # 0 for users never active, so they are cached too
+        stored = last_activity.timestamp() if last_activity is not None else 0
+        cache.add(self.CACHE_KEY % user_id, stored, self._cache_timeout())
+        return stored
+
+    def _cache_timeout(self):
+        # Past the inactivity window an entry can only say "inactive", which
+        # the database answers just as well.
+        return int((self.inactivity_timeout + self.resolution).total_seconds())
+
+    def _from_timestamp(self, stored):
+        return datetime.fromtimestamp(stored, tz=dt_timezone.utc) if stored else None
+
+    def _newest(self, user_id, last_activity):
+        known = [
+            when for when in (last_activity, self._pending.get(user_id), self._written.get(user_id))
+            if when is not None
+        ]
+        return max(known) if known else None
+
+    def flush(self):
+        """Write all buffered timestamps in one statement; returns rows updated."""
+        batch = self._take()
+        if not batch:
+            return 0
+        try:
+            updated = self._write(batch)
+        except Exception:
+            logger.exception("Failed to flush %d last_activity updates", len(batch))
+            with self._lock:
+                for pk, when in batch.items():
+                    self._merge(pk, when)
+            return 0
+        with self._lock:
+            if len(self._written) > 10 * self.buffer_size:
+                self._written.clear()
+            self._written.update(batch)
+        return updated
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _write(self, batch):
+        from .models import User
+
+        newest = Case(
+            *[When(pk=pk, then=Value(when)) for pk, when in batch.items()],
+            output_field=DateTimeField(),
+        )
+        # Greatest() keeps a newer value written by another worker.
+        return User.objects.filter(pk__in=batch).update(
+            last_activity=Greatest(Coalesce('last_activity', newest), newest)
+        )
+
+    def _merge(self, pk, when):
+        current = self._pending.get(pk)
+        if current is None or when > current:
+            self._pending[pk] = when
+
+    def reset(self):
+        """Write pending values and forget the recently written ones."""
+        self.flush()
+        with self._lock:
+            self._written.clear()
+
+    def shutdown(self):
+        """
+        Stop the flush thread and write what is still buffered; registered
+        with atexit. Does not touch the database when nothing is buffered, and
+        only warns when it is gone by then (the test runner has dropped its
+        database before atexit handlers run).
+        """
+        self._stopped.set()
+        batch = self._take()
+        if not batch:
+            return
+        try:
+            self._write(batch)
+        except DatabaseError as exc:
+            logger.warning("Dropped %d last_activity updates at exit: %s", len(batch), exc)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run, name='last-activity-flush', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                close_old_connections()
+                self.flush()
+            finally:
+                connection.close()
+
+
+activity_recorder = LastActivityRecorder()
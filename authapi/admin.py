@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
-from .models import User, BlacklistedToken
+from .models import User, BlacklistedToken, OutboundEmail
 
 # Register your models here.
 
@@ -30,10 +30,22 @@ class UserAdmin(BaseUserAdmin):
 class BlacklistedTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'blacklisted_at', 'expires_at')
     list_filter = ('blacklisted_at', 'expires_at')
-    search_fields = ('user__email', 'token')
+    search_fields = ('user__email',)
     date_hierarchy = 'blacklisted_at'
+    # Newest first, by primary key rather than an unindexed sort
+    ordering = ('-id',)
     readonly_fields = ('blacklisted_at',)
     
     def has_add_permission(self, request):
         # Tokens should only be blacklisted via the logout view
         return False
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'created_at', 'attempts', 'sent_at', 'failed_at')
+    list_filter = ('sent_at', 'failed_at')
+    readonly_fields = ('body', 'created_at', 'sent_at', 'failed_at', 'attempts', 'last_error')
+
+    def has_add_permission(self, request):
+        # Emails are queued by the API views
+        return False
@@ -0,0 +1,255 @@
+"""
+Async variants of the hot auth endpoints for ASGI deployments.
+
+DRF's APIView is sync-only, so these are plain Django async views that keep
+the request/response contract of their counterparts in views.py: same JSON
+bodies, status codes, throttles and error format (errors go through
+core.utils.custom_exception_handler). They are routed instead of the sync
+views when ASYNC_AUTH_VIEWS is enabled.
+"""
+import io
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from rest_framework import exceptions, status
+
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import TokenError
+
+from core.utils import custom_exception_handler
+
+from .activity import activity_recorder
+from .backends import CustomJWTAuthentication
+from .blacklist import blacklist_index
+from .email_filter import email_filter
+from .hashing import hashing_service
+from .models import User, BlacklistedToken
+from .parsers import JSONParser
+from .renderers import JSONRenderer
+from .serializers import FastUserSerializer, UserProfileUpdateSerializer
+from .throttles import AnonRateThrottle, LoginRateThrottle, UserRateThrottle
+from .token_utils import aget_tokens_for_user, token_digest, token_pair_from_refresh
+from .tokens import RefreshToken
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    # Rendered like the sync views' responses
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        status=status_code,
+        headers=headers,
+    )
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async stand-in for APIView: JSON body parsing, JWT authentication,
+    permission and throttle checks, and DRF-style error responses.
+    """
+    authentication_required = False
+    # Views that never read request.data skip parsing, as DRF parses lazily
+    parses_body = True
+    throttle_classes = []
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Token-authenticated API, exempt from CSRF like APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.authenticator = CustomJWTAuthentication()
+        try:
+            request.data = self.parse_body(request)
+            result = await self.authenticator.aauthenticate(request)
+            request.user, request.auth = result if result else (AnonymousUser(), None)
+            if self.authentication_required and not request.user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(request, exc)
+
+    def parse_body(self, request):
+        if not self.parses_body or not request.body:
+            return {}
+        if request.content_type != 'application/json':
+            raise exceptions.UnsupportedMediaType(request.content_type)
+        data = JSONParser().parse(
+            io.BytesIO(request.body), request.content_type,
+            {'encoding': request.encoding or settings.DEFAULT_CHARSET},
+        )
+        return data if isinstance(data, dict) else {}
+
+    def check_throttles(self, request):
+        # DRF throttles only read .META, .data and .user from the request
+        throttle_request = SimpleNamespace(META=request.META, data=request.data, user=request.user)
+        waits = []
+        for throttle in (throttle_class() for throttle_class in self.throttle_classes):
+            if not throttle.allow_request(throttle_request, self):
+                waits.append(throttle.wait())
+        if waits:
+            waits = [wait for wait in waits if wait is not None]
+            raise exceptions.Throttled(max(waits, default=None))
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = self.authenticator.authenticate_header(request)
+        response = custom_exception_handler(exc, {'view': self, 'request': request})
+        headers = {name: response[name] for name in ('WWW-Authenticate', 'Retry-After') if name in response}
+        return json_response(response.data, response.status_code, headers=headers)
+
+
+class AsyncCustomTokenRefreshView(AsyncAPIView):
+    """
+    Async variant of CustomTokenRefreshView.
+    """
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    async def post(self, request, *args, **kwargs):
+        refresh_token = request.data.get('refresh')
+        try:
+            token = RefreshToken(refresh_token)
+            user_id = token[jwt_settings.USER_ID_CLAIM]
+            last_activity = await activity_recorder.alast_activity_for(user_id)
+            issued_at = datetime.fromtimestamp(token['iat'], tz=dt_timezone.utc)
+            now = timezone.now()
+            if max(last_activity or issued_at, issued_at) < now - activity_recorder.inactivity_timeout:
+                return json_response({"detail": "Token has expired due to inactivity."}, status.HTTP_401_UNAUTHORIZED)
+            await activity_recorder.arecord_id(user_id, now, last_activity)
+            return json_response(token_pair_from_refresh(token))
+        except (InvalidToken, TokenError, KeyError, User.DoesNotExist):
+            return json_response({"detail": "Invalid token."}, status.HTTP_401_UNAUTHORIZED)
+
+
+class AsyncUserLoginView(AsyncAPIView):
+    """
+    Async variant of UserLoginView; password checks run on the bounded
+    hashing executor.
+    """
+    throttle_classes = [AnonRateThrottle, LoginRateThrottle]
+
+    async def post(self, request):
+        email = request.data.get('email')
+        password = request.data.get('password')
+
+        if not email or not password:
+            return json_response({
+                'success': False,
+                'message': 'Email and password are required'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await email_filter.aget_user(email)
+        except User.DoesNotExist:
+            return json_response({
+                'success': False,
+                'message': 'User not found'
+            }, status.HTTP_404_NOT_FOUND)
+
+        if not await hashing_service.acheck_password(user, password):
+            return json_response({
+                'success': False,
+                'message': 'Invalid credentials'
+            }, status.HTTP_401_UNAUTHORIZED)
+
+        if not user.is_active:
+            return json_response({
+                'success': False,
+                'message': 'Account not verified',
+                'error': 'Please verify your email before logging in',
+                'user_exists': True,
+                'email': email
+            }, status.HTTP_403_FORBIDDEN)
+
+        tokens = await aget_tokens_for_user(user)
+        return json_response({
+            'success': True,
+            'message': 'Login successful',
+            'tokens': tokens,
+            'user': FastUserSerializer(user).data
+        })
+
+
+class AsyncUserProfileView(AsyncAPIView):
+    """
+    Async variant of UserProfileView.
+    """
+    authentication_required = True
+    throttle_classes = [UserRateThrottle]
+
+    async def get(self, request):
+        return json_response({
+            'success': True,
+            'user': FastUserSerializer(request.user).data
+        })
+
+    async def put(self, request):
+        user = request.user
+        serializer = UserProfileUpdateSerializer(user, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return json_response({
+                'success': False,
+                'message': 'Profile update failed',
+                'error': serializer.errors
+            }, status.HTTP_400_BAD_REQUEST)
+
+        for field, value in serializer.validated_data.items():
+            setattr(user, field, value)
+        await user.asave(update_fields=list(serializer.validated_data))
+        return json_response({
+            'success': True,
+            'message': 'Profile updated successfully',
+            'user': FastUserSerializer(user).data
+        })
+
+    async def patch(self, request):
+        return await self.put(request)
+
+
+class AsyncUserLogoutView(AsyncAPIView):
+    """
+    Async variant of UserLogoutView.
+    """
+    authentication_required = True
+    parses_body = False
+    throttle_classes = [UserRateThrottle]
+
+    async def post(self, request):
+        auth_header = request.headers.get('Authorization', '')
+        if not auth_header.startswith('Bearer '):
+            return json_response({
+                'success': False,
+                'message': 'Invalid authorization header format'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            token = auth_header.split(' ')[1]
+            expiry = datetime.fromtimestamp(request.auth['exp'], tz=dt_timezone.utc)
+            digest = token_digest(token)
+            await BlacklistedToken.objects.acreate(
+                token_digest=digest,
+                user=request.user,
+                expires_at=expiry
+            )
+            blacklist_index.add(digest, expiry)
+            await activity_recorder.arecord(request.user)
+        except Exception as e:
+            return json_response({
+                'success': False,
+                'message': f'Error processing logout: {str(e)}'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        return json_response({
+            'success': True,
+            'message': 'Logged out successfully'
+        })
@@ -1,7 +1,17 @@
+import base64
+import binascii
+import hmac
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
 from django.utils.translation import gettext_lazy as _
-from .models import BlacklistedToken
+from core import db_router
+from .blacklist import blacklist_index
+from .models import replica_pin_keys
+from .token_utils import token_digest
+from .user_cache import user_cache
 from rest_framework.authentication import BaseAuthentication
 
 class CustomJWTAuthentication(JWTAuthentication):
@@ -32,9 +42,97 @@ class CustomJWTAuthentication(JWTAuthentication):
     
     def get_validated_token(self, raw_token):
         """Check if token is blacklisted before validation"""
-        # Check if token is in the blacklist
-        if BlacklistedToken.objects.filter(token=raw_token.decode()).exists():
+        # Check if token is in the blacklist (served from the in-memory index)
+        if blacklist_index.contains(token_digest(raw_token)):
             raise InvalidToken(_("Token is blacklisted due to logout"))
         
         # If not blacklisted, proceed with standard validation
         return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        """Look the user up through the per-worker user cache"""
+        user_id = self.get_user_id(validated_token)
+        # A user who just changed their account reads it back from the primary
+        db_router.read_your_writes(*replica_pin_keys(user_id))
+        return self.check_user(user_cache.get(user_id))
+
+    async def aauthenticate(self, request):
+        """Async counterpart of authenticate() used by the async views"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        try:
+            validated_token = await self.aget_validated_token(raw_token)
+            return await self.aget_user(validated_token), validated_token
+        except InvalidToken:
+            return None
+
+    async def aget_validated_token(self, raw_token):
+        """Async counterpart of get_validated_token(), raising the same errors"""
+        if await blacklist_index.acontains(token_digest(raw_token)):
+            raise InvalidToken(_("Token is blacklisted due to logout"))
+        return super().get_validated_token(raw_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        await db_router.aread_your_writes(*replica_pin_keys(user_id))
+        return self.check_user(await user_cache.aget(user_id))
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
+
+
+class ServiceClient:
+    """A service (such as the API gateway) authenticated with its client secret"""
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class ServiceClientAuthentication(BaseAuthentication):
+    """
+    HTTP Basic authentication against the client names and secrets in
+    INTROSPECTION_CLIENTS. Users and their JWTs are not accepted.
+    """
+    www_authenticate_realm = 'services'
+
+    def authenticate(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) != 2 or auth[0].lower() != 'basic':
+            return None
+        try:
+            name, _sep, secret = base64.b64decode(auth[1], validate=True).decode().partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            raise AuthenticationFailed(_("Invalid basic header"))
+        expected = getattr(settings, 'INTROSPECTION_CLIENTS', {}).get(name)
+        # Compared even for unknown names, so timing does not reveal them
+        if not hmac.compare_digest(secret.encode(), (expected or '').encode()) or expected is None:
+            raise AuthenticationFailed(_("Invalid client credentials"))
+        return ServiceClient(name), None
+
+    def authenticate_header(self, request):
+        return f'Basic realm="{self.www_authenticate_realm}"'
+
@@ -0,0 +1,158 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .bloom import BloomFilter
+from .models import BlacklistedToken
+
+
+class BlacklistIndex:
+    """
+    Per-worker, in-memory view of the BlacklistedToken table.
+
+    Keys are the token digests stored in BlacklistedToken.token_digest. A Bloom
+    filter answers the common "not revoked" case without touching the exact
+    set, and the exact set (digest -> expiry timestamp) confirms positives.
+    The index is refreshed by polling only rows newer than the last seen id, at
+    most once every TOKEN_BLACKLIST_MAX_STALENESS seconds. Entries whose
+    expires_at has passed are dropped since the token would fail its own expiry
+    check anyway.
+    """
+
+    # Rows younger than this are read again on the next sync, so inserts that
+    # commit out of id order are not skipped.
+    COMMIT_GRACE = 5.0
+    SYNC_BATCH_SIZE = 5000
+
+    def __init__(self, max_staleness=None, capacity=None):
+        self._max_staleness = max_staleness
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def max_staleness(self):
+        if self._max_staleness is not None:
+            return self._max_staleness
+        return getattr(settings, 'TOKEN_BLACKLIST_MAX_STALENESS', 5.0)
+
+    @property
+    def capacity(self):
+        if self._capacity is not None:
+            return self._capacity
+        return getattr(settings, 'TOKEN_BLACKLIST_INDEX_CAPACITY', 100000)
+
+    def reset(self):
+        """Forget everything; the next lookup reloads from the database."""
+        self._entries = {}
+        self._expiry_heap = []
+        self._bloom = BloomFilter(self.capacity)
+        self._cursor = 0
+        self._synced_at = None
+        self._removed = 0
+
+    def add(self, key, expires_at):
+        """Record a token blacklisted by this worker without waiting for a sync."""
+        with self._lock:
+            self._insert(key, expires_at.timestamp())
+
+    def contains(self, key):
+        if self._is_stale():
+            self.sync()
+        return self._lookup(key)
+
+    async def acontains(self, key):
+        if self._is_stale():
+            await sync_to_async(self.sync)()
+        return self._lookup(key)
+
+    def contains_many(self, keys, fresh=False):
+        """
+        The subset of `keys` that is blacklisted. With `fresh`, ask the
+        database with one IN query instead of trusting the index.
+        """
+        if not fresh:
+            if self._is_stale():
+                self.sync()
+            return {key for key in keys if self._lookup(key)}
+        rows = BlacklistedToken.objects.filter(
+            token_digest__in=list(keys), expires_at__gt=timezone.now(),
+        ).values_list('token_digest', 'expires_at')
+        found = set()
+        with self._lock:
+            for key, expires_at in rows:
+                key = bytes(key)
+                self._insert(key, expires_at.timestamp())
+                found.add(key)
+        return found
+
+    def _is_stale(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.max_staleness
+
+    def _lookup(self, key):
+        if key not in self._bloom:
+            return False
+        expires_at = self._entries.get(key)
+        return expires_at is not None and expires_at > time.time()
+
+    def sync(self):
+        """Pull rows added since the last sync and drop expired entries."""
+        if not self._lock.acquire(blocking=self._synced_at is None):
+            # Another thread is already syncing; serve the current view.
+            return
+        try:
+            now = timezone.now()
+            settled_before = now - timedelta(seconds=self.COMMIT_GRACE)
+            queryset = BlacklistedToken.objects.filter(expires_at__gt=now).order_by('id')
+            cursor = self._cursor
+            while True:
+                rows = list(
+                    queryset.filter(id__gt=cursor)
+                    .values_list('id', 'token_digest', 'blacklisted_at', 'expires_at')[:self.SYNC_BATCH_SIZE]
+                )
+                for row_id, key, blacklisted_at, expires_at in rows:
+                    # Some drivers return memoryview for binary columns.
+                    self._insert(bytes(key), expires_at.timestamp())
+                    # Only move the cursor past rows old enough that any row
+                    # with a smaller id has committed too; younger rows are
+                    # simply read again on the next sync.
+                    if blacklisted_at <= settled_before:
+                        self._cursor = max(self._cursor, row_id)
+                if len(rows) < self.SYNC_BATCH_SIZE:
+                    break
+                cursor = rows[-1][0]
+            self._prune()
+            self._synced_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _insert(self, key, expires_at):
+        if key not in self._entries:
+            self._bloom.add(key)
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+        self._entries[key] = expires_at
+
+    def _prune(self):
+        now = time.time()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, key = heapq.heappop(heap)
+            del self._entries[key]
+            self._removed += 1
+
+        # Bloom filters cannot forget keys, so rebuild once enough entries have
+        # gone or the live set has outgrown the filter's sizing.
+        if self._removed > len(self._entries) or len(self._entries) > self._bloom.capacity:
+            bloom = BloomFilter(max(self.capacity, len(self._entries) * 2))
+            for key in self._entries:
+                bloom.add(key)
+            self._bloom = bloom
+            self._removed = 0
+
+
+blacklist_index = BlacklistIndex()
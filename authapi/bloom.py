@@ -0,0 +1,59 @@
+import math
+from hashlib import blake2b
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings or bytes.
+
+    Answers "definitely not present" or "possibly present". The bit array is a
+    plain bytearray so the filter can be serialized with to_bytes() and
+    restored with from_bytes().
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.01, num_bits=None, num_hashes=None, bits=None):
+        capacity = max(int(capacity), 1)
+        if num_bits is None:
+            num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_bits = max(int(num_bits), 8)
+        if num_hashes is None:
+            num_hashes = round(self.num_bits / capacity * math.log(2))
+        self.num_hashes = max(int(num_hashes), 1)
+        self.capacity = capacity
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        if isinstance(item, str):
+            item = item.encode()
+        digest = blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        bits = self.bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+    def to_bytes(self):
+        header = self.num_bits.to_bytes(8, 'little') + self.num_hashes.to_bytes(4, 'little')
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        num_bits = int.from_bytes(data[:8], 'little')
+        num_hashes = int.from_bytes(data[8:12], 'little')
+        return cls(num_bits=num_bits, num_hashes=num_hashes, bits=bytearray(data[12:]))
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the filter stays disabled
+    fcntl = None
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from core import db_router
+
+from .bloom import BloomFilter
+from .models import User, replica_pin_keys
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AEBF'
+FORMAT_VERSION = 1
+# magic, format version, num_bits, num_hashes, capacity, count
+HEADER = struct.Struct('<4sIQIQQ')
+HEADER_SIZE = 64
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class RebuildInProgress(Exception):
+    pass
+
+
+class EmailFilter:
+    """
+    Bloom filter of registered emails, used to answer lookups for unknown
+    emails without a query.
+
+    The filter lives in the file at EMAIL_FILTER_PATH and every worker maps it
+    with MAP_SHARED, so an email added by one worker is visible to all of them
+    immediately and a restart reuses the file. Adds take an flock on a
+    sidecar lock file. rebuild() streams all emails into a new file and swaps
+    it in atomically; adds made while it runs are journaled and replayed
+    before the swap, and a reader re-checks the file before trusting a miss,
+    so a registered email is never reported missing.
+
+    Until the file exists every email is reported as possibly present.
+    """
+
+    def __init__(self):
+        self._map_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._lock_file = None
+        self._map = None
+        self._bloom = None
+        self._file_id = None
+        self._overfull_file = None
+        # Recent lookup durations; a skipped lookup sleeps for one of them so
+        # it takes as long as a real miss.
+        self._latencies = deque(maxlen=256)
+        self.skipped = 0
+
+    @property
+    def path(self):
+        return getattr(settings, 'EMAIL_FILTER_PATH', '')
+
+    @property
+    def enabled(self):
+        return bool(self.path) and fcntl is not None
+
+    def might_exist(self, email):
+        """False only if no user has ever been registered with `email`."""
+        if not self.enabled:
+            return True
+        key = normalize_email(email)
+        bloom = self._bloom
+        if bloom is not None and key in bloom:
+            return True
+        # A rebuild may have replaced the file since it was mapped.
+        bloom = self._reload()
+        return bloom is None or key in bloom
+
+    def get_user(self, email):
+        """
+        The user with this email, ignoring case, without the query for emails
+        the filter has never seen.
+        """
+        if not self.might_exist(email):
+            self.skipped += 1
+            time.sleep(self._padding())
+            raise User.DoesNotExist("User matching query does not exist.")
+        # From the primary if the user was just registered or changed
+        db_router.read_your_writes(*replica_pin_keys(email=email))
+        started = time.perf_counter()
+        try:
+            return User.objects.get(email__lower=normalize_email(email))
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    async def aget_user(self, email):
+        if not self.might_exist(email):
+            self.skipped += 1
+            await asyncio.sleep(self._padding())
+            raise User.DoesNotExist("User matching query does not exist.")
+        await db_router.aread_your_writes(*replica_pin_keys(email=email))
+        started = time.perf_counter()
+        try:
+            return await User.objects.aget(email__lower=normalize_email(email))
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    def add(self, email):
+        self.add_many([email])
+
+    def add_many(self, emails):
+        """Add emails under a single lock, e.g. for a batch of imported users."""
+        if not self.enabled:
+            return
+        path, journal = self.path, self.path + '.journal'
+        if self._bloom is None and not os.path.exists(path) and not os.path.exists(journal):
+            return
+        keys = [normalize_email(email) for email in emails]
+        count = capacity = 0
+        with self._locked():
+            bloom = self._reload()
+            if bloom is not None:
+                # Emails are added twice (on save and on commit): count new ones only
+                added = [key for key in keys if key not in bloom]
+                for key in added:
+                    bloom.add(key)
+                count, capacity = self._header_add(len(added))
+            if os.path.exists(journal):
+                with open(journal, 'a', encoding='utf-8') as f:
+                    f.writelines(key + '\n' for key in keys)
+        if count > capacity:
+            self._overfull(count, capacity)
+
+    def rebuild(self, chunk_size=2000):
+        """Rebuild the file from a streaming pass over User; returns the number of emails."""
+        path = self.path
+        journal, tmp = path + '.journal', path + '.tmp'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.build', 'a') as build_lock:
+            try:
+                fcntl.flock(build_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RebuildInProgress(path)
+            with self._locked():
+                open(journal, 'a').close()
+            try:
+                capacity = max(settings.EMAIL_FILTER_CAPACITY, 2 * User.objects.count())
+                bloom = BloomFilter(capacity, settings.EMAIL_FILTER_ERROR_RATE)
+                emails = User.objects.order_by().values_list('email', flat=True)
+                for email in emails.iterator(chunk_size=chunk_size):
+                    bloom.add(normalize_email(email))
+                with self._locked():
+                    with open(journal, encoding='utf-8') as f:
+                        for line in f:
+                            if line.strip():
+                                bloom.add(line.strip())
+                    self._write(tmp, bloom, capacity)
+                    os.replace(tmp, path)
+                    os.unlink(journal)
+            except BaseException:
+                with self._locked():
+                    for leftover in (journal, tmp):
+                        if os.path.exists(leftover):
+                            os.unlink(leftover)
+                raise
+        self._reload()
+        return bloom.count
+
+    def rebuild_in_background(self):
+        def build():
+            try:
+                close_old_connections()
+                count = self.rebuild()
+                logger.info("Built email filter with %d emails", count)
+            except RebuildInProgress:
+                pass
+            except Exception:
+                logger.exception("Email filter build failed")
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=build, name='email-filter-build', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        bloom = self._bloom
+        if bloom is None:
+            return {'loaded': False, 'skipped': self.skipped}
+        _, _, num_bits, num_hashes, capacity, count = HEADER.unpack_from(self._map, 0)
+        return {
+            'loaded': True,
+            'num_bits': num_bits,
+            'num_hashes': num_hashes,
+            'capacity': capacity,
+            'count': count,
+            'skipped': self.skipped,
+        }
+
+    def _padding(self):
+        return random.choice(self._latencies) if self._latencies else 0.0
+
+    def _reload(self):
+        """Map the file at path if it is not the one currently mapped; returns the live filter."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._bloom = self._file_id = None
+            return None
+        if (st.st_dev, st.st_ino) == self._file_id:
+            return self._bloom
+        with self._map_lock:
+            if (st.st_dev, st.st_ino) != self._file_id:
+                self._map_file()
+        return self._bloom
+
+    def _map_file(self):
+        mapped = bloom = None
+        with open(self.path, 'r+b') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size >= HEADER_SIZE:
+                mapped = mmap.mmap(f.fileno(), 0)
+        if mapped is not None:
+            magic, version, num_bits, num_hashes, _, _ = HEADER.unpack_from(mapped, 0)
+            if magic == MAGIC and version == FORMAT_VERSION and len(mapped) == HEADER_SIZE + (num_bits + 7) // 8:
+                bloom = BloomFilter(num_bits=num_bits, num_hashes=num_hashes, bits=memoryview(mapped)[HEADER_SIZE:])
+        if bloom is None:
+            logger.warning("Ignoring email filter %s with an unknown format", self.path)
+        # Publish the filter before its file id: readers that see the new id
+        # must see the new filter. Old mappings are left to the garbage
+        # collector, other threads may still be reading them.
+        self._map, self._bloom = mapped, bloom
+        self._file_id = (st.st_dev, st.st_ino)
+
+    def _header_add(self, added):
+        """Count `added` emails in the header; returns (count, capacity)."""
+        header = list(HEADER.unpack_from(self._map, 0))
+        header[5] += added
+        HEADER.pack_into(self._map, 0, *header)
+        return header[5], header[4]
+
+    def _overfull(self, count, capacity):
+        # Past its capacity the false positive rate climbs quickly. Once per
+        # mapped file: the rebuild sizes the new one for twice the users.
+        if self._overfull_file == self._file_id:
+            return
+        self._overfull_file = self._file_id
+        logger.warning(
+            "Email filter %s holds %d emails, over its capacity of %d; rebuilding it", self.path, count, capacity,
+        )
+        self.rebuild_in_background()
+
+    def _write(self, path, bloom, capacity):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, bloom.num_bits, bloom.num_hashes, capacity, bloom.count))
+            f.write(bytes(HEADER_SIZE - HEADER.size))
+            f.write(bloom.bits)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @contextmanager
+    def _locked(self):
+        with self._file_lock:
+            if self._lock_file is None:
+                self._lock_file = open(self.path + '.lock', 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+email_filter = EmailFilter()
+
+
+def start_email_filter():
+    """Build the filter in the background if EMAIL_FILTER_PATH is set but the file is missing."""
+    if not email_filter.enabled or os.path.exists(email_filter.path):
+        return None
+    return email_filter.rebuild_in_background()
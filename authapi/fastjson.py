@@ -0,0 +1,28 @@
+"""
+Helpers for authapi.renderers and authapi.parsers, which use orjson when it
+is installed and must behave exactly like DRF's stock JSON classes.
+"""
+import re
+
+try:
+    import orjson
+except ImportError:  # Without orjson, both use the stdlib json module
+    orjson = None
+
+# Outside strings, only a float has a "." or a digit followed by "e"
+FLOAT = re.compile(rb'\.|\d[eE]')
+# orjson reads integers outside [-2**63, 2**64) as floats; the stdlib keeps
+# them exact. Every integer with fewer digits than these is in range.
+LONG_INTEGER = re.compile(rb'-\d{19}|\d{20}')
+
+
+def outside_strings(document):
+    """
+    The parts of a JSON document outside its strings, where numbers are, so
+    that the patterns above need not scan (long) string values. Where a
+    string contains an escaped quote the whole document is returned, which
+    can only turn up more matches than there are.
+    """
+    if b'\\"' in document:
+        return document
+    return b''.join(document.split(b'"')[::2])
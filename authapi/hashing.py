@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class HashingUnavailable(APIException):
+    """
+    Raised when the hashing queue is full. DRF turns `wait` into a
+    Retry-After header on the 503 response.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password operations in progress, please retry shortly.'
+    default_code = 'hashing_unavailable'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+def _verify(raw_password, encoded):
+    """
+    check_password() without touching the database: returns whether the
+    password matches and, if the hash must be upgraded, the new hash.
+    """
+    upgraded = []
+    valid = check_password(raw_password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+class HashingService:
+    """
+    Runs password hashing on a dedicated pool of PASSWORD_HASHING_THREADS
+    threads (PBKDF2 releases the GIL, so threads hash in parallel).
+
+    At most PASSWORD_HASHING_QUEUE_DEPTH further jobs may wait for a thread;
+    beyond that, callers get HashingUnavailable (503) immediately instead of
+    tying up a request worker, so a burst of logins cannot starve the cheap
+    endpoints. Queue wait and hash time are tracked per process in stats().
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    @property
+    def workers(self):
+        return settings.PASSWORD_HASHING_THREADS
+
+    @property
+    def queue_depth(self):
+        return settings.PASSWORD_HASHING_QUEUE_DEPTH
+
+    def submit(self, func, *args):
+        """Schedule func(*args) on the pool; raises HashingUnavailable when the queue is full."""
+        self._ensure_pool()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning("Password hashing queue full, rejecting request")
+            raise HashingUnavailable(self.retry_after())
+        try:
+            return self._executor.submit(self._run, time.monotonic(), func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def run(self, func, *args):
+        return self.submit(func, *args).result()
+
+    async def arun(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def check_password(self, user, raw_password):
+        """
+        user.check_password() with the hashing done on the pool. When the
+        hash must be upgraded, the new hash is computed there too but saved
+        here, on the caller's thread and database connection.
+        """
+        valid, upgraded = self.run(_verify, raw_password, user.password)
+        if upgraded:
+            user.password = upgraded
+            user.save(update_fields=['password'])
+        return valid
+
+    async def acheck_password(self, user, raw_password):
+        valid, upgraded = await self.arun(_verify, raw_password, user.password)
+        if upgraded:
+            user.password = upgraded
+            await user.asave(update_fields=['password'])
+        return valid
+
+    def set_password(self, user, raw_password):
+        self.run(user.set_password, raw_password)
+
+    def retry_after(self):
+        """Seconds until a full queue has likely drained, from the mean hash time."""
+        with self._lock:
+            mean = self.hash_time_total / self.completed if self.completed else 1.0
+        return max(1, math.ceil(mean * (self.workers + self.queue_depth) / self.workers))
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue_depth,
+                'completed': completed,
+                'rejected': self.rejected,
+                'queue_wait_avg': self.queue_wait_total / completed if completed else 0.0,
+                'queue_wait_max': self.queue_wait_max,
+                'hash_time_avg': self.hash_time_total / completed if completed else 0.0,
+                'hash_time_max': self.hash_time_max,
+            }
+
+    def _run(self, queued_at, func, *args):
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            finished = time.monotonic()
+            self._slots.release()
+            with self._lock:
+                self.completed += 1
+                self.queue_wait_total += started - queued_at
+                self.queue_wait_max = max(self.queue_wait_max, started - queued_at)
+                self.hash_time_total += finished - started
+                self.hash_time_max = max(self.hash_time_max, finished - started)
+
+    def _ensure_pool(self):
+        if self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='password-hash',
+                )
+
+
+hashing_service = HashingService()
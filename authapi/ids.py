@@ -0,0 +1,129 @@
+import threading
+from collections import deque
+from hashlib import blake2b
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import IdSequence
+
+# Crockford base32: no I, L, O or U, so IDs read back unambiguously.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# The first character is never a hex digit, so allocated IDs cannot collide
+# with the legacy uuid4-hex account IDs.
+PREFIXES = 'GHJKMNPQ'
+VALUE_BITS = 48
+HALF_BITS = VALUE_BITS // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+# Each leased block covers 2**BLOCK_BITS consecutive values.
+BLOCK_BITS = 16
+MAX_BLOCKS = 1 << (VALUE_BITS - BLOCK_BITS)
+SEQUENCE = 'authapi_account_id_block_seq'
+
+
+class AccountIdAllocator:
+    """
+    Allocates unique 10-character account IDs without a lookup per insert.
+
+    Each process leases blocks of 65536 consecutive values, one query per
+    block (a native sequence on Postgres, a counter row elsewhere), and hands
+    them out from memory. Values are passed through a keyed Feistel
+    permutation before encoding, so IDs do not reveal sign-up order or volume.
+    The permutation is a bijection, so distinct values give distinct IDs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Leased, unused [start, end) value ranges
+        self._ranges = deque()
+        self._round_keys = None
+
+    def allocate(self, count=None):
+        """Return one ID, or a list of `count` IDs (e.g. for bulk_create)."""
+        wanted = 1 if count is None else count
+        with self._lock:
+            values = self._take(self._ranges, wanted)
+            if len(values) < wanted:
+                leased = deque(
+                    (block << BLOCK_BITS, (block + 1) << BLOCK_BITS)
+                    for block in self._lease(-(-(wanted - len(values)) >> BLOCK_BITS))
+                )
+                values += self._take(leased, wanted - len(values))
+                self._keep(leased)
+        ids = [self.encode(self.permute(value)) for value in values]
+        return ids[0] if count is None else ids
+
+    @staticmethod
+    def _take(ranges, wanted):
+        values = []
+        while len(values) < wanted and ranges:
+            start, end = ranges[0]
+            take = min(wanted - len(values), end - start)
+            values.extend(range(start, start + take))
+            if start + take == end:
+                ranges.popleft()
+            else:
+                ranges[0] = (start + take, end)
+        return values
+
+    def _keep(self, ranges):
+        """Pool the unused part of a lease once the lease can no longer be undone."""
+        if not ranges:
+            return
+        if connection.vendor == 'postgresql' or not connection.in_atomic_block:
+            self._ranges.extend(ranges)
+        else:
+            # The counter row rolls back with the surrounding transaction, and
+            # the same blocks are then leased again elsewhere.
+            transaction.on_commit(lambda: self._pool(ranges))
+
+    def _pool(self, ranges):
+        with self._lock:
+            self._ranges.extend(ranges)
+
+    def permute(self, value):
+        keys = self._keys()
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for key in keys:
+            digest = blake2b(right.to_bytes(3, 'big'), digest_size=3, key=key).digest()
+            left, right = right, left ^ int.from_bytes(digest, 'big')
+        return (left << HALF_BITS) | right
+
+    @staticmethod
+    def encode(value):
+        chars = []
+        for _ in range(9):
+            chars.append(ALPHABET[value & 31])
+            value >>= 5
+        return PREFIXES[value] + ''.join(reversed(chars))
+
+    def _keys(self):
+        if self._round_keys is None:
+            secret = settings.ACCOUNT_ID_KEY.encode()
+            self._round_keys = [
+                blake2b(secret, digest_size=16, person=b'account-id-%d' % i).digest()
+                for i in range(ROUNDS)
+            ]
+        return self._round_keys
+
+    def _lease(self, count):
+        """Reserve `count` block numbers; returns them in order."""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT nextval('{SEQUENCE}') FROM generate_series(1, %s)", [count])
+                blocks = sorted(row[0] for row in cursor.fetchall())
+        else:
+            # The counter row moves with the surrounding transaction: see _keep()
+            with transaction.atomic():
+                IdSequence.objects.get_or_create(name=SEQUENCE)
+                IdSequence.objects.filter(name=SEQUENCE).update(next_block=F('next_block') + count)
+                end = IdSequence.objects.get(name=SEQUENCE).next_block
+            blocks = list(range(end - count, end))
+        if blocks[-1] >= MAX_BLOCKS:
+            raise RuntimeError("Account ID space exhausted")
+        return blocks
+
+
+account_ids = AccountIdAllocator()
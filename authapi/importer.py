@@ -0,0 +1,265 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .email_filter import email_filter
+from .ids import account_ids
+from .models import User
+
+# Input columns; password_hash is a Django-format hash stored as is,
+# password is plaintext hashed during the import.
+FIELDS = ('email', 'first_name', 'last_name', 'password', 'password_hash', 'is_active')
+SECRET_FIELDS = ('password', 'password_hash')
+
+
+class ImportReport:
+    """Totals for one import run."""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Imported {self.imported} users, rejected {self.rejected} of {self.rows} rows "
+            f"in {self.batches} batches, {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)"
+        )
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or JSONL stream without reading it all."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # DictReader fills the fields missing from a short row with None
+            if None in row.values():
+                yield reader.line_num, ValueError('Row has fewer fields than the header')
+            else:
+                yield reader.line_num, row
+        return
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_num, ValueError(f"Invalid JSON: {exc}")
+            continue
+        yield line_num, row if isinstance(row, dict) else ValueError("Expected a JSON object")
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def _init_hash_worker():
+    # Spawned (not forked) workers start without Django configured.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+class UserImporter:
+    """
+    Imports users from rows of dicts with bulk_create, batch_size rows per
+    transaction.
+
+    Every batch costs one query for existing emails, one account_id
+    allocation and one bulk INSERT. Plaintext passwords are hashed on a
+    process pool while the previous batch is being inserted. Rejected rows
+    are written to `rejects` as JSON lines (without passwords) and never
+    abort the run.
+    """
+
+    def __init__(self, batch_size=1000, workers=None, active=True, rejects=None, progress=None):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.active = active
+        self.rejects = rejects
+        self.progress = progress
+        self.report = ImportReport()
+        self._pool = None
+
+    def run(self, rows):
+        started = time.monotonic()
+        pending = None
+        try:
+            for batch in self._batches(rows):
+                prepared = self._prepare(batch)
+                if pending is not None:
+                    self._insert(pending)
+                pending = prepared
+                self.report.seconds = time.monotonic() - started
+            if pending is not None:
+                self._insert(pending)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        self.report.seconds = time.monotonic() - started
+        return self.report
+
+    def _batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _prepare(self, batch):
+        """Validate a batch and start hashing its plaintext passwords."""
+        users, plaintext = [], []
+        seen = set()
+        for line_num, row in batch:
+            self.report.rows += 1
+            try:
+                user, password = self._build_user(row)
+            except ValueError as exc:
+                self._reject(line_num, row, str(exc))
+                continue
+            except Exception as exc:
+                # Whatever the row holds, it must not abort the run
+                self._reject(line_num, row, f"{exc.__class__.__name__}: {exc}")
+                continue
+            if user.email.lower() in seen:
+                self._reject(line_num, row, 'Duplicate email in input')
+                continue
+            seen.add(user.email.lower())
+            users.append((line_num, row, user))
+            if password is not None:
+                plaintext.append((user, password))
+        futures = []
+        if plaintext:
+            pool = self._get_pool()
+            passwords = [password for _, password in plaintext]
+            step = -(-len(passwords) // self.workers)
+            futures = [
+                pool.submit(_hash_passwords, passwords[start:start + step])
+                for start in range(0, len(passwords), step)
+            ]
+        return users, plaintext, futures
+
+    def _build_user(self, row):
+        if isinstance(row, Exception):
+            raise ValueError(str(row))
+        # DictReader puts the fields past the header under the None key
+        if None in row:
+            raise ValueError('Row has more fields than the header')
+        unknown = set(row) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        email = User.objects.normalize_email(str(row.get('email') or '').strip())
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValueError('Invalid email')
+        names = {field: str(row.get(field) or '') for field in ('first_name', 'last_name')}
+        for field, value in names.items():
+            if len(value) > User._meta.get_field(field).max_length:
+                raise ValueError(f"{field} is too long")
+        user = User(email=email, is_active=self._is_active(row.get('is_active')), **names)
+        password, password_hash = row.get('password'), row.get('password_hash')
+        for field, value in (('password', password), ('password_hash', password_hash)):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{field} must be a string")
+        if password and password_hash:
+            raise ValueError('Give either password or password_hash, not both')
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                raise ValueError('password_hash is not in a known hasher format')
+            user.password = password_hash
+        elif not password:
+            user.set_unusable_password()
+        return user, password or None
+
+    def _is_active(self, value):
+        if value is None or value == '':
+            return self.active
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in ('1', 'true', 'yes'):
+            return True
+        if str(value).strip().lower() in ('0', 'false', 'no'):
+            return False
+        raise ValueError('is_active must be true or false')
+
+    def _insert(self, prepared):
+        users, plaintext, futures = prepared
+        hashed = [password for future in futures for password in future.result()]
+        for (user, _), password in zip(plaintext, hashed):
+            user.password = password
+        existing = {
+            email.lower() for email in User.objects.filter(
+                email__lower__in=[user.email.lower() for _, _, user in users],
+            ).values_list('email', flat=True)
+        }
+        rows = []
+        for line_num, row, user in users:
+            if user.email.lower() in existing:
+                self._reject(line_num, row, 'Email already registered')
+            else:
+                rows.append((line_num, row, user))
+        for (_, _, user), account_id in zip(rows, account_ids.allocate(len(rows))):
+            user.account_id = account_id
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, _, user in rows])
+            inserted = [user for _, _, user in rows]
+        except DatabaseError:
+            # Lost a race with a concurrent sign-up, or a row the database
+            # refuses: insert row by row.
+            inserted = self._insert_rows(rows)
+        email_filter.add_many([user.email for user in inserted])
+        self.report.imported += len(inserted)
+        self.report.batches += 1
+        if self.progress:
+            self.progress(self.report)
+
+    def _insert_rows(self, rows):
+        inserted = []
+        for line_num, row, user in rows:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([user])
+            except IntegrityError as exc:
+                self._reject(line_num, row, f"Integrity error: {exc}")
+            except DatabaseError as exc:
+                self._reject(line_num, row, f"Database error: {exc}")
+            else:
+                inserted.append(user)
+        return inserted
+
+    def _reject(self, line_num, row, error):
+        self.report.rejected += 1
+        if self.rejects is None:
+            return
+        if isinstance(row, dict):
+            row = {key: value for key, value in row.items() if key not in SECRET_FIELDS}
+        else:
+            row = None
+        self.rejects.write(json.dumps({'line': line_num, 'error': error, 'row': row}) + '\n')
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_hash_worker)
+        return self._pool
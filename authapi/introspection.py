@@ -0,0 +1,39 @@
+import jwt
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenBackendError
+
+from .blacklist import blacklist_index
+from .jwt_keys import token_backend
+from .token_utils import token_digest
+
+
+def introspect_tokens(tokens, fresh=False):
+    """
+    Check a batch of raw JWTs; returns one result per token, in order.
+
+    Signatures and expiry are checked locally and revocation with a single
+    blacklist lookup for the whole batch: the in-memory index (up to
+    TOKEN_BLACKLIST_MAX_STALENESS seconds behind), or one IN query with
+    `fresh`. An active token's result carries its claims; an inactive one's
+    the reason: "invalid", "expired" or "revoked".
+    """
+    results = []
+    digests = {}
+    for index, token in enumerate(tokens):
+        try:
+            claims = token_backend.decode(token)
+        except TokenBackendError as exc:
+            expired = isinstance(exc.__cause__, jwt.ExpiredSignatureError)
+            results.append({'active': False, 'reason': 'expired' if expired else 'invalid'})
+            continue
+        results.append({'active': True, 'claims': claims})
+        digests.setdefault(token_digest(token), []).append(index)
+
+    for digest in blacklist_index.contains_many(digests, fresh=fresh):
+        for index in digests[digest]:
+            results[index] = {'active': False, 'reason': 'revoked'}
+    return results
+
+
+def max_batch_size():
+    return getattr(settings, 'INTROSPECTION_MAX_TOKENS', 100)
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from jwt import InvalidAlgorithmError, InvalidTokenError
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+except ImportError:  # Without cryptography only HS256 is available
+    serialization = None
+
+logger = logging.getLogger(__name__)
+
+KEY_ALGORITHMS = ('RS256', 'EdDSA')
+
+
+class SigningKey:
+    """A private key from the key ring and the JWT algorithm it signs with."""
+
+    def __init__(self, kid, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = 'RS256'
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            self.algorithm = 'EdDSA'
+        else:
+            raise ValueError(f"Unsupported key type {type(private_key).__name__}; use RSA or Ed25519")
+
+    def jwk(self):
+        jwk = jwt.get_algorithm_by_name(self.algorithm).to_jwk(self.public_key, as_dict=True)
+        jwk.update(kid=self.kid, use='sig', alg=self.algorithm)
+        return jwk
+
+    @classmethod
+    def generate(cls, algorithm, rsa_bits=2048):
+        if serialization is None:
+            raise ImproperlyConfigured('Generating signing keys needs the cryptography package')
+        if algorithm == 'RS256':
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_bits)
+        elif algorithm == 'EdDSA':
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            raise ValueError(f"Unsupported algorithm {algorithm}; use one of {', '.join(KEY_ALGORITHMS)}")
+        # Sorts by creation time
+        kid = datetime.now(dt_timezone.utc).strftime('%Y%m%d%H%M%S%f')
+        return cls(kid, private_key)
+
+    def private_pem(self):
+        return self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+
+
+class KeySet:
+    """One loaded state of the key ring; replaced as a whole on reload."""
+
+    def __init__(self, keys, active, activate_at=None):
+        self.keys = keys
+        self.active = active
+        # Unix time at which a newer key takes over signing, if one is waiting
+        self.activate_at = activate_at
+        self.jwks = json.dumps(
+            {'keys': [key.jwk() for key in keys.values()]}, separators=(',', ':'), sort_keys=True,
+        ).encode()
+        self.etag = '"%s"' % hashlib.sha256(self.jwks).hexdigest()[:32]
+
+
+class KeyRing:
+    """
+    JWT signing keys: one PEM private key (RSA or Ed25519) per file in
+    JWT_KEYS_DIR, named <kid>.pem.
+
+    Every key in the directory is published in the JWKS and verifies the
+    tokens it signed, so a rotated-out key can be deleted once the tokens it
+    signed have expired. The key named by JWT_ACTIVE_KID signs new tokens;
+    otherwise the newest kid whose file is at least JWKS_MAX_AGE seconds
+    old, so that verifiers holding a cached JWKS have fetched a key before
+    they see tokens signed with it (the oldest key while none is that old).
+    The directory is re-read within RELOAD_INTERVAL seconds of a change or
+    of a waiting key coming of age, so workers pick up a rotation without a
+    restart.
+    """
+    RELOAD_INTERVAL = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_set = KeySet({}, None)
+        self._loaded_from = None
+        self._checked_at = None
+
+    @property
+    def path(self):
+        return getattr(settings, 'JWT_KEYS_DIR', '')
+
+    @property
+    def active_kid(self):
+        return getattr(settings, 'JWT_ACTIVE_KID', '')
+
+    def current(self):
+        """The KeySet in use, reloaded first if the directory changed."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.RELOAD_INTERVAL:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.RELOAD_INTERVAL:
+                    self._checked_at = now
+                    source = self._source()
+                    activate_at = self._key_set.activate_at
+                    if source != self._loaded_from or (activate_at is not None and time.time() >= activate_at):
+                        self._key_set = self._load()
+                        self._loaded_from = source
+        return self._key_set
+
+    def reload(self):
+        """Re-read the directory now."""
+        self._checked_at = self._loaded_from = None
+        return self.current()
+
+    def add(self, key):
+        """Write `key` to the directory, readable by the owner only."""
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        final = os.path.join(self.path, f'{key.kid}.pem')
+        if os.path.exists(final):
+            raise FileExistsError(f"A key with kid {key.kid} already exists")
+        tmp = f'{final}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key.private_pem())
+        os.replace(tmp, final)
+        self.reload()
+
+    def _source(self):
+        # Adding, removing or replacing a key file changes the directory mtime
+        path, active_kid = self.path, self.active_kid
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except FileNotFoundError:
+            mtime = None
+        return path, mtime, active_kid
+
+    def _load(self):
+        path = self.path
+        names = sorted(name for name in os.listdir(path) if name.endswith('.pem')) if path and os.path.isdir(path) else []
+        if names and serialization is None:
+            raise ImproperlyConfigured(f"Signing keys in {path} need the cryptography package")
+        keys, mtimes = {}, {}
+        for name in names:
+            kid = name[:-len('.pem')]
+            try:
+                with open(os.path.join(path, name), 'rb') as f:
+                    keys[kid] = SigningKey(kid, serialization.load_pem_private_key(f.read(), password=None))
+                    mtimes[kid] = os.fstat(f.fileno()).st_mtime
+            except (OSError, ValueError, TypeError):
+                logger.exception("Skipping unreadable signing key %s", name)
+        if not keys:
+            return KeySet({}, None)
+        active_kid = self.active_kid
+        if active_kid and active_kid not in keys:
+            logger.error("JWT_ACTIVE_KID %s is not in %s; signing with the newest published key", active_kid, path)
+            active_kid = None
+        if active_kid:
+            return KeySet(keys, keys[active_kid])
+        max_age = getattr(settings, 'JWKS_MAX_AGE', 3600)
+        now = time.time()
+        published = [kid for kid in keys if now - mtimes[kid] >= max_age]
+        active_kid = max(published) if published else min(keys)
+        waiting = [mtimes[kid] + max_age for kid in keys if kid > active_kid]
+        return KeySet(keys, keys[active_kid], min(waiting, default=None))
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    simplejwt token backend that signs with the active key of the key ring,
+    naming it in the `kid` header, and verifies a token with the key its
+    kid names. Without keys it signs and verifies HS256 with SIGNING_KEY as
+    before; once keys exist, tokens without a kid (HS256 ones) are refused.
+    """
+
+    def __init__(self, keyring):
+        super().__init__(
+            api_settings.ALGORITHM,
+            api_settings.SIGNING_KEY,
+            api_settings.VERIFYING_KEY,
+            api_settings.AUDIENCE,
+            api_settings.ISSUER,
+            None,
+            api_settings.LEEWAY,
+            api_settings.JSON_ENCODER,
+        )
+        self.keyring = keyring
+
+    def encode(self, payload):
+        key = self.keyring.current().active
+        if key is None:
+            return super().encode(payload)
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        return jwt.encode(
+            jwt_payload,
+            key.private_key,
+            algorithm=key.algorithm,
+            headers={'kid': key.kid},
+            json_encoder=self.json_encoder,
+        )
+
+    def decode(self, token, verify=True):
+        keys = self.keyring.current().keys
+        if not keys or not verify:
+            return super().decode(token, verify)
+        try:
+            key = keys.get(jwt.get_unverified_header(token).get('kid'))
+        except InvalidTokenError as ex:
+            raise TokenBackendError(_("Token is invalid or expired")) from ex
+        if key is None:
+            raise TokenBackendError(_("Token is invalid or expired"))
+        try:
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={'verify_aud': self.audience is not None},
+            )
+        except InvalidAlgorithmError as ex:
+            raise TokenBackendError(_("Invalid algorithm specified")) from ex
+        except InvalidTokenError as ex:
+            raise TokenBackendError(_("Token is invalid or expired")) from ex
+
+
+keyring = KeyRing()
+token_backend = KeyRingTokenBackend(keyring)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import build
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema (JSON and YAML, plain and gzipped) into SCHEMA_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write to instead of SCHEMA_DIR')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.SCHEMA_DIR
+        if not path:
+            raise CommandError('SCHEMA_DIR is not set')
+        version = build(path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote the schema for code version {version} to {path}"))
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from authapi.blacklist import BlacklistIndex
+from authapi.models import BlacklistedToken, OutboundEmail, User, expiry_day_for
+from authapi.user_cache import UserCache
+
+EMAIL = 'ada@example.com'
+DIGESTS = [bytes([n]) * 32 for n in range(10)]
+
+
+def hot_queries(now):
+    """(name, where it runs, queryset) for every query on a request path or a periodic job."""
+    today = expiry_day_for(now)
+    return [
+        ('email lookup', 'email_filter.get_user: login, OTP, password reset', User.objects.filter(
+            email__lower=EMAIL,
+        )),
+        ('authenticated user', 'user_cache.get: every authenticated request on a miss', User.objects.only(
+            *UserCache.FIELDS,
+        ).filter(pk=1)),
+        ('last activity', 'activity_recorder.last_activity_for: token refresh on a miss', User.objects.filter(
+            pk=1,
+        ).values_list('pk', 'last_activity')),
+        ('blacklist check', 'blacklist_index.contains_many(fresh=True): introspection', BlacklistedToken.objects.filter(
+            token_digest__in=DIGESTS, expires_at__gt=now,
+        ).values_list('token_digest', 'expires_at')),
+        ('blacklist sync', 'blacklist_index.sync: every worker', BlacklistedToken.objects.filter(
+            expires_at__gt=now, id__gt=0,
+        ).order_by('id').values_list(
+            'id', 'token_digest', 'blacklisted_at', 'expires_at',
+        )[:BlacklistIndex.SYNC_BATCH_SIZE]),
+        ('blacklist purge chunk', 'purge_expired_tokens', BlacklistedToken.objects.filter(
+            expiry_day__lte=today, expires_at__lte=now,
+        ).filter(
+            Q(expiry_day__gt=today - timedelta(days=1)) | Q(expiry_day=today - timedelta(days=1), id__gt=0),
+        ).order_by('expiry_day', 'id').values_list('expiry_day', 'id')[:1000]),
+        ('blacklist purge days', 'purge_expired_tokens --bucketed', BlacklistedToken.objects.filter(
+            expiry_day__lt=today,
+        ).order_by('expiry_day').values_list('expiry_day', flat=True).distinct()),
+        ('blacklist purge day chunk', 'purge_expired_tokens --bucketed', BlacklistedToken.objects.filter(
+            expiry_day=today - timedelta(days=1), id__gt=0,
+        ).order_by('id').values_list('id')[:1000]),
+        ('outbox claim', 'outbox.claim_batch: every poll', OutboundEmail.objects.select_for_update(
+            skip_locked=True,
+        ).filter(
+            sent_at__isnull=True, failed_at__isnull=True, send_after__lte=now,
+        ).order_by('send_after', 'id')[:50]),
+        ('user export chunk', 'exporter.iter_rows', User.objects.order_by('id').filter(
+            id__gt=0,
+        ).values_list('id', 'email')[:2000]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Print the database's plan (EXPLAIN) for each hot query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to explain against')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='PostgreSQL only: EXPLAIN ANALYZE, running each query in a transaction that is rolled back',
+        )
+        parser.add_argument('--query', action='append', help='Only the queries with this name (repeatable)')
+
+    def handle(self, *args, **options):
+        database = options['database']
+        explain_options = {}
+        if options['analyze']:
+            if connections[database].vendor != 'postgresql':
+                raise CommandError('--analyze needs PostgreSQL')
+            explain_options = {'analyze': True, 'buffers': True}
+        queries = hot_queries(timezone.now())
+        if options['query']:
+            unknown = set(options['query']) - {name for name, _, _ in queries}
+            if unknown:
+                raise CommandError(f"Unknown queries: {', '.join(sorted(unknown))}")
+            queries = [query for query in queries if query[0] in options['query']]
+        # select_for_update needs a transaction; nothing is kept either way
+        with transaction.atomic(using=database):
+            for name, source, queryset in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({source})'))
+                self.stdout.write(queryset.using(database).explain(**explain_options))
+                self.stdout.write('')
+            transaction.set_rollback(True, using=database)
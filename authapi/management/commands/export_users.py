@@ -0,0 +1,57 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.exporter import iter_rows, output_columns, render, resume_point
+
+
+class Command(BaseCommand):
+    help = 'Stream users (or blacklisted tokens) to a JSONL or CSV file in id order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--blacklist', action='store_true',
+                            help='Export BlacklistedToken rows instead of users')
+        parser.add_argument('--after-id', type=int, default=None, help='Start after this id')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue an interrupted export to --output from its last complete row')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query')
+        parser.add_argument('--include-password-hashes', action='store_true',
+                            help='Add a password_hash column, for import_users on another deployment')
+
+    def handle(self, *args, **options):
+        dataset = 'blacklist' if options['blacklist'] else 'users'
+        fmt, path = options['format'], options['output']
+        after_id = options['after_id']
+        appending = options['resume'] and os.path.exists(path) and os.path.getsize(path) > 0
+        if options['resume']:
+            if path == '-':
+                raise CommandError('--resume needs an --output file')
+            try:
+                after_id = resume_point(path, fmt)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        include_hashes = options['include_password_hashes'] and dataset == 'users'
+
+        exported = 0
+        last_id = after_id
+
+        def counted(rows):
+            nonlocal exported, last_id
+            for row in rows:
+                exported += 1
+                last_id = row['id']
+                yield row
+
+        rows = counted(iter_rows(dataset, after_id, options['chunk_size'], include_hashes))
+        lines = render(rows, fmt, output_columns(dataset, include_hashes), header=not appending)
+        out = sys.stdout if path == '-' else open(path, 'a' if appending else 'w', encoding='utf-8', newline='')
+        try:
+            out.writelines(lines)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+            if path != '-':
+                self.stderr.write(f"Exported {exported} rows of {dataset}, last id {last_id}")
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.importer import UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import users from a CSV or JSONL file, streaming it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk INSERT')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes hashing plaintext passwords (default: CPU count)')
+        parser.add_argument('--rejects', default=None,
+                            help='Write rejected rows here as JSON lines (default: <path>.rejects.jsonl)')
+        parser.add_argument('--inactive', action='store_true',
+                            help='Import users without an is_active column as unverified')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path.endswith('.csv'):
+                fmt = 'csv'
+            elif path.endswith(('.jsonl', '.ndjson')):
+                fmt = 'jsonl'
+            else:
+                raise CommandError('Cannot tell the input format, pass --format')
+        rejects_path = options['rejects'] or ('import.rejects.jsonl' if path == '-' else f'{path}.rejects.jsonl')
+
+        def progress(report):
+            self.stdout.write(
+                f"{report.rows} rows, {report.imported} imported, {report.rejected} rejected "
+                f"({report.rows_per_second:.0f} rows/s)"
+            )
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            with open(rejects_path, 'w', encoding='utf-8') as rejects:
+                importer = UserImporter(
+                    batch_size=options['batch_size'],
+                    workers=options['workers'],
+                    active=not options['inactive'],
+                    rejects=rejects,
+                    progress=progress if options['verbosity'] > 1 else None,
+                )
+                report = importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(str(report)))
+        if report.rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected rows written to {rejects_path}"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from authapi.purge import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired BlacklistedToken rows in bounded chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows deleted per statement')
+        parser.add_argument('--max-chunks', type=int, default=None, help='Stop after this many chunks')
+        parser.add_argument('--bucketed', action='store_true', default=None,
+                            help='First empty days entirely in the past, a day at a time in the same chunks')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        report = purge_expired_tokens(
+            chunk_size=options['chunk_size'],
+            max_chunks=options['max_chunks'],
+            bucketed=options['bucketed'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.email_filter import RebuildInProgress, email_filter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Bloom filter of registered emails from the User table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        if not email_filter.enabled:
+            raise CommandError('The email filter is disabled (EMAIL_FILTER_PATH is empty)')
+        try:
+            count = email_filter.rebuild(chunk_size=options['chunk_size'])
+        except RebuildInProgress:
+            raise CommandError('Another rebuild of the email filter is already running')
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt email filter at {email_filter.path} with {count} emails"))
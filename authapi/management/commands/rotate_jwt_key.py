@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.jwt_keys import KEY_ALGORITHMS, SigningKey, keyring
+
+
+class Command(BaseCommand):
+    help = 'Create a new JWT signing key in JWT_KEYS_DIR; it is published at once and signs after JWKS_MAX_AGE seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=KEY_ALGORITHMS, default='RS256')
+        parser.add_argument('--rsa-bits', type=int, default=2048, help='RSA key size')
+        parser.add_argument('--list', action='store_true', help='List the keys instead')
+
+    def handle(self, *args, **options):
+        if not keyring.path:
+            raise CommandError('JWT_KEYS_DIR is not set')
+        if options['list']:
+            key_set = keyring.reload()
+            for kid, key in key_set.keys.items():
+                if key is key_set.active:
+                    state = ' (active)'
+                elif kid > key_set.active.kid and key_set.activate_at is not None:
+                    state = ' (published, not signing yet)'
+                else:
+                    state = ''
+                self.stdout.write(f"{kid} {key.algorithm}{state}")
+            return
+        key = SigningKey.generate(options['algorithm'], options['rsa_bits'])
+        try:
+            keyring.add(key)
+        except FileExistsError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {key.algorithm} key {key.kid} in {keyring.path}; it is in the JWKS now and signs new tokens "
+            f"once cached copies have expired, in {settings.JWKS_MAX_AGE} seconds"
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from authapi.outbox import PURGE_INTERVAL, drain_outbox, purge_sent_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails, reusing one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails sent per SMTP connection')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the outbox is empty')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.EMAIL_OUTBOX_POLL_INTERVAL
+        purged_at = None
+        while True:
+            sent = drain_outbox(batch_size=options['batch_size'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} emails"))
+            if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                purged_at = time.monotonic()
+                purged = purge_sent_emails()
+                if purged:
+                    self.stdout.write(f"Deleted {purged} emails past EMAIL_OUTBOX_RETENTION")
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(interval)
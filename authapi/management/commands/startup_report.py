@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter under -X importtime: start a worker the way the
+# WSGI server does and load the URLconf, as its first request would.
+WORKER_SCRIPT = """
+import json, os, sys, time
+began = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.apps import apps
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter() - began
+
+def rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # Peak rather than current where /proc is missing; bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+report = {
+    'seconds': ready,
+    'rss': rss(),
+    'modules': len(sys.modules),
+    'docs_loaded': 'drf_yasg.openapi' in sys.modules,
+    'admin_installed': apps.is_installed('django.contrib.admin'),
+}
+if os.environ.get('STARTUP_REPORT_DOCS'):
+    began = time.perf_counter()
+    from core.schema import schema_store
+    schema_store.get('json')
+    report['docs_seconds'] = time.perf_counter() - began
+    report['docs_rss'] = rss()
+print(json.dumps(report))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Start a worker in a fresh interpreter and report its startup time, import time by '
+        'package and module (as -X importtime measures it) and resident memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='How many packages and modules to list')
+        parser.add_argument(
+            '--docs', action='store_true',
+            help='Also load the API docs, as the first docs request would, and report what that costs',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        if options['docs']:
+            env['STARTUP_REPORT_DOCS'] = '1'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', WORKER_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Worker failed to start:\n{result.stderr[-4000:]}")
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(result.stderr)
+        report['import_seconds'] = sum(self_us for _, self_us, _ in imports) / 1e6
+        report['packages'] = by_package(imports)[:options['top']]
+        report['slowest'] = sorted(
+            ((name, self_us / 1e6) for name, self_us, _ in imports), key=lambda item: -item[1],
+        )[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"Worker ready in {report['seconds'] * 1000:.0f} ms "
+            f"({report['import_seconds'] * 1000:.0f} ms importing {report['modules']} modules), "
+            f"RSS {report['rss'] / 2**20:.1f} MiB"
+        )
+        self.stdout.write(
+            f"Docs stack loaded at startup: {'yes' if report['docs_loaded'] else 'no'}; "
+            f"admin app: {'yes' if report['admin_installed'] else 'no'}"
+        )
+        if 'docs_seconds' in report:
+            self.stdout.write(
+                f"First docs request: {report['docs_seconds'] * 1000:.0f} ms, "
+                f"RSS +{(report['docs_rss'] - report['rss']) / 2**20:.1f} MiB"
+            )
+        self.stdout.write('\nImport time by package (self, ms):')
+        for package, seconds in report['packages']:
+            share = seconds / report['import_seconds'] * 100 if report['import_seconds'] else 0
+            self.stdout.write(f"  {package:<32} {seconds * 1000:>8.1f}  {share:>5.1f}%")
+        self.stdout.write('\nSlowest modules (self, ms):')
+        for name, seconds in report['slowest']:
+            self.stdout.write(f"  {name:<48} {seconds * 1000:>8.1f}")
+
+
+def parse_importtime(stderr):
+    """[(module, self microseconds, cumulative microseconds)] from -X importtime output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def by_package(imports):
+    """[(top-level package, self seconds)], slowest first."""
+    totals = defaultdict(int)
+    for name, self_us, _ in imports:
+        totals[name.split('.')[0]] += self_us
+    return sorted(((package, us / 1e6) for package, us in totals.items()), key=lambda item: -item[1])
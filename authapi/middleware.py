@@ -1,12 +1,39 @@
-from django.utils import timezone
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from .activity import activity_recorder
+from .backends import ServiceClient
 
 class UpdateLastActivityMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         response = self.get_response(request)
-        if request.user.is_authenticated:
-            request.user.last_activity = timezone.now()
-            request.user.save()
+        # Without AuthenticationMiddleware (ADMIN_ENABLED=false) only DRF
+        # views set a user
+        user = getattr(request, 'user', None)
+        # Services calling with client credentials are not users
+        if user is not None and user.is_authenticated and not isinstance(user, ServiceClient):
+            # Buffered; written in batches by the recorder
+            activity_recorder.record(user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user = getattr(request, 'user', None)
+        if isinstance(user, SimpleLazyObject):
+            # Not replaced by a token-authenticated view; resolve the session
+            # user without blocking the event loop
+            user = await request.auser()
+        if user is not None and user.is_authenticated and not isinstance(user, ServiceClient):
+            await activity_recorder.arecord(user)
         return response
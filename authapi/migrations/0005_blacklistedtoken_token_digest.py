@@ -0,0 +1,42 @@
+from hashlib import sha256
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    BlacklistedToken = apps.get_model('authapi', 'BlacklistedToken')
+    db_alias = schema_editor.connection.alias
+    queryset = BlacklistedToken.objects.using(db_alias).filter(token_digest__isnull=True).order_by('id')
+    while True:
+        batch = list(queryset.only('id', 'token')[:1000])
+        if not batch:
+            break
+        for row in batch:
+            row.token_digest = sha256(row.token.encode()).digest()
+        BlacklistedToken.objects.using(db_alias).bulk_update(batch, ['token_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapi', '0004_blacklistedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blacklistedtoken',
+            name='token_digest',
+            field=models.BinaryField(max_length=32, null=True),
+        ),
+        # Raw tokens cannot be recovered from their digests, so this is one-way.
+        migrations.RunPython(hash_existing_tokens),
+        migrations.RemoveField(
+            model_name='blacklistedtoken',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='blacklistedtoken',
+            name='token_digest',
+            field=models.BinaryField(max_length=32, unique=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from datetime import timezone
+
+from django.db import migrations, models
+
+
+def fill_expiry_day(apps, schema_editor):
+    BlacklistedToken = apps.get_model('authapi', 'BlacklistedToken')
+    db_alias = schema_editor.connection.alias
+    queryset = BlacklistedToken.objects.using(db_alias).filter(expiry_day__isnull=True).order_by('id')
+    while True:
+        batch = list(queryset.only('id', 'expires_at')[:1000])
+        if not batch:
+            break
+        for row in batch:
+            row.expiry_day = row.expires_at.astimezone(timezone.utc).date()
+        BlacklistedToken.objects.using(db_alias).bulk_update(batch, ['expiry_day'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapi', '0005_blacklistedtoken_token_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blacklistedtoken',
+            name='expiry_day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_expiry_day, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='blacklistedtoken',
+            name='expiry_day',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='blacklistedtoken',
+            index=models.Index(fields=['expiry_day', 'id'], name='authapi_blacklist_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-17 01:09
+
+from django.db import migrations, models
+
+SEQUENCE = 'authapi_account_id_block_seq'
+
+
+def create_sequence(apps, schema_editor):
+    # Postgres leases account ID blocks from a native sequence, which is not
+    # rolled back with the transaction that happened to lease a block.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} MINVALUE 0 START WITH 0')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapi', '0007_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_block', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-17 01:57
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from authapi.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('authapi', '0008_idsequence'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='blacklistedtoken',
+            options={},
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='authapi_user_email_lower_idx'),
+        ),
+    ]
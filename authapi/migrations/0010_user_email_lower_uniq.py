@@ -0,0 +1,46 @@
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+from authapi.migration_operations import AddUniqueConstraintConcurrently, RemoveIndexConcurrently
+
+
+def check_no_duplicate_emails(apps, schema_editor):
+    # Addresses registered before lookups ignored case may differ only in
+    # case; they must be merged or renamed by hand before the constraint.
+    User = apps.get_model('authapi', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias)
+        .values(email_lower=Lower('email')).annotate(count=Count('id')).filter(count__gt=1)
+        .order_by('email_lower').values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Emails registered more than once in different case, resolve them before migrating: '
+            + ', '.join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+    # CREATE UNIQUE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('authapi', '0009_user_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicate_emails, migrations.RunPython.noop),
+        AddUniqueConstraintConcurrently(
+            model_name='user',
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower('email'), name='authapi_user_email_lower_uniq',
+                violation_error_message='user with this email already exists.',
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name='user',
+            name='authapi_user_email_lower_idx',
+        ),
+    ]
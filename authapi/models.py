@@ -1,8 +1,9 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
-from django.db.models.signals import pre_save
+from django.db import models, transaction
+from django.db.models.functions import Lower, TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-import uuid
+from datetime import datetime, timezone as dt_timezone
 from django.utils import timezone
 
 class CustomUserManager(BaseUserManager):
@@ -50,13 +51,76 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
 
+    # Column values as last loaded from or written to the database; None for
+    # instances that were never saved.
+    _saved_values = None
+
     class Meta:
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        constraints = [
+            # One account per address whatever its case; its index also
+            # serves case-insensitive lookups: filter(email__lower=...)
+            models.UniqueConstraint(
+                Lower('email'), name='authapi_user_email_lower_uniq',
+                violation_error_message='user with this email already exists.',
+            ),
+        ]
 
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = instance._column_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # Replaced, never updated in place: shallow copies (see user_cache)
+        # share the dict.
+        self._saved_values = {**(self._saved_values or {}), **self._column_values(fields)}
+
+    def save(self, *args, **kwargs):
+        """
+        Save the row. An existing row is saved with update_fields set to the
+        fields changed since it was loaded or last saved, so only those columns
+        are written; when nothing changed there is no query at all.
+        """
+        update_fields = kwargs.get('update_fields')
+        if (
+            update_fields is None and not args and self._saved_values is not None
+            and not self._state.adding and not kwargs.get('force_insert')
+            and kwargs.get('using', self._state.db) == self._state.db
+        ):
+            update_fields = kwargs['update_fields'] = self.get_dirty_fields()
+        super().save(*args, **kwargs)
+        if update_fields is None:
+            self._saved_values = self._column_values()
+        else:
+            self._saved_values = {**(self._saved_values or {}), **self._column_values(update_fields)}
+
+    def get_dirty_fields(self):
+        """Names of the fields changed since the row was loaded or last saved."""
+        saved = self._saved_values or {}
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__ and (
+                field.attname not in saved or self.__dict__[field.attname] != saved[field.attname]
+            )
+        ]
+
+    def _column_values(self, fields=None):
+        # Deferred columns are not in __dict__ and not read here
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (
+                fields is None or field.name in fields or field.attname in fields
+            )
+        }
+
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
 
@@ -73,24 +137,144 @@ class User(AbstractBaseUser, PermissionsMixin):
             return False
         return (timezone.now() - self.email_verification_code_created_at).total_seconds() < 600  # 10 minutes
 
+User._meta.get_field('email').register_lookup(Lower)
+
+class BlacklistedTokenQuerySet(models.QuerySet):
+    """
+    Keeps expiry_day in step with expires_at on the bulk write paths, which
+    skip save() and pre_save (see set_expiry_day).
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.expiry_day = expiry_day_for(obj.expires_at)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'expires_at' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.expiry_day = expiry_day_for(obj.expires_at)
+            fields = [*fields, 'expiry_day'] if 'expiry_day' not in fields else fields
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if 'expires_at' in kwargs:
+            expires_at = kwargs['expires_at']
+            kwargs['expiry_day'] = (
+                expiry_day_for(expires_at) if isinstance(expires_at, datetime)
+                # An expression: the database works the day out per row
+                else TruncDate(expires_at, tzinfo=dt_timezone.utc)
+            )
+        return super().update(**kwargs)
+
 class BlacklistedToken(models.Model):
     """Store tokens that have been blacklisted (logged out)"""
-    token = models.CharField(max_length=500, unique=True)
+    # SHA-256 of the raw token (see token_utils.token_digest), so the unique
+    # index stays 32 bytes wide whatever the token length.
+    token_digest = models.BinaryField(max_length=32, unique=True)
     user = models.ForeignKey(User, related_name='blacklisted_tokens', on_delete=models.CASCADE)
     blacklisted_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
+    # UTC day of expires_at, always derived from it; purging walks
+    # (expiry_day, id) and can drop whole expired days.
+    expiry_day = models.DateField(editable=False)
+
+    objects = BlacklistedTokenQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-blacklisted_at']
+        indexes = [
+            models.Index(fields=['expiry_day', 'id'], name='authapi_blacklist_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.blacklisted_at}"
 
+def expiry_day_for(expires_at):
+    if timezone.is_naive(expires_at):
+        expires_at = timezone.make_aware(expires_at)
+    return expires_at.astimezone(dt_timezone.utc).date()
+
+class OutboundEmail(models.Model):
+    """Email queued in the request transaction and sent later by the outbox worker"""
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not picked up before this time; pushed forward while a sender holds the
+    # row and after every failed attempt.
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['send_after', 'id'],
+                name='authapi_outbox_pending_idx',
+                condition=models.Q(sent_at__isnull=True, failed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{', '.join(self.recipients)} - {self.subject}"
+
+class IdSequence(models.Model):
+    """Block counter for ID allocation on databases without native sequences"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_block = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} - {self.next_block}"
+
 @receiver(pre_save, sender=User)
 def generate_account_id(sender, instance, **kwargs):
     if not instance.account_id:
-        while True:
-            account_id = str(uuid.uuid4()).replace('-', '')[:10].upper()
-            if not User.objects.filter(account_id=account_id).exists():
-                instance.account_id = account_id
-                break
\ No newline at end of file
+        from .ids import account_ids
+        instance.account_id = account_ids.allocate()
+
+@receiver(pre_save, sender=BlacklistedToken)
+def set_expiry_day(sender, instance, **kwargs):
+    # Sent for fixtures (raw saves) too, which bypass Model.save()
+    instance.expiry_day = expiry_day_for(instance.expires_at)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    from .user_cache import user_cache
+    user_cache.invalidate(instance.pk)
+
+def replica_pin_keys(user_id=None, email=None):
+    """Keys under which a user's writes pin their reads to the primary (see core.db_router)"""
+    keys = []
+    if user_id is not None:
+        keys.append(f'user:{user_id}')
+    if email:
+        keys.append(f'email:{email.strip().lower()}')
+    return keys
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def pin_user_to_primary(sender, instance, **kwargs):
+    from core import db_router
+    db_router.pin(*replica_pin_keys(instance.pk, instance.email))
+
+@receiver(post_delete, sender=User)
+def forget_last_activity(sender, instance, **kwargs):
+    from .activity import activity_recorder
+    activity_recorder.forget(instance.pk)
+
+@receiver(post_save, sender=User)
+def add_email_to_filter(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'email' not in update_fields:
+        return
+    from .email_filter import email_filter
+    email = instance.email
+    email_filter.add(email)
+    # Again once committed, so a filter rebuild that started meanwhile
+    # journals it rather than missing an uncommitted row.
+    transaction.on_commit(lambda: email_filter.add(email))
@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# How long a sender owns a claimed row before another sender may retry it.
+CLAIM_LEASE = timedelta(minutes=5)
+# SMTP round trips one message may need (connect, EHLO, STARTTLS, AUTH, MAIL,
+# RCPT, DATA), each bounded by EMAIL_TIMEOUT. A sender starts no new message
+# once less than this many timeouts of its lease are left, so a batch never
+# outlives its lease and is never claimed and sent twice.
+SMTP_STEPS_PER_MESSAGE = 10
+# Sent and abandoned rows are deleted after EMAIL_OUTBOX_RETENTION seconds,
+# checked at most this often by each sender.
+PURGE_INTERVAL = 3600
+
+
+def queue_email(subject, body, recipients, from_email=None):
+    """
+    Queue an email for the outbox worker.
+
+    Call inside the transaction that makes the email meaningful (e.g. the one
+    saving the OTP): the row commits or rolls back with it, and the in-process
+    sender is woken once the transaction commits.
+    """
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+    transaction.on_commit(_wake_sender)
+    return email
+
+
+def retry_delay(attempts):
+    base = settings.EMAIL_OUTBOX_RETRY_DELAY
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    """Lease up to batch_size due emails to this sender and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, failed_at__isnull=True, send_after__lte=now)
+            .order_by('send_after', 'id')[:batch_size]
+        )
+        if emails:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(send_after=now + claim_lease())
+    return emails
+
+
+def send_margin():
+    """The longest one message can take to send."""
+    return timedelta(seconds=SMTP_STEPS_PER_MESSAGE * (settings.EMAIL_TIMEOUT or 60))
+
+
+def claim_lease():
+    # At least two messages' worth, however long EMAIL_TIMEOUT is
+    return max(CLAIM_LEASE, 2 * send_margin())
+
+
+def send_batch(emails, deadline=None):
+    """
+    Send claimed emails over one SMTP connection; returns the number sent.
+
+    Emails not started by `deadline` are handed back to be claimed again.
+    """
+    sent = 0
+    handled = set()
+    try:
+        with get_connection(fail_silently=False) as mail_connection:
+            for email in emails:
+                if deadline is not None and timezone.now() >= deadline:
+                    _release([email.pk for email in emails if email.pk not in handled])
+                    break
+                try:
+                    EmailMessage(
+                        email.subject,
+                        email.body,
+                        email.from_email,
+                        email.recipients,
+                        connection=mail_connection,
+                    ).send()
+                except Exception as exc:
+                    _record_failure(email, exc)
+                else:
+                    # The body holds the OTP or verification code: not kept once sent
+                    email.sent_at = timezone.now()
+                    email.attempts += 1
+                    email.body = ''
+                    email.save(update_fields=['sent_at', 'attempts', 'body'])
+                    sent += 1
+                handled.add(email.pk)
+    except Exception as exc:
+        # Could not open (or cleanly close) the connection: retry what is left.
+        for email in emails:
+            if email.pk not in handled:
+                _record_failure(email, exc)
+    return sent
+
+
+def _release(pks):
+    logger.warning("Lease running out: handing back %d unsent outbound emails", len(pks))
+    OutboundEmail.objects.filter(pk__in=pks).update(send_after=timezone.now())
+
+
+def _record_failure(email, exc):
+    email.attempts += 1
+    email.last_error = f"{exc.__class__.__name__}: {exc}"
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.failed_at = timezone.now()
+        email.body = ''
+        logger.error("Giving up on outbound email %s after %d attempts: %s", email.pk, email.attempts, exc)
+    else:
+        email.send_after = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'failed_at', 'send_after', 'body'])
+
+
+def drain_outbox(batch_size=None, max_batches=None):
+    """Send due emails batch by batch until none are left; returns the number sent."""
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    sent = batches = 0
+    while max_batches is None or batches < max_batches:
+        # Taken before claiming, so it falls inside the lease
+        deadline = timezone.now() + claim_lease() - send_margin()
+        emails = claim_batch(batch_size)
+        if not emails:
+            break
+        sent += send_batch(emails, deadline)
+        batches += 1
+    return sent
+
+
+def purge_sent_emails(now=None):
+    """Delete emails sent or given up on more than EMAIL_OUTBOX_RETENTION seconds ago."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION)
+    deleted, _ = OutboundEmail.objects.filter(Q(sent_at__lt=cutoff) | Q(failed_at__lt=cutoff)).delete()
+    return deleted
+
+
+class OutboxSender(threading.Thread):
+    """
+    Daemon thread that drains the outbox inside a web worker.
+
+    Woken as soon as a queued email commits, and otherwise polls every
+    EMAIL_OUTBOX_POLL_INTERVAL seconds to pick up retries.
+    """
+
+    def __init__(self, poll_interval):
+        super().__init__(name='email-outbox', daemon=True)
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        purged_at = None
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                drain_outbox()
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged_at = time.monotonic()
+                    purge_sent_emails()
+            except Exception:
+                logger.exception("Email outbox drain failed")
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+
+_sender = None
+
+
+def _wake_sender():
+    if _sender is not None:
+        _sender.wakeup.set()
+
+
+def start_outbox_sender():
+    """Start the in-process sender if EMAIL_OUTBOX_THREAD is enabled."""
+    global _sender
+    if not settings.EMAIL_OUTBOX_THREAD or _sender is not None:
+        return None
+    _sender = OutboxSender(settings.EMAIL_OUTBOX_POLL_INTERVAL)
+    _sender.start()
+    return _sender
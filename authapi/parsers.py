@@ -0,0 +1,30 @@
+import io
+
+from django.conf import settings
+from rest_framework import parsers
+
+from .fastjson import LONG_INTEGER, orjson, outside_strings
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    DRF's JSONParser, parsing with orjson when it is installed.
+
+    The result is what the stock parser returns. Bodies orjson rejects are
+    parsed again by the stock parser, which either accepts them (lone
+    surrogate escapes, numbers too large for a double) or raises the same
+    ParseError as before. Non-UTF-8 bodies, and bodies with integers orjson
+    would read as floats, go straight to the stock parser.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding') or settings.DEFAULT_CHARSET
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8', 'utf_8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if not LONG_INTEGER.search(outside_strings(body)):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,10 @@
+from rest_framework.permissions import BasePermission
+
+from .backends import ServiceClient
+
+
+class IsServiceClient(BasePermission):
+    """Allows access only to services authenticated with client credentials"""
+
+    def has_permission(self, request, view):
+        return isinstance(request.user, ServiceClient)
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BlacklistedToken, expiry_day_for
+
+logger = logging.getLogger(__name__)
+
+# Rough on-disk cost of one row plus its index entries, used when the
+# database cannot tell us (Postgres reports the real average instead).
+ESTIMATED_ROW_BYTES = 160
+
+
+class PurgeReport:
+    """Totals for one purge run."""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.buckets = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        return (
+            f"Purged {self.rows} expired blacklist rows (~{self.bytes} bytes) "
+            f"in {self.chunks} chunks and {self.buckets} day buckets, {self.seconds:.2f}s"
+        )
+
+
+def bytes_per_row():
+    table = BlacklistedToken._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_total_relation_size(oid)::float8 / GREATEST(reltuples, 1) "
+                "FROM pg_class WHERE oid = %s::regclass",
+                [table],
+            )
+            row = cursor.fetchone()
+        if row and row[0]:
+            return int(row[0])
+    return ESTIMATED_ROW_BYTES
+
+
+def purge_expired_tokens(chunk_size=None, max_chunks=None, bucketed=None, pause=0.0, now=None):
+    """
+    Delete BlacklistedToken rows whose expires_at has passed.
+
+    Rows are deleted in chunks of at most chunk_size, walking the
+    (expiry_day, id) index, so every DELETE is a short statement holding
+    row locks on a bounded set. With bucketed=True, days entirely in the past
+    are emptied first, one day at a time and in the same chunks, without
+    checking expires_at: the walk stays within the index.
+    """
+    if chunk_size is None:
+        chunk_size = settings.TOKEN_BLACKLIST_PURGE_CHUNK_SIZE
+    if bucketed is None:
+        bucketed = settings.TOKEN_BLACKLIST_PURGE_BUCKETED
+    now = now or timezone.now()
+    today = expiry_day_for(now)
+    report = PurgeReport()
+    started = time.monotonic()
+    row_bytes = bytes_per_row()
+
+    if bucketed:
+        days = (
+            BlacklistedToken.objects.filter(expiry_day__lt=today)
+            .order_by('expiry_day').values_list('expiry_day', flat=True).distinct()
+        )
+        for day in list(days):
+            done = _delete_in_chunks(
+                BlacklistedToken.objects.filter(expiry_day=day).order_by('id').values_list('id'),
+                lambda last: Q(id__gt=last[0]),
+                report, chunk_size, max_chunks, pause,
+            )
+            if not done:
+                break
+            report.buckets += 1
+
+    _delete_in_chunks(
+        BlacklistedToken.objects.filter(expiry_day__lte=today, expires_at__lte=now)
+        .order_by('expiry_day', 'id').values_list('expiry_day', 'id'),
+        lambda last: Q(expiry_day__gt=last[0]) | Q(expiry_day=last[0], id__gt=last[1]),
+        report, chunk_size, max_chunks, pause,
+    )
+
+    report.bytes = report.rows * row_bytes
+    report.seconds = time.monotonic() - started
+    return report
+
+
+def _delete_in_chunks(keys, after, report, chunk_size, max_chunks, pause):
+    """
+    Delete the rows of `keys` (a values_list ending with id, in key order),
+    chunk_size at a time, continuing after the last key with after(last).
+    False if max_chunks stopped it first.
+    """
+    last = None
+    while max_chunks is None or report.chunks < max_chunks:
+        chunk = list((keys if last is None else keys.filter(after(last)))[:chunk_size])
+        if not chunk:
+            return True
+        deleted, _ = BlacklistedToken.objects.filter(id__in=[key[-1] for key in chunk]).delete()
+        report.rows += deleted
+        report.chunks += 1
+        last = chunk[-1]
+        if len(chunk) < chunk_size:
+            return True
+        if pause:
+            time.sleep(pause)
+    return False
+
+
+class PeriodicPurge(threading.Thread):
+    """
+    Daemon thread that purges expired blacklist rows every `interval` seconds.
+
+    Every worker may run one; a shared cache lock keeps a single purge per
+    interval where the cache is shared between workers.
+    """
+
+    LOCK_KEY = 'authapi:blacklist_purge_lock'
+
+    def __init__(self, interval):
+        super().__init__(name='blacklist-purge', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                close_old_connections()
+                if cache.add(self.LOCK_KEY, True, timeout=self.interval):
+                    report = purge_expired_tokens()
+                    logger.info(str(report))
+            except Exception:
+                logger.exception("Periodic blacklist purge failed")
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_periodic_purge = None
+
+
+def start_periodic_purge():
+    """Start the in-process purge thread if TOKEN_BLACKLIST_PURGE_INTERVAL is set."""
+    global _periodic_purge
+    interval = getattr(settings, 'TOKEN_BLACKLIST_PURGE_INTERVAL', 0)
+    if interval <= 0 or _periodic_purge is not None:
+        return None
+    _periodic_purge = PeriodicPurge(interval)
+    _periodic_purge.start()
+    return _periodic_purge
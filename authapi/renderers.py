@@ -0,0 +1,43 @@
+from rest_framework import renderers
+
+from .fastjson import FLOAT, orjson, outside_strings
+
+OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+# encoder_class().default by encoder class; renderers are created per request
+_defaults = {}
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer, rendering with orjson when it is installed.
+
+    The output is byte for byte what the stock renderer produces: values
+    orjson does not handle itself (datetimes, lazy strings, querysets, ...)
+    go through the same encoder_class.default, U+2028 and U+2029 are
+    escaped the same way, and anything orjson would write differently
+    (floats, integers over 64 bits, non-string keys, indented output,
+    non-default UNICODE_JSON/COMPACT_JSON/STRICT_JSON) is rendered by the
+    stock renderer instead. The one exception: NaN and infinities, which the
+    stock renderer refuses under STRICT_JSON, render as null.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        default = _defaults.get(self.encoder_class)
+        if default is None:
+            default = _defaults.setdefault(self.encoder_class, self.encoder_class().default)
+        try:
+            ret = orjson.dumps(data, default=default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            # The stock renderer either renders it or raises the same error
+            return super().render(data, accepted_media_type, renderer_context)
+        if FLOAT.search(outside_strings(ret)):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            # Valid JSON but not valid JavaScript; escaped like the stock renderer
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,4 +1,9 @@
+from operator import attrgetter
+
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import serializers
+from .hashing import hashing_service
+from .introspection import max_batch_size
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -6,18 +11,69 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['account_id', 'first_name', 'last_name', 'email']
 
+class FastUserSerializer:
+    """
+    UserSerializer(user).data as a plain dict, for the hot responses (login,
+    OTP verification, profile). The fields are read from UserSerializer once,
+    at import, instead of being built for every call. Only plain string
+    fields are supported: their representation is str(value), or None.
+    """
+    serializer_class = UserSerializer
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    @classmethod
+    def compile(cls):
+        names, sources = [], []
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if type(field) not in (serializers.CharField, serializers.EmailField) or len(field.source_attrs) != 1:
+                raise ImproperlyConfigured(
+                    f"{cls.__name__} cannot represent {cls.serializer_class.__name__}.{name}; "
+                    "only plain CharField and EmailField fields are supported"
+                )
+            names.append(name)
+            sources.append(field.source_attrs[0])
+        cls.field_names = tuple(names)
+        getter = attrgetter(*sources)
+        cls._values = staticmethod(getter if len(sources) > 1 else lambda instance: (getter(instance),))
+
+    @property
+    def data(self):
+        try:
+            values = self._values(self.instance)
+        except AttributeError:
+            # Raise what UserSerializer raises for the same instance
+            return self.serializer_class(self.instance).data
+        return {
+            name: None if value is None else str(value)
+            for name, value in zip(self.field_names, values)
+        }
+
+
+FastUserSerializer.compile()
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
         model = User
         fields = ['first_name', 'last_name', 'email', 'password']
+        # Replaced by validate_email, which ignores case
+        extra_kwargs = {'email': {'validators': []}}
+
+    def validate_email(self, value):
+        if User.objects.filter(email__lower=value.strip().lower()).exists():
+            raise serializers.ValidationError('user with this email already exists.', code='unique')
+        return value
 
     def create(self, validated_data):
         password = validated_data.pop('password', None)
         instance = self.Meta.model(**validated_data)
         if password is not None:
-            instance.set_password(password)
+            hashing_service.set_password(instance, password)
         instance.save()
         return instance
 
@@ -40,4 +96,14 @@ class PasswordResetSerializer(serializers.Serializer):
         # Add password validation here (e.g., minimum length, complexity requirements)
         if len(value) < 8:
             raise serializers.ValidationError("Password must be at least 8 characters long.")
-        return value
\ No newline at end of file
+        return value
+
+class TokenIntrospectionSerializer(serializers.Serializer):
+    tokens = serializers.ListField(child=serializers.CharField(max_length=8192), allow_empty=False)
+    fresh = serializers.BooleanField(default=False)
+
+    def validate_tokens(self, value):
+        if len(value) > max_batch_size():
+            raise serializers.ValidationError(f"At most {max_batch_size()} tokens per request.")
+        return value
+
@@ -1,3 +1,1918 @@
-from django.test import TestCase
+import atexit
+import base64
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import re
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.db import IntegrityError, OperationalError, connection, connections, router, transaction
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from core import db_router, shm_cache
+from core.schema import build, schema_store
+
+from . import outbox
+from .activity import LastActivityRecorder, activity_recorder
+from .async_views import AsyncUserProfileView
+from .backends import CustomJWTAuthentication
+from .blacklist import BlacklistIndex, blacklist_index
+from .bloom import BloomFilter
+from .email_filter import EmailFilter, email_filter
+from .exporter import iter_rows, resume_point
+from .hashing import HashingService
+from .ids import BLOCK_BITS, PREFIXES, VALUE_BITS, AccountIdAllocator, account_ids
+from .importer import UserImporter, read_rows
+from .parsers import JSONParser
+from .renderers import JSONRenderer
+from .serializers import FastUserSerializer, UserRegistrationSerializer, UserSerializer
+from .jwt_keys import SigningKey, keyring
+from .models import BlacklistedToken, OutboundEmail, User
+from .outbox import CLAIM_LEASE, claim_batch, drain_outbox, queue_email, send_batch
+from .purge import purge_expired_tokens
+from .token_utils import get_tokens_for_user, token_digest
+from .throttles import AnonRateThrottle, LoginRateThrottle, SignupRateThrottle, UserRateThrottle
+from .tokens import AccessToken, RefreshToken
+from .user_cache import UserCache, user_cache
+from .views import UserProfileView
+
+PASSWORD = 'correct-horse-42'
+
+
+def add_sqlite_database(testcase, alias):
+    """
+    Add an empty SQLite database as `alias` for the tests of a
+    TransactionTestCase with databases = '__all__'; call before setUpClass().
+    """
+    directory = tempfile.mkdtemp()
+    testcase.addClassCleanup(shutil.rmtree, directory)
+    connections.settings[alias] = {
+        **connections['default'].settings_dict, 'NAME': os.path.join(directory, f'{alias}.sqlite3'),
+    }
+    testcase.addClassCleanup(connections.settings.pop, alias)
+    testcase.addClassCleanup(connections.__delitem__, alias)
+    testcase.addClassCleanup(connections[alias].close)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class QueryCountTests(TestCase):
+    """
+    Queries per endpoint, so an extra per-request write or lookup shows up
+    as a test failure. Savepoints of transaction.atomic() are counted too.
+    """
+
+    def setUp(self):
+        # Buffered last_activity updates go to this test's database, not the next
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        user_cache.clear()
+        blacklist_index.reset()
+        activity_recorder.reset()
+        # Lease an account ID block up front, so no test pays for it; the
+        # lease is pooled once the (test) transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            account_ids.allocate()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def set_code(self, user, code='123456'):
+        User.objects.filter(pk=user.pk).update(
+            email_verification_code=code, email_verification_code_created_at=timezone.now(),
+        )
+        return code
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(self.user)['access'])
+
+    def test_register(self):
+        # Unique email check, INSERT user, INSERT outbox email, savepoint pair
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/v1/auth/register/', {
+                'email': 'grace@example.com', 'password': PASSWORD, 'first_name': 'Grace', 'last_name': 'Hopper',
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        user = User.objects.get(email='grace@example.com')
+        self.assertIsNotNone(user.email_verification_code)
+        self.assertIsNotNone(user.email_verification_code_created_at)
+
+    def test_verify_otp(self):
+        user = User.objects.create_user(
+            email='grace@example.com', password=PASSWORD, first_name='Grace', last_name='Hopper',
+        )
+        code = self.set_code(user)
+        # SELECT user, one UPDATE of the three changed columns
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/v1/auth/verify-otp/', {
+                'email': 'grace@example.com', 'otp': code,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        self.assertIsNone(user.email_verification_code)
+
+    def test_login(self):
+        # SELECT user only; last_activity is written behind
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/v1/auth/login/', {
+                'email': 'ada@example.com', 'password': PASSWORD,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_refresh(self):
+        response = self.client.post('/api/v1/auth/login/', {
+            'email': 'ada@example.com', 'password': PASSWORD,
+        }, format='json')
+        refresh = response.json()['tokens']['refresh']
+        # Last activity comes from the shared cache, the tokens from the claims
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/v1/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        access = response.json()['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(self.client.get('/api/v1/auth/profile/').status_code, 200)
+
+    @override_settings(TOKEN_INACTIVITY_TIMEOUT=600)
+    def test_refresh_after_inactivity(self):
+        long_ago = timezone.now() - timedelta(seconds=700)
+        User.objects.filter(pk=self.user.pk).update(last_activity=long_ago)
+        refresh = RefreshToken.for_user(self.user)
+        refresh.set_iat(at_time=long_ago)
+        # Not cached yet: one read of last_activity
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/v1/auth/token/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 401, response.content)
+
+    def test_refresh_for_deleted_user(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        self.client.post('/api/v1/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.user.delete()
+        response = self.client.post('/api/v1/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401, response.content)
+
+    def test_profile(self):
+        self.authenticate()
+        self.client.get('/api/v1/auth/profile/')
+        # The user comes from the user cache
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/auth/profile/')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_profile_update(self):
+        self.authenticate()
+        self.client.get('/api/v1/auth/profile/')
+        with self.assertNumQueries(1):
+            response = self.client.put('/api/v1/auth/profile/', {'first_name': 'Augusta'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, 'Augusta')
+
+    def test_resend_otp(self):
+        user = User.objects.create_user(
+            email='grace@example.com', password=PASSWORD, first_name='Grace', last_name='Hopper',
+        )
+        # SELECT user, UPDATE the code, INSERT outbox email, savepoint pair
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/v1/auth/resend-otp/', {'email': 'grace@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_password_reset(self):
+        code = self.set_code(self.user)
+        # SELECT user, one UPDATE of password and code
+        with self.assertNumQueries(2):
+            response = self.client.put('/api/v1/auth/password-reset/', {
+                'email': 'ada@example.com', 'otp': code,
+                'new_password': 'another-horse-43', 'confirm_password': 'another-horse-43',
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('another-horse-43'))
+
+
+class DirtyFieldTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace',
+        )
+
+    def test_unchanged_save_is_skipped(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            user.save()
+
+    def test_save_writes_changed_columns_only(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Augusta'
+        self.assertEqual(user.get_dirty_fields(), ['first_name'])
+        with self.assertNumQueries(1) as captured:
+            user.save()
+        sql = captured.captured_queries[0]['sql']
+        self.assertIn('first_name', sql)
+        self.assertNotIn('password', sql)
+        self.assertNotIn('account_id', sql)
+        self.assertEqual(user.get_dirty_fields(), [])
+
+    def test_saves_merge_until_written(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Augusta'
+        user.last_name = 'King'
+        with self.assertNumQueries(1):
+            user.save()
+        saved = User.objects.get(pk=self.user.pk)
+        self.assertEqual((saved.first_name, saved.last_name), ('Augusta', 'King'))
+
+    def test_explicit_update_fields_leave_other_changes_dirty(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Augusta'
+        user.last_name = 'King'
+        user.save(update_fields=['first_name'])
+        self.assertEqual(user.get_dirty_fields(), ['last_name'])
+
+    def test_copies_track_changes_separately(self):
+        user = User.objects.get(pk=self.user.pk)
+        other = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Augusta'
+        user.save()
+        self.assertEqual(other.get_dirty_fields(), [])
+
+
+class SigningKeyTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        keys_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keys_dir)
+        overrides = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            EMAIL_FILTER_PATH='',
+            JWT_KEYS_DIR=keys_dir,
+            JWT_ACTIVE_KID='',
+        )
+        overrides.enable()
+        self.addCleanup(keyring.reload)
+        self.addCleanup(overrides.disable)
+        keyring.reload()
+        blacklist_index.reset()
+        user_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def add_key(self, algorithm, published=True):
+        """Add a key; published=True dates it back past JWKS_MAX_AGE, so it signs."""
+        key = SigningKey.generate(algorithm)
+        keyring.add(key)
+        if published:
+            self.age(key, settings.JWKS_MAX_AGE)
+        return key
+
+    def age(self, key, seconds):
+        when = time.time() - seconds
+        os.utime(os.path.join(keyring.path, f'{key.kid}.pem'), (when, when))
+        keyring.reload()
+
+    def signing_kid(self):
+        return jwt.get_unverified_header(str(RefreshToken.for_user(self.user).access_token))['kid']
+
+    def test_new_key_is_published_before_it_signs(self):
+        old_key = self.add_key('EdDSA')
+        new_key = self.add_key('EdDSA', published=False)
+        jwks = self.client.get('/.well-known/jwks.json').json()
+        self.assertEqual({key['kid'] for key in jwks['keys']}, {old_key.kid, new_key.kid})
+        self.assertEqual(self.signing_kid(), old_key.kid)
+
+        self.age(new_key, settings.JWKS_MAX_AGE - 10)
+        self.assertEqual(self.signing_kid(), old_key.kid)
+        self.assertAlmostEqual(keyring.current().activate_at, time.time() + 10, delta=2)
+        # Comes of age without any change to the directory
+        with mock.patch('authapi.jwt_keys.time.time', return_value=time.time() + 10):
+            keyring._checked_at = None
+            self.assertEqual(self.signing_kid(), new_key.kid)
+
+    def test_first_key_signs_at_once(self):
+        key = self.add_key('EdDSA', published=False)
+        self.assertEqual(self.signing_kid(), key.kid)
+        self.assertIsNone(keyring.current().activate_at)
+
+    def test_active_kid_signs_at_once(self):
+        self.add_key('EdDSA')
+        new_key = self.add_key('EdDSA', published=False)
+        with override_settings(JWT_ACTIVE_KID=new_key.kid):
+            self.assertEqual(keyring.reload().active.kid, new_key.kid)
+            self.assertEqual(self.signing_kid(), new_key.kid)
+
+    def test_rotate_command(self):
+        self.add_key('EdDSA')
+        out = StringIO()
+        call_command('rotate_jwt_key', '--algorithm', 'EdDSA', stdout=out)
+        self.assertIn(f'signs new tokens once cached copies have expired, in {settings.JWKS_MAX_AGE} seconds', out.getvalue())
+        out = StringIO()
+        call_command('rotate_jwt_key', '--list', stdout=out)
+        self.assertEqual([line.split(' ', 2)[-1] for line in out.getvalue().splitlines()], [
+            '(active)', '(published, not signing yet)',
+        ])
+
+    def test_tokens_verify_offline_with_published_keys(self):
+        for algorithm in ('RS256', 'EdDSA'):
+            key = self.add_key(algorithm)
+            access = str(RefreshToken.for_user(self.user).access_token)
+            self.assertEqual(jwt.get_unverified_header(access), {'alg': algorithm, 'kid': key.kid, 'typ': 'JWT'})
+            jwks = self.client.get('/.well-known/jwks.json').json()
+            public_key = jwt.PyJWKSet.from_dict(jwks)[key.kid].key
+            payload = jwt.decode(access, public_key, algorithms=[algorithm])
+            self.assertEqual(payload['user_id'], self.user.pk)
+
+    def test_rotation_keeps_earlier_tokens_valid(self):
+        self.add_key('RS256')
+        old = str(RefreshToken.for_user(self.user).access_token)
+        new_key = self.add_key('EdDSA')
+        new = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(jwt.get_unverified_header(new)['kid'], new_key.kid)
+        for token in (old, new):
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+            self.assertEqual(self.client.get('/api/v1/auth/profile/').status_code, 200)
+
+    def test_hs256_tokens_refused_once_keys_exist(self):
+        hs256 = str(RefreshToken.for_user(self.user).access_token)
+        self.add_key('EdDSA')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + hs256)
+        self.assertEqual(self.client.get('/api/v1/auth/profile/').status_code, 401)
+
+    def test_jwks_is_cacheable(self):
+        self.add_key('EdDSA')
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+        response = self.client.get('/.well-known/jwks.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.add_key('EdDSA')
+        response = self.client.get('/.well-known/jwks.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['keys']), 2)
+
+    def test_logout(self):
+        self.add_key('RS256')
+        response = self.client.post('/api/v1/auth/login/', {
+            'email': 'ada@example.com', 'password': PASSWORD,
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.json()['tokens']['access'])
+        self.assertEqual(self.client.post('/api/v1/auth/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/auth/profile/').status_code, 401)
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    INTROSPECTION_CLIENTS={'gateway': 's3cret'},
+    INTROSPECTION_MAX_TOKENS=3,
+)
+class IntrospectionTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        user_cache.clear()
+        blacklist_index.reset()
+        activity_recorder.reset()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'gateway:s3cret').decode())
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def introspect(self, tokens, **data):
+        return self.client.post('/api/v1/auth/introspect/', {'tokens': tokens, **data}, format='json')
+
+    def revoke(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(self.client.post('/api/v1/auth/logout/').status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'gateway:s3cret').decode())
+
+    def test_batch(self):
+        active = get_tokens_for_user(self.user)['access']
+        revoked = get_tokens_for_user(self.user)['access']
+        self.revoke(revoked)
+        expired = RefreshToken.for_user(self.user).access_token
+        expired.set_exp(from_time=timezone.now() - timedelta(hours=1), lifetime=timedelta(0))
+        # Signatures and expiry need no queries, the blacklist index is fresh
+        with self.assertNumQueries(0):
+            response = self.introspect([active, revoked, str(expired)])
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertTrue(results[0]['active'])
+        self.assertEqual(results[0]['claims']['user_id'], self.user.pk)
+        self.assertEqual(results[1], {'active': False, 'reason': 'revoked'})
+        self.assertEqual(results[2], {'active': False, 'reason': 'expired'})
+        with self.assertNumQueries(1):
+            response = self.introspect([active, revoked, 'not-a-jwt'], fresh=True)
+        results = response.json()['results']
+        self.assertEqual([result['active'] for result in results], [True, False, False])
+        self.assertEqual(results[2], {'active': False, 'reason': 'invalid'})
+
+    def test_batch_limit(self):
+        access = get_tokens_for_user(self.user)['access']
+        self.assertEqual(self.introspect([access] * 4).status_code, 400)
+        self.assertEqual(self.introspect([]).status_code, 400)
+
+    def test_client_credentials_required(self):
+        access = get_tokens_for_user(self.user)['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'gateway:wrong').decode())
+        self.assertEqual(self.introspect([access]).status_code, 401)
+        # A user's token is not a client credential
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+        self.assertEqual(self.introspect([access]).status_code, 401)
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, schema_dir)
+        overrides = override_settings(SCHEMA_DIR=schema_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.schema_dir = schema_dir
+        schema_store.clear()
+        self.addCleanup(schema_store.clear)
+
+    def test_generated_once_and_revalidated(self):
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        schema = json.loads(response.content)
+        # swagger_auto_schema annotations are applied
+        self.assertEqual(schema['paths']['/login/']['post']['description'], 'Login with email and password')
+        self.assertNotIn('host', schema)
+        self.assertIn('public', response['Cache-Control'])
+        response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip(self):
+        plain = self.client.get('/swagger.yaml')
+        response = self.client.get('/swagger.yaml', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_serves_build(self):
+        build(self.schema_dir)
+        with open(os.path.join(self.schema_dir, 'swagger.json'), 'rb') as f:
+            built = f.read()
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.content, built)
+
+    def test_ignores_build_for_other_code(self):
+        build(self.schema_dir)
+        with open(os.path.join(self.schema_dir, 'swagger.json'), 'wb') as f:
+            f.write(b'{}')
+        with open(os.path.join(self.schema_dir, 'manifest.json'), 'w') as f:
+            json.dump({'version': 'elsewhere'}, f)
+        with self.assertLogs('core.schema', 'WARNING'):
+            response = self.client.get('/swagger.json')
+        self.assertIn('paths', json.loads(response.content))
+
+
+class StartupReportTests(TestCase):
+    def report(self, **env):
+        out = StringIO()
+        with mock.patch.dict(os.environ, env):
+            call_command('startup_report', '--json', '--top', '3', stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_lazy_docs(self):
+        report = self.report(LAZY_DOCS='true')
+        self.assertFalse(report['docs_loaded'])
+        self.assertGreater(report['rss'], 0)
+        self.assertEqual(len(report['packages']), 3)
+        self.assertTrue(self.report(LAZY_DOCS='false')['docs_loaded'])
+
+
+class JSONEngineTests(TestCase):
+    PAYLOADS = [
+        {'success': True, 'message': 'Login successful', 'tokens': {
+            'access': 'eyJhbGciOiJIUzI1NiJ9.eyJ1c2VyX2lkIjoxfQ.c2ln',
+            'refresh': 'eyJhbGciOiJIUzI1NiJ9.eyJ0b2tlbl90eXBlIjoicmVmcmVzaCJ9.c2ln',
+        }},
+        {'success': False, 'message': 'Validation failed', 'error': {
+            'email': [ErrorDetail('Enter a valid email address.', code='invalid')],
+            'non_field_errors': [gettext_lazy('Passwords do not match')],
+        }},
+        {'joined': timezone.now(), 'day': timezone.now().date(), 'id': uuid.uuid4(), 'tags': {'a'}},
+        {'text': 'line\u2028break\u2029 \u00e9\u4e2d \U0001f600 "quoted" \\ \x00\x1f\x7f'},
+        {'floats': [1.5, 1e16, 1e-05, -0.0], 'decimal': Decimal('1.10'), 'note': 'v1.2e3'},
+        {'big': 2 ** 64, 'small': -2 ** 63, 1: 'int key', None: 'none key'},
+        [], {}, 'string', 0, True,
+    ]
+
+    def test_renders_like_stock_renderer(self):
+        for data in self.PAYLOADS:
+            with self.subTest(data=data):
+                self.assertEqual(JSONRenderer().render(data), renderers.JSONRenderer().render(data))
+        self.assertEqual(JSONRenderer().render(None), b'')
+        indented = JSONRenderer().render(self.PAYLOADS[0], 'application/json; indent=2')
+        self.assertEqual(indented, renderers.JSONRenderer().render(self.PAYLOADS[0], 'application/json; indent=2'))
+
+    def test_refuses_what_stock_renderer_refuses(self):
+        with self.assertRaises(TypeError):
+            JSONRenderer().render({'value': object()})
+
+    def test_parses_like_stock_parser(self):
+        bodies = [
+            b'{"email":"ada@example.com","password":"correct-horse-42"}',
+            b'{"n":18446744073709551616,"f":1e400,"s":"\\ud800","u":"\\u00e9\xc3\xa9"}',
+            b'[1, 2.5, -0.0, true, false, null]',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                expected = parsers.JSONParser().parse(io.BytesIO(body))
+                self.assertEqual(repr(JSONParser().parse(io.BytesIO(body))), repr(expected))
+        for body in (b'', b'{"a":1,}', b'NaN', b'\xef\xbb\xbf{}'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as stock:
+                    parsers.JSONParser().parse(io.BytesIO(body))
+                with self.assertRaises(ParseError) as fast:
+                    JSONParser().parse(io.BytesIO(body))
+                self.assertEqual(str(fast.exception), str(stock.exception))
+
+
+class FastUserSerializerTests(TestCase):
+    def test_same_output_as_user_serializer(self):
+        users = [
+            User.objects.create_user(
+                email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace',
+            ),
+            User(email='grace@example.com', first_name='Grace', last_name=None),
+        ]
+        for user in users:
+            with self.subTest(user=user.email):
+                data = FastUserSerializer(user).data
+                self.assertEqual(data, UserSerializer(user).data)
+                self.assertEqual(list(data), list(UserSerializer(user).data))
+                self.assertIs(type(data), dict)
+
+    def test_same_error_as_user_serializer(self):
+        with self.assertRaises(AttributeError) as stock:
+            UserSerializer(object()).data
+        with self.assertRaises(AttributeError) as fast:
+            FastUserSerializer(object()).data
+        self.assertEqual(str(fast.exception), str(stock.exception))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class EmailCaseTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        self.client = APIClient()
+        User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def test_login_ignores_case(self):
+        response = self.client.post('/api/v1/auth/login/', {
+            'email': 'Ada@Example.com', 'password': PASSWORD,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_registration_ignores_case(self):
+        response = self.client.post('/api/v1/auth/register/', {
+            'email': 'ADA@example.com', 'password': PASSWORD, 'first_name': 'Ada', 'last_name': 'King',
+        }, format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.json()['error']['email'], ['user with this email already exists.'])
+
+    def test_addresses_differing_in_case_are_refused_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(email='Ada@example.com', password=PASSWORD, first_name='Ada', last_name='King')
+
+    def test_registration_racing_a_case_variant(self):
+        # Another request registered the address after validate_email checked
+        with mock.patch.object(UserRegistrationSerializer, 'validate_email', side_effect=lambda value: value):
+            response = self.client.post('/api/v1/auth/register/', {
+                'email': 'ADA@example.com', 'password': PASSWORD, 'first_name': 'Ada', 'last_name': 'King',
+            }, format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.json()['error']['email'], ['user with this email already exists.'])
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_explain_queries(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        plans = out.getvalue()
+        self.assertIn('authapi_user_email_lower_uniq', plans.split('email lookup', 1)[1].split('\n\n', 1)[0])
+        self.assertIn('authapi_blacklist_expiry_idx', plans)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    DATABASE_REPLICAS=['replica'],
+    DATABASE_ROUTERS=['core.db_router.PrimaryReplicaRouter'],
+    MIDDLEWARE=['core.middleware.ReplicaRoutingMiddleware', *settings.MIDDLEWARE],
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Against a second SQLite database standing in for a replica. Nothing
+    replicates to it: tests copy rows over, so it shows what a lagging
+    replica would serve. It is added after the test runner has set up the
+    test databases, hence '__all__' rather than naming it.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        add_sqlite_database(cls, 'replica')
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        user_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+        self.replicate(self.user, first_name='Stale')
+        # Forget the pins left by the setup writes
+        cache.clear()
+
+    def replicate(self, user, **changes):
+        values = {**User.objects.using('default').filter(pk=user.pk).values()[0], **changes}
+        User.objects.using('replica').bulk_create([User(**values)])
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(self.user)['access'])
+
+    def test_profile_is_read_from_the_replica_until_the_user_writes(self):
+        self.authenticate()
+        response = self.client.get('/api/v1/auth/profile/')
+        self.assertEqual(response.json()['user']['first_name'], 'Stale')
+
+        response = self.client.patch('/api/v1/auth/profile/', {'first_name': 'Augusta'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(User.objects.using('default').get(pk=self.user.pk).first_name, 'Augusta')
+        self.assertEqual(User.objects.using('replica').get(pk=self.user.pk).first_name, 'Stale')
+
+        response = self.client.get('/api/v1/auth/profile/')
+        self.assertEqual(response.json()['user']['first_name'], 'Augusta')
+
+    def test_verification_after_registration_reads_the_primary(self):
+        response = self.client.post('/api/v1/auth/register/', {
+            'email': 'grace@example.com', 'password': PASSWORD, 'first_name': 'Grace', 'last_name': 'Hopper',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(User.objects.using('replica').filter(email='grace@example.com').exists())
+        code = User.objects.using('default').get(email='grace@example.com').email_verification_code
+
+        response = self.client.post('/api/v1/auth/verify-otp/', {
+            'email': 'grace@example.com', 'otp': code,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        # Once the pin has expired the replica answers again
+        cache.clear()
+        response = self.client.post('/api/v1/auth/login/', {
+            'email': 'grace@example.com', 'password': PASSWORD,
+        }, format='json')
+        self.assertEqual(response.status_code, 404, response.content)
+
+    @override_settings(REPLICA_PIN_SECONDS=0.05)
+    def test_pin_expires(self):
+        db_router.pin('user:1')
+        tokens = db_router.begin_request()
+        try:
+            db_router.read_your_writes('user:1')
+            self.assertEqual(router.db_for_read(User), 'default')
+        finally:
+            db_router.end_request(tokens)
+        time.sleep(0.1)
+        tokens = db_router.begin_request()
+        try:
+            db_router.read_your_writes('user:1')
+            self.assertEqual(router.db_for_read(User), 'replica')
+        finally:
+            db_router.end_request(tokens)
+
+    def test_primary_reads(self):
+        tokens = db_router.begin_request()
+        try:
+            self.assertEqual(router.db_for_read(User), 'replica')
+            self.assertEqual(router.db_for_read(BlacklistedToken), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(User), 'default')
+            User.objects.filter(pk=self.user.pk).update(first_name='Augusta')
+            self.assertEqual(router.db_for_read(User), 'default')
+        finally:
+            db_router.end_request(tokens)
+        self.assertEqual(router.db_for_write(User), 'default')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BlacklistIndexTests(TestCase):
+    """Each BlacklistIndex stands in for the index of one worker."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+        self.index = BlacklistIndex(max_staleness=3600)
+        self.index.sync()
+
+    def blacklist(self, token, id=None, age=0, expires_in=3600):
+        row = BlacklistedToken.objects.create(
+            id=id, token_digest=token_digest(token), user=self.user,
+            expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+        if age:
+            BlacklistedToken.objects.filter(pk=row.pk).update(
+                blacklisted_at=timezone.now() - timedelta(seconds=age),
+            )
+        return token_digest(token)
+
+    def test_row_from_another_worker_is_seen_after_sync(self):
+        key = self.blacklist('token-a', age=60)
+        # Within max_staleness the index is trusted as it is
+        self.assertFalse(self.index.contains(key))
+        self.index.sync()
+        self.assertTrue(self.index.contains(key))
+        self.assertEqual(self.index._cursor, BlacklistedToken.objects.get().pk)
+
+    def test_row_committed_late_within_grace_is_picked_up(self):
+        young = self.blacklist('token-b', id=10)
+        self.index.sync()
+        self.assertTrue(self.index.contains(young))
+        # Not past the young row, so a smaller id committing after it is read
+        self.assertEqual(self.index._cursor, 0)
+        late = self.blacklist('token-a', id=5, age=1)
+        self.index.sync()
+        self.assertTrue(self.index.contains(late))
+
+    def test_expired_entries_are_pruned(self):
+        key = token_digest('token-a')
+        self.index.add(key, timezone.now() - timedelta(seconds=1))
+        self.index.add(token_digest('token-b'), timezone.now() + timedelta(hours=1))
+        self.assertFalse(self.index.contains(key))
+        self.index.sync()
+        self.assertNotIn(key, self.index._entries)
+        self.assertIn(token_digest('token-b'), self.index._entries)
+
+    def test_fresh_check_reads_the_database(self):
+        keys = [self.blacklist('token-a', age=60), token_digest('token-b')]
+        self.assertEqual(self.index.contains_many(keys), set())
+        self.assertEqual(self.index.contains_many(keys, fresh=True), {keys[0]})
+        # and is remembered
+        self.assertEqual(self.index.contains_many(keys), {keys[0]})
+
+
+class BlacklistDigestMigrationTests(TransactionTestCase):
+    """0005 on a database of its own, since it cannot be unapplied."""
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        add_sqlite_database(cls, 'migrations')
+        super().setUpClass()
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connections['migrations'])
+        executor.migrate(targets or executor.loader.graph.leaf_nodes())
+        return executor.loader.project_state(targets).apps if targets else None
+
+    def test_raw_token_rows_stay_blacklisted(self):
+        apps = self.migrate([('authapi', '0004_blacklistedtoken')])
+        user = apps.get_model('authapi', 'User').objects.using('migrations').create(
+            email='ada@example.com', account_id='A1', first_name='Ada', last_name='Lovelace',
+        )
+        raw = str(RefreshToken.for_user(User(pk=user.pk)))
+        apps.get_model('authapi', 'BlacklistedToken').objects.using('migrations').create(
+            token=raw, user_id=user.pk, expires_at=timezone.now() + timedelta(days=1),
+        )
+        self.migrate(None)
+        # The lookup BlacklistIndex.contains_many(fresh=True) makes
+        self.assertTrue(
+            BlacklistedToken.objects.using('migrations').filter(
+                token_digest=token_digest(raw), expires_at__gt=timezone.now(),
+            ).exists()
+        )
+        row = BlacklistedToken.objects.using('migrations').get()
+        self.assertEqual(row.expiry_day, row.expires_at.date())
+
+
+class EmailUniquenessMigrationTests(TransactionTestCase):
+    """0010 on a database of its own."""
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        add_sqlite_database(cls, 'email_migrations')
+        super().setUpClass()
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connections['email_migrations'])
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_refuses_addresses_differing_in_case(self):
+        apps = self.migrate([('authapi', '0009_user_email_lower_idx')])
+        users = apps.get_model('authapi', 'User').objects.using('email_migrations')
+        for n, email in enumerate(['ada@example.com', 'Ada@example.com', 'grace@example.com']):
+            users.create(email=email, account_id=f'A{n}', first_name='Ada', last_name='Lovelace')
+        with self.assertRaisesMessage(RuntimeError, 'resolve them before migrating: ada@example.com'):
+            self.migrate([('authapi', '0010_user_email_lower_uniq')])
+
+        users.filter(email='Ada@example.com').delete()
+        apps = self.migrate([('authapi', '0010_user_email_lower_uniq')])
+        with self.assertRaises(IntegrityError):
+            apps.get_model('authapi', 'User').objects.using('email_migrations').create(
+                email='GRACE@example.com', account_id='A3', first_name='Grace', last_name='Hopper',
+            )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BlacklistPurgeTests(TestCase):
+    NOW = datetime(2026, 1, 10, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def create(self, *expires_at):
+        return BlacklistedToken.objects.bulk_create([
+            BlacklistedToken(token_digest=uuid.uuid4().bytes * 2, user=self.user, expires_at=when)
+            for when in expires_at
+        ])
+
+    def create_mix(self):
+        # 5 rows expired yesterday, 2 earlier today, 3 still valid
+        self.create(*[self.NOW - timedelta(days=1)] * 5, *[self.NOW - timedelta(hours=1)] * 2)
+        self.create(*[self.NOW + timedelta(hours=1)] * 3)
+
+    def test_expiry_day_follows_expires_at_on_every_write_path(self):
+        row, = self.create(datetime(2026, 1, 9, 23, 30, tzinfo=dt_timezone(timedelta(hours=-2))))
+        self.assertEqual(BlacklistedToken.objects.get(pk=row.pk).expiry_day, datetime(2026, 1, 10).date())
+
+        BlacklistedToken.objects.filter(pk=row.pk).update(expires_at=self.NOW + timedelta(days=3))
+        self.assertEqual(BlacklistedToken.objects.get(pk=row.pk).expiry_day, datetime(2026, 1, 13).date())
+
+        BlacklistedToken.objects.filter(pk=row.pk).update(expires_at=F('expires_at') - timedelta(days=2))
+        self.assertEqual(BlacklistedToken.objects.get(pk=row.pk).expiry_day, datetime(2026, 1, 11).date())
+
+        row.expires_at = self.NOW
+        BlacklistedToken.objects.bulk_update([row], ['expires_at'])
+        self.assertEqual(BlacklistedToken.objects.get(pk=row.pk).expiry_day, datetime(2026, 1, 10).date())
+
+        fixture = os.path.join(tempfile.mkdtemp(), 'blacklist.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(fixture))
+        with open(fixture, 'w') as f:
+            json.dump([{'model': 'authapi.blacklistedtoken', 'pk': 100, 'fields': {
+                'token_digest': base64.b64encode(bytes(32)).decode(), 'user': self.user.pk,
+                'blacklisted_at': '2026-01-01T00:00:00Z', 'expires_at': '2026-01-02T01:00:00Z',
+            }}], f)
+        call_command('loaddata', fixture, verbosity=0)
+        self.assertEqual(BlacklistedToken.objects.get(pk=100).expiry_day, datetime(2026, 1, 2).date())
+
+    def test_purge_in_chunks(self):
+        self.create_mix()
+        report = purge_expired_tokens(chunk_size=2, bucketed=False, now=self.NOW)
+        self.assertEqual((report.rows, report.chunks, report.buckets), (7, 4, 0))
+        self.assertEqual(BlacklistedToken.objects.count(), 3)
+
+    def test_bucketed_purge_empties_past_days_in_chunks(self):
+        self.create_mix()
+        with self.assertNumQueries(10) as captured:
+            report = purge_expired_tokens(chunk_size=2, bucketed=True, now=self.NOW)
+        self.assertEqual((report.rows, report.chunks, report.buckets), (7, 4, 1))
+        self.assertEqual(BlacklistedToken.objects.count(), 3)
+        deletes = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 4)
+        self.assertTrue(all(sql.count(',') < 2 for sql in deletes), deletes)
+
+    def test_max_chunks(self):
+        self.create_mix()
+        report = purge_expired_tokens(chunk_size=2, max_chunks=2, bucketed=True, now=self.NOW)
+        self.assertEqual((report.rows, report.chunks, report.buckets), (4, 2, 0))
+
+    def test_command(self):
+        now = timezone.now()
+        self.create(*[now - timedelta(days=2)] * 3, now + timedelta(days=1))
+        out = StringIO()
+        call_command('purge_blacklist', '--chunk-size', '2', '--bucketed', stdout=out)
+        self.assertIn('Purged 3 expired blacklist rows', out.getvalue())
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    LAST_ACTIVITY_RESOLUTION=60,
+    LAST_ACTIVITY_BUFFER_SIZE=3,
+)
+class LastActivityRecorderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.recorder = LastActivityRecorder()
+        atexit.unregister(self.recorder.shutdown)
+        self.addCleanup(self.recorder.shutdown)
+        self.users = [
+            User.objects.create_user(
+                email=f'user{n}@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace',
+                is_active=True,
+            )
+            for n in range(3)
+        ]
+        self.now = timezone.now()
+
+    def stored(self, user):
+        return User.objects.values_list('last_activity', flat=True).get(pk=user.pk)
+
+    def test_buffered_until_flush(self):
+        user = self.users[0]
+        with self.assertNumQueries(0):
+            self.recorder.record(user, self.now)
+        self.assertIsNone(self.stored(user))
+        self.assertEqual(self.recorder.last_activity_for(user.pk), self.now)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.stored(user), self.now)
+
+    def test_updates_within_resolution_are_dropped(self):
+        user = self.users[0]
+        self.recorder.record(user, self.now)
+        self.recorder.flush()
+        self.recorder.record(user, self.now + timedelta(seconds=59))
+        self.assertEqual(user.last_activity, self.now)
+        self.assertEqual(self.recorder.flush(), 0)
+        self.recorder.record(user, self.now + timedelta(seconds=60))
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.stored(user), self.now + timedelta(seconds=60))
+
+    def test_full_buffer_is_flushed(self):
+        self.recorder.record(self.users[0], self.now)
+        self.recorder.record(self.users[1], self.now)
+        self.assertIsNone(self.stored(self.users[1]))
+        with self.assertNumQueries(1):
+            self.recorder.record(self.users[2], self.now)
+        self.assertEqual([self.stored(user) for user in self.users], [self.now] * 3)
+
+    def test_one_update_per_flush(self):
+        newer = self.now + timedelta(minutes=5)
+        # Written meanwhile by another worker, and kept
+        User.objects.filter(pk=self.users[0].pk).update(last_activity=newer)
+        for n, user in enumerate(self.users[:2]):
+            self.recorder.record_id(user.pk, self.now + timedelta(seconds=n))
+        with self.assertNumQueries(1) as captured:
+            self.assertEqual(self.recorder.flush(), 2)
+        self.assertTrue(captured.captured_queries[0]['sql'].startswith('UPDATE'))
+        self.assertEqual(self.stored(self.users[0]), newer)
+        self.assertEqual(self.stored(self.users[1]), self.now + timedelta(seconds=1))
+
+    def test_shutdown(self):
+        with self.assertNumQueries(0):
+            self.recorder.shutdown()
+
+        self.recorder.record_id(self.users[0].pk, self.now)
+        with mock.patch.object(self.recorder, '_write', side_effect=OperationalError('no such table')):
+            with self.assertLogs('authapi.activity', 'WARNING') as logs:
+                self.recorder.shutdown()
+        self.assertIn('Dropped 1 last_activity updates at exit', logs.output[0])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=30,
+)
+class OutboxTests(TestCase):
+    def queue(self, n=1):
+        return [queue_email(f'Subject {i}', 'Body', [f'user{i}@example.com']) for i in range(n)]
+
+    def test_queued_in_the_request_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = APIClient().post('/api/v1/auth/register/', {
+                'email': 'grace@example.com', 'password': PASSWORD, 'first_name': 'Grace', 'last_name': 'Hopper',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.recipients, ['grace@example.com'])
+        self.assertIn(outbox._wake_sender, callbacks)
+        self.assertEqual(mail.outbox, [])
+
+    def test_rolled_back_email_is_never_sent(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                self.queue()
+                1 / 0
+        self.assertEqual(callbacks, [])
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(drain_outbox(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_send_outbox_command(self):
+        self.queue(3)
+        out = StringIO()
+        call_command('send_outbox', '--batch-size', '2', stdout=out)
+        self.assertIn('Sent 3 emails', out.getvalue())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'user{i}@example.com' for i in range(3)])
+        self.assertFalse(OutboundEmail.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(set(OutboundEmail.objects.values_list('attempts', flat=True)), {1})
+        # Sent rows are not sent again
+        call_command('send_outbox', stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        email, = self.queue()
+        with mock.patch('authapi.outbox.EmailMessage.send', side_effect=ConnectionRefusedError('down')):
+            self.assertEqual(drain_outbox(), 0)
+            email.refresh_from_db()
+            self.assertEqual((email.attempts, email.last_error), (1, 'ConnectionRefusedError: down'))
+            self.assertAlmostEqual(
+                (email.send_after - timezone.now()).total_seconds(), 30, delta=5,
+            )
+            # Not due yet
+            self.assertEqual(claim_batch(10), [])
+
+            OutboundEmail.objects.update(send_after=timezone.now())
+            drain_outbox()
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, 2)
+            self.assertAlmostEqual((email.send_after - timezone.now()).total_seconds(), 60, delta=5)
+
+        OutboundEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(drain_outbox(), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 3)
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        email, = self.queue()
+        with mock.patch('authapi.outbox.EmailMessage.send', side_effect=ConnectionRefusedError('down')):
+            with self.assertLogs('authapi.outbox', 'ERROR') as logs:
+                for _ in range(3):
+                    OutboundEmail.objects.update(send_after=timezone.now())
+                    drain_outbox()
+        self.assertEqual(len(logs.output), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 3)
+        self.assertIsNotNone(email.failed_at)
+        OutboundEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(claim_batch(10), [])
+
+    def test_claimed_emails_are_leased_to_one_sender(self):
+        self.queue(3)
+        others = []
+
+        def send_while_another_sender_drains(message):
+            # Sender B polls while A is sending its claimed batch
+            others.append(drain_outbox())
+
+        with mock.patch('authapi.outbox.EmailMessage.send', autospec=True, side_effect=send_while_another_sender_drains):
+            claimed = claim_batch(10)
+            self.assertEqual(len(claimed), 3)
+            self.assertEqual(send_batch(claimed), 3)
+        self.assertEqual(others, [0, 0, 0])
+        lease = OutboundEmail.objects.get(pk=claimed[0].pk).send_after - timezone.now()
+        self.assertAlmostEqual(lease.total_seconds(), CLAIM_LEASE.total_seconds(), delta=5)
+
+    def test_body_is_cleared_once_sent_or_abandoned(self):
+        sent, failed = self.queue(2)
+
+        def send(message):
+            if message.to == [failed.recipients[0]]:
+                raise ConnectionRefusedError('down')
+
+        with mock.patch('authapi.outbox.EmailMessage.send', autospec=True, side_effect=send):
+            with self.assertLogs('authapi.outbox', 'ERROR'):
+                for _ in range(3):
+                    OutboundEmail.objects.update(send_after=timezone.now())
+                    drain_outbox()
+        sent.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertIsNotNone(sent.sent_at)
+        self.assertIsNotNone(failed.failed_at)
+        self.assertEqual((sent.body, failed.body), ('', ''))
+
+    def test_batch_stops_before_its_lease_runs_out(self):
+        self.queue(3)
+        claimed = claim_batch(10)
+        sends = []
+
+        def send(message):
+            sends.append(message.to)
+            if len(sends) == 2:
+                clock.return_value += timedelta(minutes=10)
+
+        now = timezone.now()
+        with mock.patch('authapi.outbox.EmailMessage.send', autospec=True, side_effect=send), \
+                mock.patch('authapi.outbox.timezone.now', return_value=now) as clock:
+            with self.assertLogs('authapi.outbox', 'WARNING') as logs:
+                self.assertEqual(send_batch(claimed, deadline=now + timedelta(minutes=1)), 2)
+            # The one not started is due again rather than when the lease ends
+            self.assertEqual([email.pk for email in claim_batch(10)], [claimed[2].pk])
+        self.assertIn('handing back 1 unsent', logs.output[0])
+        self.assertEqual(len(sends), 2)
+
+    def test_lease_outlasts_a_message(self):
+        self.assertGreater(outbox.claim_lease(), 2 * outbox.send_margin())
+        with self.settings(EMAIL_TIMEOUT=120):
+            self.assertGreaterEqual(outbox.claim_lease(), 2 * outbox.send_margin())
+            self.assertEqual(outbox.send_margin(), timedelta(seconds=1200))
+
+    @override_settings(EMAIL_OUTBOX_RETENTION=3600)
+    def test_purge_sent_emails(self):
+        old_sent, old_failed, recent, pending = self.queue(4)
+        long_ago = timezone.now() - timedelta(hours=2)
+        OutboundEmail.objects.filter(pk=old_sent.pk).update(sent_at=long_ago)
+        OutboundEmail.objects.filter(pk=old_failed.pk).update(failed_at=long_ago)
+        OutboundEmail.objects.filter(pk=recent.pk).update(sent_at=timezone.now())
+        OutboundEmail.objects.filter(pk=pending.pk).update(created_at=long_ago)
+        self.assertEqual(outbox.purge_sent_emails(), 2)
+        self.assertEqual(set(OutboundEmail.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+    def test_admin_body_is_read_only(self):
+        from django.contrib import admin
+
+        self.assertIn('body', admin.site._registry[OutboundEmail].readonly_fields)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    EMAIL_FILTER_PATH='',
+)
+class ConcurrentOutboxTests(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_concurrent_senders_do_not_double_send(self):
+        for i in range(40):
+            queue_email('Subject', 'Body', [f'user{i}@example.com'])
+        barrier = threading.Barrier(4)
+
+        def sender():
+            barrier.wait()
+            try:
+                drain_outbox(batch_size=5)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=sender) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted(f'user{i}@example.com' for i in range(40)))
+        self.assertEqual(OutboundEmail.objects.filter(sent_at__isnull=False).count(), 40)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    USER_CACHE_TTL=60,
+    USER_CACHE_SIZE=2,
+)
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(
+                email=f'user{n}@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace',
+                is_active=True,
+            )
+            for n in range(3)
+        ]
+        self.user = self.users[0]
+        # Another worker's cache; saves and deletes here go through the signal
+        # receivers, which invalidate the module's user_cache.
+        self.cache = UserCache()
+
+    def test_save_elsewhere_drops_entry(self):
+        self.cache.get(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get(self.user.pk).first_name, 'Ada')
+        self.user.first_name = 'Augusta'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cache.get(self.user.pk).first_name, 'Augusta')
+
+    def test_delete_elsewhere_drops_entry(self):
+        self.cache.get(self.user.pk)
+        User.objects.get(pk=self.user.pk).delete()
+        self.assertIsNone(self.cache.get(self.user.pk))
+
+    def test_entries_expire(self):
+        with mock.patch('authapi.user_cache.time.monotonic', return_value=1000.0):
+            self.cache.get(self.user.pk)
+        with mock.patch('authapi.user_cache.time.monotonic', return_value=1059.0), self.assertNumQueries(0):
+            self.cache.get(self.user.pk)
+        with mock.patch('authapi.user_cache.time.monotonic', return_value=1060.0), self.assertNumQueries(1):
+            self.cache.get(self.user.pk)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        first, second, third = (user.pk for user in self.users)
+        self.cache.get(first)
+        self.cache.get(second)
+        self.cache.get(first)
+        self.cache.get(third)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        with self.assertNumQueries(0):
+            self.cache.get(first)
+            self.cache.get(third)
+        with self.assertNumQueries(1):
+            self.cache.get(second)
+
+    def test_callers_get_copies(self):
+        user = self.cache.get(self.user.pk)
+        user.first_name = 'Changed'
+        user.is_active = False
+        other = self.cache.get(self.user.pk)
+        self.assertIsNot(other, user)
+        self.assertEqual((other.first_name, other.is_active), ('Ada', True))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class AsyncAuthenticationTests(TestCase):
+    """The async views authenticate exactly like the DRF ones."""
+
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        user_cache.clear()
+        blacklist_index.reset()
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def tokens(self):
+        expired = AccessToken.for_user(self.user)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        blacklisted = get_tokens_for_user(self.user)['access']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + blacklisted)
+        self.assertEqual(client.post('/api/v1/auth/logout/').status_code, 200)
+        return {
+            'valid': get_tokens_for_user(self.user)['access'],
+            'expired': str(expired),
+            'blacklisted': blacklisted,
+            'malformed': 'not.a.jwt',
+        }
+
+    def responses(self, token):
+        headers = {'Authorization': f'Bearer {token}'}
+        sync = UserProfileView.as_view()(RequestFactory().get('/api/v1/auth/profile/', headers=headers))
+        sync.render()
+        asynchronous = async_to_sync(AsyncUserProfileView.as_view())(
+            AsyncRequestFactory().get('/api/v1/auth/profile/', headers=headers),
+        )
+        return [
+            (response.status_code, json.loads(response.content), response.get('WWW-Authenticate'))
+            for response in (sync, asynchronous)
+        ]
+
+    def test_same_responses(self):
+        for name, token in self.tokens().items():
+            with self.subTest(name):
+                sync, asynchronous = self.responses(token)
+                self.assertEqual(asynchronous, sync)
+                self.assertEqual(sync[0], 200 if name == 'valid' else 401)
+
+    def test_same_errors(self):
+        authenticator = CustomJWTAuthentication()
+        for name, token in self.tokens().items():
+            if name == 'valid':
+                continue
+            with self.subTest(name):
+                with self.assertRaises(InvalidToken) as sync:
+                    authenticator.get_validated_token(token.encode())
+                with self.assertRaises(InvalidToken) as asynchronous:
+                    async_to_sync(authenticator.aget_validated_token)(token.encode())
+                self.assertEqual(asynchronous.exception.detail, sync.exception.detail)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+    PASSWORD_HASHING_THREADS=1,
+    PASSWORD_HASHING_QUEUE_DEPTH=1,
+)
+class HashingServiceTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        user_cache.clear()
+        self.service = HashingService()
+        patcher = mock.patch('authapi.views.hashing_service', self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: self.service._executor and self.service._executor.shutdown())
+        self.user = User.objects.create_user(
+            email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def login(self):
+        return APIClient().post('/api/v1/auth/login/', {'email': 'ada@example.com', 'password': PASSWORD}, format='json')
+
+    def test_full_queue_is_refused_with_retry_after(self):
+        self.assertEqual(self.login().status_code, 200)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        # One job on the thread, one queued: workers + queue_depth
+        busy = [self.service.submit(release.wait) for _ in range(2)]
+        with self.assertLogs('authapi.hashing', 'WARNING'):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.service.stats()['rejected'], 1)
+
+        release.set()
+        for future in busy:
+            future.result()
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_hash_upgrade_is_saved_on_the_callers_connection(self):
+        # Hashed with a hasher that is no longer preferred
+        User.objects.filter(pk=self.user.pk).update(
+            password=PBKDF2PasswordHasher().encode(PASSWORD, 'salt', iterations=1),
+        )
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1) as captured:
+            self.assertTrue(self.service.check_password(user, PASSWORD))
+        self.assertTrue(captured.captured_queries[0]['sql'].startswith('UPDATE'))
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('md5$'))
+        self.assertEqual(user.password, User.objects.get(pk=self.user.pk).password)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.service.check_password(user, PASSWORD))
+            self.assertFalse(self.service.check_password(user, 'wrong-horse'))
+
+    def test_async_hash_upgrade(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=PBKDF2PasswordHasher().encode(PASSWORD, 'salt', iterations=1),
+        )
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(async_to_sync(self.service.acheck_password)(user, PASSWORD))
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('md5$'))
+
+
+def might_exist_in_child(email):
+    """EmailFilter.might_exist() in a forked process, with its own mapping of the file."""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    child = context.Process(target=lambda: results.put(EmailFilter().might_exist(email)))
+    child.start()
+    child.join(10)
+    return results.get(timeout=1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_CAPACITY=100,
+)
+class EmailFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        override = self.settings(EMAIL_FILTER_PATH=os.path.join(tmp, 'email_filter.bin'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.create('ada@example.com')
+
+    def create(self, email):
+        return User.objects.create_user(
+            email=email, password=PASSWORD, first_name='Ada', last_name='Lovelace', is_active=True,
+        )
+
+    def test_unknown_email_skips_the_query(self):
+        with self.assertNumQueries(1):
+            self.assertRaises(User.DoesNotExist, email_filter.get_user, 'nobody@example.com')
+        email_filter.rebuild()
+        with self.assertNumQueries(0):
+            self.assertRaises(User.DoesNotExist, email_filter.get_user, 'nobody@example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(email_filter.get_user('Ada@Example.com').email, 'ada@example.com')
+
+    def test_registration_is_seen_by_other_processes(self):
+        email_filter.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/v1/auth/register/', {
+                'email': 'Grace@example.com', 'password': PASSWORD, 'first_name': 'Grace', 'last_name': 'Hopper',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(might_exist_in_child('grace@example.com'))
+        self.assertFalse(might_exist_in_child('nobody@example.com'))
+        # Counted once, though added on save and again on commit
+        self.assertEqual(email_filter.stats()['count'], 2)
+
+    def test_rebuild_keeps_adds_made_while_it_runs(self):
+        other_worker = EmailFilter()
+        added = []
+
+        class AddsMeanwhile(BloomFilter):
+            def add(self, item):
+                if not added:
+                    # Another worker registers a user the rebuild's query did not see
+                    added.append(True)
+                    other_worker.add('late@example.com')
+                super().add(item)
+
+        with mock.patch('authapi.email_filter.BloomFilter', AddsMeanwhile):
+            self.assertEqual(email_filter.rebuild(), 2)
+        self.assertTrue(added)
+        self.assertTrue(email_filter.might_exist('late@example.com'))
+        self.assertTrue(might_exist_in_child('late@example.com'))
+        self.assertFalse(os.path.exists(email_filter.path + '.journal'))
+
+    @override_settings(EMAIL_FILTER_CAPACITY=2)
+    def test_overfull_filter_is_rebuilt(self):
+        email_filter.rebuild()
+        self.assertEqual(email_filter.stats()['capacity'], 2)
+        with mock.patch.object(EmailFilter, 'rebuild_in_background') as rebuild:
+            self.create('grace@example.com')
+            rebuild.assert_not_called()
+            with self.assertLogs('authapi.email_filter', 'WARNING') as logs:
+                self.create('hedy@example.com')
+            self.create('joan@example.com')
+        rebuild.assert_called_once_with()
+        self.assertIn('holds 3 emails, over its capacity of 2', logs.output[0])
+
+        email_filter.rebuild()
+        self.assertEqual(email_filter.stats()['capacity'], 8)
+
+
+class AccountIdAllocatorTests(TestCase):
+    FORMAT = re.compile(r'^[GHJKMNPQ][0-9ABCDEFGHJKMNPQRSTVWXYZ]{9}$')
+
+    def allocator(self):
+        """An allocator whose leases are pooled at once, as outside a transaction."""
+        allocator = AccountIdAllocator()
+        with self.captureOnCommitCallbacks(execute=True):
+            allocator.allocate()
+        return allocator
+
+    def test_permutation_is_a_bijection_over_a_block(self):
+        allocator = AccountIdAllocator()
+        values = range(12345 << BLOCK_BITS, 12346 << BLOCK_BITS)
+        permuted = {allocator.permute(value) for value in values}
+        self.assertEqual(len(permuted), len(values))
+        self.assertLess(max(permuted), 1 << VALUE_BITS)
+        # Consecutive values are spread over the whole space
+        self.assertGreater(max(permuted) - min(permuted), 1 << (VALUE_BITS - 1))
+
+    def test_crockford_format(self):
+        self.assertEqual(AccountIdAllocator.encode(0), 'G000000000')
+        self.assertEqual(AccountIdAllocator.encode(31), 'G00000000Z')
+        self.assertEqual(AccountIdAllocator.encode((1 << VALUE_BITS) - 1), 'QZZZZZZZZZ')
+        self.assertEqual(
+            [AccountIdAllocator.encode(prefix << 45)[0] for prefix in range(len(PREFIXES))], list(PREFIXES),
+        )
+        for account_id in self.allocator().allocate(1000):
+            self.assertRegex(account_id, self.FORMAT)
+            # Never a hex digit first, unlike the legacy uuid4-hex IDs
+            self.assertNotIn(account_id[0], '0123456789abcdefABCDEF')
+
+    def test_leases_do_not_overlap(self):
+        first, second = self.allocator(), self.allocator()
+        ids = []
+        for _ in range(3):
+            ids += first.allocate(40000) + second.allocate(40000)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_rolled_back_lease_is_not_reused(self):
+        allocator = AccountIdAllocator()
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            rolled_back = allocator.allocate()
+            1 / 0
+        # The counter rolled back, so another worker leases the same block
+        other = AccountIdAllocator()
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = other.allocate(100)
+        self.assertEqual(ids[0], rolled_back)
+        # and this one leases a new block rather than handing out the rest
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as captured:
+            ids += allocator.allocate(100)
+        self.assertTrue(any(query['sql'].startswith('UPDATE "authapi_idsequence"') for query in captured))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_committed_lease_is_pooled(self):
+        allocator = self.allocator()
+        with self.assertNumQueries(0):
+            allocator.allocate(100)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class UserImportTests(TestCase):
+    def setUp(self):
+        self.hash = make_password(PASSWORD)
+
+    def csv(self, *lines):
+        return '\n'.join(['email,first_name,last_name,password_hash', *lines]) + '\n'
+
+    def run_import(self, text, fmt='csv', batch_size=1000):
+        rejects = StringIO()
+        report = UserImporter(batch_size=batch_size, workers=1, rejects=rejects).run(read_rows(StringIO(text), fmt))
+        return report, [json.loads(line) for line in rejects.getvalue().splitlines()]
+
+    def test_extra_and_missing_fields_are_rejected(self):
+        report, rejects = self.run_import(self.csv(
+            f'ada@example.com,Ada,Lovelace,{self.hash}',
+            f'grace@example.com,Grace,Hopper,{self.hash},extra',
+            'hedy@example.com,Hedy',
+            f'joan@example.com,Joan,Clarke,{self.hash}',
+        ))
+        self.assertEqual((report.rows, report.imported, report.rejected), (4, 2, 2))
+        self.assertEqual(
+            [(reject['line'], reject['error']) for reject in rejects],
+            [(3, 'Row has more fields than the header'), (4, 'Row has fewer fields than the header')],
+        )
+        self.assertNotIn(self.hash, json.dumps(rejects))
+        self.assertEqual(
+            sorted(User.objects.values_list('email', flat=True)), ['ada@example.com', 'joan@example.com'],
+        )
+        self.assertTrue(User.objects.get(email='ada@example.com').check_password(PASSWORD))
+
+    def test_emails_differing_in_case_are_duplicates(self):
+        User.objects.create_user(email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace')
+        report, rejects = self.run_import(self.csv(
+            f'ADA@example.com,Ada,Lovelace,{self.hash}',
+            f'grace@example.com,Grace,Hopper,{self.hash}',
+            f'Grace@Example.com,Grace,Hopper,{self.hash}',
+        ))
+        self.assertEqual((report.imported, report.rejected), (1, 2))
+        self.assertEqual(
+            sorted(reject['error'] for reject in rejects), ['Duplicate email in input', 'Email already registered'],
+        )
+
+    def test_bad_rows_do_not_abort_the_run(self):
+        report, rejects = self.run_import('\n'.join([
+            json.dumps({'email': 'ada@example.com', 'password_hash': 'not-a-hash'}),
+            json.dumps({'email': 'grace@example.com', 'password': 42}),
+            json.dumps({'email': 'hedy@example.com', 'password_hash': ['md5$x$y']}),
+            '{"email": ',
+            json.dumps(['joan@example.com']),
+            json.dumps({'email': 'joan@example.com', 'first_name': 'Joan', 'password_hash': self.hash}),
+        ]), fmt='jsonl')
+        self.assertEqual((report.rows, report.imported, report.rejected), (6, 1, 5))
+        self.assertEqual([reject['error'] for reject in rejects][:3], [
+            'password_hash is not in a known hasher format',
+            'password must be a string',
+            'password_hash must be a string',
+        ])
+        self.assertTrue(User.objects.filter(email='joan@example.com').exists())
+
+    def test_resumed_import_skips_rows_already_imported(self):
+        lines = [f'user{n}@example.com,User,{n},{self.hash}' for n in range(5)]
+        self.run_import(self.csv(*lines[:3]), batch_size=2)
+        report, rejects = self.run_import(self.csv(*lines), batch_size=2)
+        self.assertEqual((report.imported, report.rejected, report.batches), (2, 3, 3))
+        self.assertEqual({reject['error'] for reject in rejects}, {'Email already registered'})
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(len(set(User.objects.values_list('account_id', flat=True))), 5)
+
+    def test_command(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'users.csv')
+        with open(path, 'w', newline='') as f:
+            f.write(self.csv(f'ada@example.com,Ada,Lovelace,{self.hash}', 'grace@example.com,Grace'))
+        out = StringIO()
+        call_command('import_users', path, '--workers', '1', stdout=out)
+        self.assertIn('Imported 1 users, rejected 1 of 2 rows', out.getvalue())
+        with open(path + '.rejects.jsonl') as f:
+            self.assertEqual(json.loads(f.read())['error'], 'Row has fewer fields than the header')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class UserExportTests(TestCase):
+    def setUp(self):
+        self.addCleanup(activity_recorder.reset)
+        cache.clear()
+        user_cache.clear()
+        self.users = [
+            User.objects.create_user(
+                email=f'user{n}@example.com', password=PASSWORD, first_name=f'First\n"{n}", line',
+                last_name='Last', is_active=True,
+            )
+            for n in range(5)
+        ]
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, 'users')
+
+    def export(self, fmt, *args):
+        call_command('export_users', '--output', self.path, '--format', fmt, '--chunk-size', '2', *args, stderr=StringIO())
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_keyset_pagination(self):
+        # Chunks of 2, 2 and 1 rows
+        with self.assertNumQueries(3) as captured:
+            rows = list(iter_rows('users', chunk_size=2))
+        self.assertEqual([row['id'] for row in rows], [user.pk for user in self.users])
+        self.assertIn('"authapi_user"."id" > %d' % self.users[1].pk, captured.captured_queries[1]['sql'])
+        self.assertEqual([row['email'] for row in iter_rows('users', after_id=self.users[2].pk)], [
+            'user3@example.com', 'user4@example.com',
+        ])
+        self.assertNotIn('password_hash', rows[0])
+
+    def test_resume_with_newlines_in_fields(self):
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt):
+                complete = self.export(fmt)
+                # Interrupted inside the quoted, multi-line first_name of the
+                # fourth user
+                cut = complete.index(b'First\\n\\"3' if fmt == 'jsonl' else b'First\n""3""') + 8
+                with open(self.path, 'wb') as f:
+                    f.write(complete[:cut])
+                self.assertEqual(resume_point(self.path, fmt), self.users[2].pk)
+                self.assertEqual(self.export(fmt, '--resume'), complete)
+
+    def test_resume_point_of_header_only(self):
+        with open(self.path, 'w') as f:
+            f.write('id,account_id,email\n')
+        self.assertIsNone(resume_point(self.path, 'csv'))
+
+    def test_staff_only_view(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/auth/export/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(self.users[0])['access'])
+        self.assertEqual(client.get('/api/v1/auth/export/').status_code, 403)
+
+        self.users[0].is_staff = True
+        self.users[0].save()
+        response = client.get('/api/v1/auth/export/', {'output': 'jsonl', 'after_id': self.users[3].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['email'] for row in rows], ['user4@example.com'])
+        self.assertEqual(client.get('/api/v1/auth/export/', {'dataset': 'secrets'}).status_code, 400)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_FILTER_PATH='',
+)
+class GCRAThrottleTests(TestCase):
+    # LoginRateThrottle: 5/hour, one request every 720 s
+    INTERVAL = 720
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1_000_000.0
+        self.request = SimpleNamespace(data={'email': 'ada@example.com'}, META={'REMOTE_ADDR': '10.0.0.1'})
+
+    def allow(self, at=None):
+        throttle = LoginRateThrottle()
+        throttle.timer = lambda: self.now + (at or 0)
+        return throttle.allow_request(self.request, None), throttle.wait()
+
+    def test_burst_then_refusal(self):
+        self.assertEqual([self.allow()[0] for _ in range(5)], [True] * 5)
+        self.assertEqual(self.allow(), (False, self.INTERVAL))
+        # Refused requests are not counted
+        self.assertEqual(self.allow(1), (False, self.INTERVAL - 1))
+
+    def test_recovery_after_the_emission_interval(self):
+        for _ in range(5):
+            self.allow()
+        self.assertFalse(self.allow(self.INTERVAL - 1)[0])
+        self.assertTrue(self.allow(self.INTERVAL)[0])
+        self.assertEqual(self.allow(self.INTERVAL), (False, self.INTERVAL))
+        # Idle for a whole period: the full burst again
+        self.assertEqual([self.allow(6 * self.INTERVAL)[0] for _ in range(6)], [True] * 5 + [False])
+
+    def test_configured_rates(self):
+        self.assertEqual(
+            [(throttle().num_requests, throttle().duration) for throttle in (
+                AnonRateThrottle, UserRateThrottle, SignupRateThrottle, LoginRateThrottle,
+            )],
+            [(5, 60), (10, 60), (5, 3600), (5, 3600)],
+        )
+
+    def test_login_is_throttled(self):
+        client = APIClient(REMOTE_ADDR='10.0.0.2')
+        User.objects.create_user(email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace')
+        for _ in range(5):
+            response = client.post('/api/v1/auth/login/', {'email': 'ada@example.com', 'password': 'wrong'}, format='json')
+            self.assertEqual(response.status_code, 401)
+        response = client.post('/api/v1/auth/login/', {'email': 'ada@example.com', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_email_case_variants_share_a_budget(self):
+        client = APIClient(REMOTE_ADDR='10.0.0.3')
+        User.objects.create_user(email='ada@example.com', password=PASSWORD, first_name='Ada', last_name='Lovelace')
+        variants = ['ada@example.com', 'ADA@example.com', 'ada@EXAMPLE.com', ' Ada@Example.Com ']
+        statuses = []
+        for email in variants * 2:
+            response = client.put('/api/v1/auth/password-reset/', {
+                'email': email.strip(), 'otp': '000000', 'new_password': PASSWORD, 'confirm_password': PASSWORD,
+            }, format='json')
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [400] * 5 + [429] * 3)
+
+    def test_key_ignores_case_and_surrounding_space(self):
+        keys = {
+            LoginRateThrottle().get_cache_key(SimpleNamespace(data={'email': email}), None)
+            for email in ('ada@example.com', 'ADA@Example.COM', ' ada@example.com ')
+        }
+        self.assertEqual(keys, {'throttle_gcra_login_ada@example.com'})
+
+
+class SharedMemoryCacheTests(SimpleTestCase):
+    THREADS = 8
+    PROCESSES = 4
+    INCREMENTS = 1000
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, 'cache.bin')
+        override = self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shm': {'BACKEND': 'core.shm_cache.SharedMemoryCache', 'LOCATION': self.path, 'OPTIONS': {'MAX_ENTRIES': 1000}},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.close)
+
+    def close(self):
+        for key in [key for key in shm_cache._shared_files if key[0] == self.path]:
+            os.close(shm_cache._shared_files.pop(key).fd)
+
+    def in_threads(self, work):
+        barrier = threading.Barrier(self.THREADS)
+
+        def run():
+            barrier.wait()
+            work(caches['shm'])
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_incr_is_atomic_across_threads(self):
+        caches['shm'].set('counter', 0)
+        instances, files = set(), set()
+
+        def work(cache):
+            for _ in range(self.INCREMENTS):
+                cache.incr('counter')
+            instances.add(id(cache))
+            files.add(id(cache._shared))
+
+        self.in_threads(work)
+        self.assertEqual(caches['shm'].get('counter'), self.THREADS * self.INCREMENTS)
+        # One backend instance per thread, all on one fd and mapping
+        self.assertEqual(len(instances), self.THREADS)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(len([key for key in shm_cache._shared_files if key[0] == self.path]), 1)
+
+    def test_long_keys_are_stored_hashed(self):
+        shm = caches['shm']
+        long_key, other_key = 'x' * 240, 'x' * 239 + 'y'
+        shm.set(long_key, 1)
+        self.assertEqual(shm.get(long_key), 1)
+        self.assertIsNone(shm.get(other_key))
+        self.assertTrue(shm.add(other_key, 2))
+        self.assertFalse(shm.add(long_key, 3))
+        self.assertEqual(shm.incr(long_key), 2)
+        self.assertEqual((shm.get(long_key), shm.get(other_key)), (2, 2))
+        self.assertTrue(shm.delete(long_key))
+        self.assertIsNone(shm.get(long_key))
+
+    def test_long_email_throttle_key_is_kept(self):
+        request = SimpleNamespace(data={'email': 'a' * 200 + '@example.com'}, META={'REMOTE_ADDR': '10.0.0.1'})
+        with mock.patch.object(LoginRateThrottle, 'cache', caches['shm']):
+            allowed = [LoginRateThrottle().allow_request(request, None) for _ in range(6)]
+        self.assertEqual(allowed, [True] * 5 + [False])
+
+    def test_oversized_value_is_logged(self):
+        shm = caches['shm']
+        shm.set('big', 'small')
+        with self.assertLogs('core.shm_cache', 'WARNING') as logs:
+            shm.set('big', 'x' * 1000)
+            self.assertFalse(shm.add('bigger', 'x' * 1000))
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('does not fit', logs.output[0])
+        # The older value is not left behind
+        self.assertIsNone(shm.get('big'))
+
+    def test_add_is_atomic_across_threads(self):
+        added = []
+
+        def work(cache):
+            added.extend(key for key in range(200) if cache.add(f'key:{key}', threading.get_ident()))
+
+        self.in_threads(work)
+        self.assertEqual(sorted(added), list(range(200)))
+
+    def test_incr_is_atomic_across_processes(self):
+        caches['shm'].set('counter', 0)
+
+        def work():
+            self.in_threads(lambda cache: [cache.incr('counter') for _ in range(self.INCREMENTS // 4)])
+
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=work) for _ in range(self.PROCESSES)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(caches['shm'].get('counter'), self.PROCESSES * self.THREADS * self.INCREMENTS // 4)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    SETTINGS_PATH = os.path.join(settings.BASE_DIR, 'core', 'settings.py')
+
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, {'DATABASE_URL': 'sqlite:///:memory:', **environ}):
+            for name in ('DB_CONN_MAX_AGE', 'DB_CONN_HEALTH_CHECKS', 'DB_POOL', 'DATABASE_REPLICA_URLS'):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            return runpy.run_path(self.SETTINGS_PATH)
+
+    def test_defaults(self):
+        loaded = self.load_settings()
+        self.assertEqual(loaded['DATABASES']['default']['CONN_MAX_AGE'], 60)
+        self.assertTrue(loaded['DATABASES']['default']['CONN_HEALTH_CHECKS'])
+
+    def test_conn_max_age_none_keeps_connections_open(self):
+        for value in ('none', 'None'):
+            loaded = self.load_settings(DB_CONN_MAX_AGE=value)
+            self.assertIsNone(loaded['DB_CONN_MAX_AGE'])
+            self.assertIsNone(loaded['DATABASES']['default']['CONN_MAX_AGE'])
+
+    def test_conn_max_age_and_health_checks(self):
+        loaded = self.load_settings(DB_CONN_MAX_AGE='0', DB_CONN_HEALTH_CHECKS='false')
+        self.assertEqual(loaded['DATABASES']['default']['CONN_MAX_AGE'], 0)
+        self.assertFalse(loaded['DATABASES']['default']['CONN_HEALTH_CHECKS'])
+
+    def test_pool_refuses_non_postgresql(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DB_POOL needs PostgreSQL'):
+            self.load_settings(DB_POOL='true')
+
+    def test_pool_refuses_non_postgresql_replica(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DB_POOL needs PostgreSQL'):
+            self.load_settings(
+                DB_POOL='true', DATABASE_URL='postgres://app@db/app', DATABASE_REPLICA_URLS='sqlite:///:memory:',
+            )
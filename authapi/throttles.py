@@ -1,6 +1,90 @@
+import math
+
+from rest_framework import throttling
 from rest_framework.throttling import SimpleRateThrottle
 
-class SignupRateThrottle(SimpleRateThrottle):
+
+class GCRAThrottle(SimpleRateThrottle):
+    """
+    Rate throttle using the generic cell rate algorithm.
+
+    Reads `rate` ("<n>/<period>") like SimpleRateThrottle, but instead of a
+    list of request timestamps it keeps one integer per key: the theoretical
+    arrival time (TAT, in ms) of the next request. Each allowed request
+    moves it forward by period / n with a single atomic cache.incr(); a
+    request is refused, after just a read, when the TAT would run more than
+    one period ahead of now. Up to n requests may arrive at once and then
+    one per period / n. Refused requests are not counted.
+    """
+    # Different values from SimpleRateThrottle, so never share its keys
+    cache_format = 'throttle_gcra_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        super().__init__()
+        if self.rate is not None:
+            self.interval = math.ceil(self.duration * 1000 / self.num_requests)
+            # How far the TAT may run ahead of now: num_requests intervals
+            self.limit = self.interval * self.num_requests
+        self.retry_after = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = int(self.timer() * 1000)
+        tat = self.cache.get(self.key)
+        if tat is None or tat < now:
+            # New key, or idle with its TAT in the past: the budget starts over.
+            # A race here can only let a request or two through early.
+            tat = now + self.interval
+            self.cache.set(self.key, tat, self._timeout(tat, now))
+            return True
+
+        if tat + self.interval - now > self.limit:
+            return self._refuse(tat + self.interval, now)
+
+        try:
+            tat = self.cache.incr(self.key, self.interval)
+        except ValueError:
+            # Expired since the read
+            return self.allow_request(request, view)
+        if tat - now > self.limit:
+            # Another request took the last slot since the read
+            self.cache.decr(self.key, self.interval)
+            return self._refuse(tat, now)
+
+        # Keep the key alive until its TAT has passed; needed once per period
+        # of advance rather than on every request.
+        if tat // self.limit != (tat - self.interval) // self.limit:
+            self.cache.touch(self.key, self._timeout(tat, now))
+        return True
+
+    def _refuse(self, tat, now):
+        self.retry_after = (tat - self.limit - now) / 1000
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+    def _timeout(self, tat, now):
+        # Alive until the TAT has passed and for one more window, so the next
+        # touch always happens before expiry.
+        return math.ceil((tat - now + self.limit) / 1000)
+
+
+class AnonRateThrottle(GCRAThrottle, throttling.AnonRateThrottle):
+    scope = 'anon'
+
+
+class UserRateThrottle(GCRAThrottle, throttling.UserRateThrottle):
+    scope = 'user'
+
+
+class SignupRateThrottle(GCRAThrottle):
     scope = 'signup'
 
     def get_cache_key(self, request, view):
@@ -9,13 +93,17 @@ class SignupRateThrottle(SimpleRateThrottle):
             'ident': self.get_ident(request)
         }
 
-class LoginRateThrottle(SimpleRateThrottle):
-    scope = 'login'
+class EmailRateThrottle(GCRAThrottle):
+    """
+    Keyed by the email in the request body, normalized the way
+    email_filter.get_user looks it up, so every spelling of an address that
+    reaches one account shares its budget; by client IP without one.
+    """
 
     def get_cache_key(self, request, view):
         email = request.data.get('email')
-        if email:
-            ident = email
+        if email and isinstance(email, str):
+            ident = email.strip().lower()
         else:
             ident = self.get_ident(request)
         return self.cache_format % {
@@ -23,17 +111,10 @@ class LoginRateThrottle(SimpleRateThrottle):
             'ident': ident
         }
 
+
+class LoginRateThrottle(EmailRateThrottle):
+    scope = 'login'
+
 # Keep the OTPVerificationRateThrottle if you still need it
-class OTPVerificationRateThrottle(SimpleRateThrottle):
+class OTPVerificationRateThrottle(EmailRateThrottle):
     scope = 'otp_verification'
-
-    def get_cache_key(self, request, view):
-        email = request.data.get('email')
-        if email:
-            ident = email
-        else:
-            ident = self.get_ident(request)
-        return self.cache_format % {
-            'scope': self.scope,
-            'ident': ident
-        }
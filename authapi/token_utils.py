@@ -1,11 +1,42 @@
-from django.utils import timezone
-from rest_framework_simplejwt.tokens import RefreshToken
+from hashlib import sha256
+
+from rest_framework_simplejwt.settings import api_settings
+
+from .activity import activity_recorder
+from .tokens import RefreshToken
 
 def get_tokens_for_user(user):
+    activity_recorder.record(user)
+    return token_pair(user)
+
+async def aget_tokens_for_user(user):
+    await activity_recorder.arecord(user)
+    return token_pair(user)
+
+def token_pair(user):
     refresh = RefreshToken.for_user(user)
-    user.last_activity = timezone.now()
-    user.save()
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
     }
+
+def token_pair_from_refresh(refresh):
+    """
+    New token pair carrying the claims of a validated refresh token, so the
+    user does not have to be loaded.
+    """
+    new_refresh = RefreshToken()
+    reserved = {api_settings.TOKEN_TYPE_CLAIM, api_settings.JTI_CLAIM, 'exp', 'iat'}
+    for claim, value in refresh.payload.items():
+        if claim not in reserved:
+            new_refresh[claim] = value
+    return {
+        'refresh': str(new_refresh),
+        'access': str(new_refresh.access_token),
+    }
+
+def token_digest(token):
+    """Fixed-width blacklist key for a raw JWT (str or bytes)."""
+    if isinstance(token, str):
+        token = token.encode()
+    return sha256(token).digest()
@@ -0,0 +1,14 @@
+from rest_framework_simplejwt import tokens
+
+from .jwt_keys import token_backend
+
+
+class AccessToken(tokens.AccessToken):
+    """Access token signed and verified through the key ring"""
+    _token_backend = token_backend
+
+
+class RefreshToken(tokens.RefreshToken):
+    """Refresh token signed and verified through the key ring"""
+    _token_backend = token_backend
+    access_token_class = AccessToken
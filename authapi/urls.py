@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     UserRegistrationView,
@@ -8,8 +9,18 @@ from .views import (
     ResendOTPView,
     CustomTokenRefreshView,
     UserLogoutView,
+    DataExportView,
+    TokenIntrospectionView,
 )
 
+if settings.ASYNC_AUTH_VIEWS:
+    from .async_views import (
+        AsyncCustomTokenRefreshView as CustomTokenRefreshView,
+        AsyncUserLoginView as UserLoginView,
+        AsyncUserLogoutView as UserLogoutView,
+        AsyncUserProfileView as UserProfileView,
+    )
+
 app_name = 'authapi'
 
 urlpatterns = [
@@ -30,4 +41,10 @@ urlpatterns = [
     path('password-reset/', PasswordResetView.as_view(), name='password-reset'),
     # Alternative URL for password reset (for better UX)
     path('reset-password/', PasswordResetView.as_view(), name='reset-password'),
+
+    # Batch token introspection for services
+    path('introspect/', TokenIntrospectionView.as_view(), name='introspect'),
+
+    # Staff-only data export
+    path('export/', DataExportView.as_view(), name='export'),
 ]
\ No newline at end of file
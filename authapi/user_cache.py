@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+
+
+class UserCache:
+    """
+    Per-worker LRU cache of the users returned by JWT authentication.
+
+    Entries expire after USER_CACHE_TTL seconds and at most USER_CACHE_SIZE
+    are kept. Each user also has a version number in the shared Django cache
+    that is bumped whenever the user is saved or deleted, so an entry cached
+    by any worker is dropped on its next lookup after a change elsewhere.
+    Only the columns needed by authentication and the user payload are
+    loaded.
+    """
+
+    FIELDS = (
+        'id', 'account_id', 'email', 'first_name', 'last_name',
+        'is_active', 'is_staff', 'is_superuser', 'last_activity',
+    )
+    VERSION_KEY = 'authapi:user_version:%s'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'USER_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'USER_CACHE_TTL', 60)
+
+    def get(self, user_id):
+        """Return a private copy of the user with `user_id`, or None if it does not exist."""
+        version = self._version(user_id)
+        user = self._cached(user_id, version)
+        if user is None:
+            user = User.objects.only(*self.FIELDS).filter(pk=user_id).first()
+            self._store(user_id, version, user)
+        return copy.copy(user)
+
+    async def aget(self, user_id):
+        version = await self._aversion(user_id)
+        user = self._cached(user_id, version)
+        if user is None:
+            user = await User.objects.only(*self.FIELDS).filter(pk=user_id).afirst()
+            self._store(user_id, version, user)
+        return copy.copy(user)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+        key = self.VERSION_KEY % user_id
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+    def _cached(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        return None
+
+    def _store(self, user_id, version, user):
+        if user is None:
+            return
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _version(self, user_id):
+        key = self.VERSION_KEY % user_id
+        version = cache.get(key)
+        if version is None:
+            # Seed with a fresh value rather than 0, so a version key that
+            # was evicted never matches an entry cached before the eviction.
+            version = time.time_ns()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key)
+        return version
+
+    async def _aversion(self, user_id):
+        key = self.VERSION_KEY % user_id
+        version = await cache.aget(key)
+        if version is None:
+            version = time.time_ns()
+            if not await cache.aadd(key, version, timeout=None):
+                version = await cache.aget(key)
+        return version
+
+
+user_cache = UserCache()
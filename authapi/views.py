@@ -1,11 +1,9 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.mail import send_mail
 import random
 import traceback
-import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timezone as dt_timezone
 from hashlib import sha256
 
 from django.conf import settings
@@ -13,27 +11,48 @@ from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
 
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.throttling import SimpleRateThrottle, AnonRateThrottle, UserRateThrottle
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError, AccessToken
+from rest_framework_simplejwt.tokens import TokenError
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from core import db_router
+from core.docs import openapi, swagger_auto_schema
 
 from .models import User, BlacklistedToken
-from .throttles import SignupRateThrottle, LoginRateThrottle, OTPVerificationRateThrottle
-from .token_utils import get_tokens_for_user
-from .backends import CustomJWTAuthentication
+from .throttles import (
+    AnonRateThrottle,
+    UserRateThrottle,
+    SignupRateThrottle,
+    LoginRateThrottle,
+    OTPVerificationRateThrottle,
+)
+from .token_utils import get_tokens_for_user, token_digest, token_pair_from_refresh
+from .tokens import RefreshToken
+from .backends import CustomJWTAuthentication, ServiceClientAuthentication
+from .blacklist import blacklist_index
+from .activity import activity_recorder
+from .email_filter import email_filter
+from .exporter import CONTENT_TYPES, DATASETS, iter_rows, output_columns, render
+from .hashing import hashing_service
+from .introspection import introspect_tokens
+from .jwt_keys import keyring
+from .outbox import queue_email
+from .permissions import IsServiceClient
 from .serializers import (
     UserRegistrationSerializer, 
-    UserSerializer, 
+    FastUserSerializer,
     UserProfileUpdateSerializer,
     OTPVerificationSerializer,
     PasswordResetSerializer,
+    TokenIntrospectionSerializer,
 )
 
 User = get_user_model()
@@ -71,11 +90,18 @@ class CustomTokenRefreshView(TokenRefreshView):
         refresh_token = request.data.get('refresh')
         try:
             token = RefreshToken(refresh_token)
-            user = token.user
-            if user.last_activity and timezone.now() - user.last_activity > timedelta(hours=1):
+            user_id = token[jwt_settings.USER_ID_CLAIM]
+            # From the shared cache; the user row is only read on a miss.
+            # The token's own issue time counts as activity (a fresh login
+            # counts even if its last_activity has not been written yet).
+            last_activity = activity_recorder.last_activity_for(user_id)
+            issued_at = datetime.fromtimestamp(token['iat'], tz=dt_timezone.utc)
+            now = timezone.now()
+            if max(last_activity or issued_at, issued_at) < now - activity_recorder.inactivity_timeout:
                 return Response({"detail": "Token has expired due to inactivity."}, status=status.HTTP_401_UNAUTHORIZED)
-            return Response(get_tokens_for_user(user))
-        except InvalidToken:
+            activity_recorder.record_id(user_id, now, last_activity)
+            return Response(token_pair_from_refresh(token))
+        except (InvalidToken, TokenError, KeyError, User.DoesNotExist):
             return Response({"detail": "Invalid token."}, status=status.HTTP_401_UNAUTHORIZED)
 
 class UserRegistrationView(APIView):
@@ -111,23 +137,33 @@ class UserRegistrationView(APIView):
         }
     )
     def post(self, request):
+        # The unique email check must see every registration so far
+        db_router.use_primary()
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
-            # Create user with is_active=False (default in our model)
-            user = serializer.save()
-            
-            # Generate and save 6-digit OTP
-            otp = str(random.randint(100000, 999999))
-            user.set_email_verification_code(otp)
-            
-            # Send OTP via email
-            send_mail(
-                'Account Verification',
-                f'Thank you for registering! Your verification code is: {otp}\n\nThis code will expire in 10 minutes.',
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
+            try:
+                with transaction.atomic():
+                    # Create user with is_active=False (default in our model) and
+                    # a 6-digit OTP, in a single INSERT
+                    otp = str(random.randint(100000, 999999))
+                    user = serializer.save(
+                        email_verification_code=otp,
+                        email_verification_code_created_at=timezone.now(),
+                    )
+
+                    # Queue OTP email; the outbox worker sends it after commit
+                    queue_email(
+                        'Account Verification',
+                        f'Thank you for registering! Your verification code is: {otp}\n\nThis code will expire in 10 minutes.',
+                        [user.email],
+                    )
+            except IntegrityError:
+                # The address (in any case) was registered after validate_email checked
+                return Response({
+                    'success': False,
+                    'message': 'Registration failed',
+                    'error': {'email': ['user with this email already exists.']}
+                }, status=status.HTTP_400_BAD_REQUEST)
             
             response_data = {
                 'success': True,
@@ -186,7 +222,7 @@ class OTPVerificationView(APIView):
             otp = serializer.validated_data['otp']
             
             try:
-                user = User.objects.get(email=email)
+                user = email_filter.get_user(email)
                 
                 # Check if user is already verified
                 if user.is_active:
@@ -210,7 +246,7 @@ class OTPVerificationView(APIView):
                         'success': True,
                         'message': 'Account verified successfully',
                         'tokens': tokens,
-                        'user': UserSerializer(user).data
+                        'user': FastUserSerializer(user).data
                     }, status=status.HTTP_200_OK)
                 else:
                     return Response({
@@ -261,7 +297,7 @@ class ResendOTPView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            user = User.objects.get(email=email)
+            user = email_filter.get_user(email)
             
             # Check if user is already verified
             if user.is_active:
@@ -270,18 +306,17 @@ class ResendOTPView(APIView):
                     'message': 'Account is already verified'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Generate and save new OTP
-            otp = str(random.randint(100000, 999999))
-            user.set_email_verification_code(otp)
-            
-            # Send OTP via email
-            send_mail(
-                'Account Verification',
-                f'Your new verification code is: {otp}\n\nThis code will expire in 10 minutes.',
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
+            with transaction.atomic():
+                # Generate and save new OTP
+                otp = str(random.randint(100000, 999999))
+                user.set_email_verification_code(otp)
+                
+                # Queue OTP email; the outbox worker sends it after commit
+                queue_email(
+                    'Account Verification',
+                    f'Your new verification code is: {otp}\n\nThis code will expire in 10 minutes.',
+                    [user.email],
+                )
             
             return Response({
                 'success': True,
@@ -330,21 +365,17 @@ class UserLoginView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            user = User.objects.get(email=email)
-            if user.check_password(password):
+            user = email_filter.get_user(email)
+            if hashing_service.check_password(user, password):
                 if user.is_active:
-                    # Update last activity
-                    user.last_activity = timezone.now()
-                    user.save(update_fields=['last_activity'])
-                    
-                    # Generate tokens
+                    # Generate tokens (also records last activity)
                     tokens = get_tokens_for_user(user)
                     
                     return Response({
                         'success': True,
                         'message': 'Login successful',
                         'tokens': tokens,
-                        'user': UserSerializer(user).data
+                        'user': FastUserSerializer(user).data
                     }, status=status.HTTP_200_OK)
                 else:
                     return Response({
@@ -392,10 +423,9 @@ class UserProfileView(APIView):
     def get(self, request):
         """Get user profile details"""
         user = request.user
-        serializer = UserSerializer(user)
         return Response({
             'success': True,
-            'user': serializer.data
+            'user': FastUserSerializer(user).data
         }, status=status.HTTP_200_OK)
     
     @swagger_auto_schema(
@@ -416,7 +446,7 @@ class UserProfileView(APIView):
             return Response({
                 'success': True,
                 'message': 'Profile updated successfully',
-                'user': UserSerializer(user).data
+                'user': FastUserSerializer(user).data
             }, status=status.HTTP_200_OK)
         return Response({
             'success': False,
@@ -460,32 +490,20 @@ class UserLogoutView(APIView):
             if auth_header.startswith('Bearer '):
                 token = auth_header.split(' ')[1]
                 
-                # Decode token to get expiry time
-                decoded_token = jwt.decode(
-                    token,
-                    settings.SECRET_KEY,
-                    algorithms=["HS256"],
-                    options={"verify_signature": True}
-                )
-                
-                # Calculate token expiry datetime with timezone awareness
-                expiry_timestamp = decoded_token['exp']
-                expiry = timezone.make_aware(
-                    datetime.fromtimestamp(expiry_timestamp),
-                    timezone=timezone.get_current_timezone()
-                )
+                # Expiry from the token authentication already verified
+                expiry = datetime.fromtimestamp(request.auth['exp'], tz=dt_timezone.utc)
                 
                 # Add token to blacklist
+                digest = token_digest(token)
                 BlacklistedToken.objects.create(
-                    token=token,
+                    token_digest=digest,
                     user=request.user,
                     expires_at=expiry
                 )
+                blacklist_index.add(digest, expiry)
                 
                 # Update user's last activity time
-                user = request.user
-                user.last_activity = timezone.now()
-                user.save(update_fields=['last_activity'])
+                activity_recorder.record(request.user)
                 
                 return Response({
                     'success': True,
@@ -497,7 +515,7 @@ class UserLogoutView(APIView):
                     'message': 'Invalid authorization header format'
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
-        except (jwt.PyJWTError, Exception) as e:
+        except Exception as e:
             return Response({
                 'success': False,
                 'message': f'Error processing logout: {str(e)}'
@@ -536,22 +554,17 @@ class PasswordResetView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user = User.objects.get(email=email)
+            user = email_filter.get_user(email)
             
-            # Generate OTP for password reset
-            otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-            user.set_email_verification_code(otp)
+            with transaction.atomic():
+                # Generate OTP for password reset
+                otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
+                user.set_email_verification_code(otp)
 
-            # Send email with OTP for password reset
-            subject = 'Password Reset OTP'
-            message = f'Your OTP for password reset is: {otp}. It will expire in 10 minutes.'
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
+                # Queue email with OTP for password reset
+                subject = 'Password Reset OTP'
+                message = f'Your OTP for password reset is: {otp}. It will expire in 10 minutes.'
+                queue_email(subject, message, [user.email])
 
             return Response({
                 'success': True,
@@ -595,10 +608,10 @@ class PasswordResetView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user = User.objects.get(email=email)
+            user = email_filter.get_user(email)
             
             if user.email_verification_code == otp and user.is_email_verification_code_valid():
-                user.set_password(new_password)
+                hashing_service.set_password(user, new_password)
                 user.email_verification_code = None
                 user.email_verification_code_created_at = None
                 user.save()
@@ -618,3 +631,116 @@ class PasswordResetView(APIView):
                 'message': 'User not found',
                 'error': 'No account exists with this email address'
             }, status=status.HTTP_404_NOT_FOUND)
+
+class TokenIntrospectionView(APIView):
+    """
+    Batch token introspection for the API gateway and other services.
+    """
+    authentication_classes = [ServiceClientAuthentication]
+    permission_classes = [IsServiceClient]
+    # Callers are our own services, batching on behalf of many users
+    throttle_classes = []
+
+    @swagger_auto_schema(
+        operation_description="Check up to INTROSPECTION_MAX_TOKENS tokens (signature, expiry, blacklist) "
+                              "in one call. Authenticate with HTTP Basic client credentials. Results are "
+                              "in request order; pass fresh=true to check the blacklist in the database "
+                              "rather than this worker's index.",
+        request_body=TokenIntrospectionSerializer,
+        responses={
+            200: openapi.Response(
+                description="One result per token",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'success': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                        'results': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    'active': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                                    'claims': openapi.Schema(type=openapi.TYPE_OBJECT),
+                                    'reason': openapi.Schema(
+                                        type=openapi.TYPE_STRING, enum=['invalid', 'expired', 'revoked'],
+                                    ),
+                                }
+                            )
+                        ),
+                    }
+                )
+            ),
+            400: openapi.Response(description="No tokens or more than the batch limit"),
+            401: openapi.Response(description="Missing or invalid client credentials")
+        }
+    )
+    def post(self, request):
+        serializer = TokenIntrospectionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'message': 'Validation failed',
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        results = introspect_tokens(serializer.validated_data['tokens'], fresh=serializer.validated_data['fresh'])
+        return Response({
+            'success': True,
+            'results': results
+        }, status=status.HTTP_200_OK)
+
+class DataExportView(APIView):
+    """
+    Staff-only streaming export of users or blacklisted tokens.
+    """
+    authentication_classes = [CustomJWTAuthentication]
+    permission_classes = [IsAdminUser]
+    throttle_classes = [UserRateThrottle]
+
+    @swagger_auto_schema(
+        operation_description="Stream users or blacklisted tokens as JSONL or CSV, in id order. "
+                              "Pass the id of the last row received as after_id to resume.",
+        manual_parameters=[
+            openapi.Parameter('dataset', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(DATASETS), default='users'),
+            openapi.Parameter('output', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(CONTENT_TYPES), default='jsonl'),
+            openapi.Parameter('after_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(description="Export stream"),
+            400: openapi.Response(description="Unknown dataset or output format"),
+            403: openapi.Response(description="Staff access required")
+        }
+    )
+    def get(self, request):
+        dataset = request.query_params.get('dataset', 'users')
+        fmt = request.query_params.get('output', 'jsonl')
+        after_id = request.query_params.get('after_id')
+        if dataset not in DATASETS or fmt not in CONTENT_TYPES or (after_id is not None and not after_id.isdigit()):
+            return Response({
+                'success': False,
+                'message': 'Invalid export parameters',
+                'error': f"dataset must be one of {', '.join(DATASETS)}, output one of "
+                         f"{', '.join(CONTENT_TYPES)}, after_id an integer"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        after_id = int(after_id) if after_id is not None else None
+        rows = iter_rows(dataset, after_id=after_id)
+        response = StreamingHttpResponse(
+            render(rows, fmt, output_columns(dataset), header=after_id is None),
+            content_type=CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
+@require_safe
+def jwks_view(request):
+    """
+    Public keys that verify our tokens, as a JSON Web Key Set. Cacheable for
+    JWKS_MAX_AGE seconds and revalidated with its ETag.
+    """
+    key_set = keyring.current()
+    response = get_conditional_response(request, etag=key_set.etag)
+    if response is None:
+        response = HttpResponse(key_set.jwks, content_type='application/json')
+    response['ETag'] = key_set.etag
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+    return response
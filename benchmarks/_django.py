@@ -0,0 +1,41 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Each script is run from the project root, e.g.::
+
+    python -m benchmarks.bench_blacklist
+
+The scripts default to a throwaway in-memory SQLite database; set
+DATABASE_URL to point them at a real database instead.
+"""
+import os
+import time
+
+
+def setup(database_url='sqlite:///:memory:', migrate=True):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+    os.environ.setdefault('DATABASE_URL', database_url)
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    # Query logging under DEBUG would dominate the numbers.
+    settings.DEBUG = False
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+def timeit(func, iterations):
+    """Return the mean wall time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def report(label, micros):
+    print(f"{label:<48} {micros:>12.2f} us/op")
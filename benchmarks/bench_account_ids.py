@@ -0,0 +1,80 @@
+"""
+User insert throughput with the old account_id generation (uuid4 prefix
+plus an existence query per insert) against the block-leasing allocator,
+for single saves and for bulk_create.
+
+    python -m benchmarks.bench_account_ids [--existing 100000] [--inserts 5000]
+"""
+import argparse
+import time
+import uuid
+
+from benchmarks._django import setup
+
+
+def legacy_account_id(User):
+    while True:
+        account_id = str(uuid.uuid4()).replace('-', '')[:10].upper()
+        if not User.objects.filter(account_id=account_id).exists():
+            return account_id
+
+
+def rate(label, rows, seconds):
+    print(f"{label:<48} {rows / seconds:>12.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--existing', type=int, default=100000, help='Users in the table before measuring')
+    parser.add_argument('--inserts', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+
+    from authapi.ids import account_ids
+    from authapi.models import User
+
+    def make_users(prefix, count, ids=None):
+        return [
+            User(
+                email=f'{prefix}{i}@bench.test', first_name='B', last_name='B', password='!',
+                account_id=ids[i] if ids else '',
+            )
+            for i in range(count)
+        ]
+
+    User.objects.bulk_create(
+        make_users('existing', args.existing, account_ids.allocate(args.existing)),
+        batch_size=args.batch_size,
+    )
+    print(f"{args.existing} existing users, {args.inserts} inserts per run")
+
+    start = time.perf_counter()
+    for user in make_users('legacy', args.inserts):
+        user.account_id = legacy_account_id(User)
+        user.save()
+    rate('save(), uuid4 + exists() per insert', args.inserts, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for user in make_users('single', args.inserts):
+        user.save()
+    rate('save(), allocator', args.inserts, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    users = make_users('legacybulk', args.inserts)
+    for user in users:
+        user.account_id = legacy_account_id(User)
+    User.objects.bulk_create(users, batch_size=args.batch_size)
+    rate('bulk_create(), uuid4 + exists() per row', args.inserts, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    User.objects.bulk_create(
+        make_users('bulk', args.inserts, account_ids.allocate(args.inserts)),
+        batch_size=args.batch_size,
+    )
+    rate('bulk_create(), allocate(n)', args.inserts, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
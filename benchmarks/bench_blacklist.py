@@ -0,0 +1,59 @@
+"""
+Compare the per-request blacklist check: one indexed query per request against
+the in-memory BlacklistIndex.
+
+    python -m benchmarks.bench_blacklist [--rows 50000] [--lookups 20000]
+"""
+import argparse
+import secrets
+from datetime import timedelta
+
+from benchmarks._django import report, setup, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.utils import timezone
+
+    from authapi.blacklist import BlacklistIndex
+    from authapi.models import BlacklistedToken, User, expiry_day_for
+    from authapi.token_utils import token_digest
+
+    user = User.objects.create_user('bench@example.com', 'bench-password', first_name='B', last_name='B')
+    expires_at = timezone.now() + timedelta(days=1)
+    BlacklistedToken.objects.bulk_create(
+        [BlacklistedToken(
+            token_digest=token_digest(secrets.token_urlsafe(180)), user=user,
+            expires_at=expires_at, expiry_day=expiry_day_for(expires_at),
+        ) for _ in range(args.rows)],
+        batch_size=5000,
+    )
+
+    live_token = token_digest(secrets.token_urlsafe(180))
+    revoked_token = BlacklistedToken.objects.values_list('token_digest', flat=True).first()
+
+    def query_path(token=live_token):
+        return BlacklistedToken.objects.filter(token_digest=token).exists()
+
+    index = BlacklistIndex(max_staleness=5.0)
+    index.sync()
+
+    print(f"{args.rows} blacklisted rows, {args.lookups} lookups")
+    report('query per request (non-revoked)', timeit(query_path, args.lookups))
+    report('index (non-revoked)', timeit(lambda: index.contains(live_token), args.lookups))
+    report('query per request (revoked)', timeit(lambda: query_path(revoked_token), args.lookups))
+    report('index (revoked)', timeit(lambda: index.contains(revoked_token), args.lookups))
+
+    fresh = BlacklistIndex(max_staleness=5.0)
+    report('index initial load', timeit(fresh.sync, 1))
+    report('index incremental sync (no new rows)', timeit(index.sync, 200))
+
+
+if __name__ == '__main__':
+    main()
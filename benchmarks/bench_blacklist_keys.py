@@ -0,0 +1,106 @@
+"""
+Index size and probe latency of the blacklist key: the old 500-char token
+column against the 32-byte SHA-256 digest column.
+
+    python -m benchmarks.bench_blacklist_keys [--rows 10000000] [--probes 20000]
+
+Defaults to a temporary SQLite file; set DATABASE_URL to run it against
+Postgres. The scratch tables are dropped afterwards.
+"""
+import argparse
+import base64
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+from hashlib import sha256
+
+from benchmarks._django import setup
+
+BATCH = 10000
+
+
+def fake_jwt():
+    # Same shape and length as the HS256 access tokens issued by this API.
+    header = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9'
+    payload = base64.urlsafe_b64encode(secrets.token_bytes(150)).rstrip(b'=').decode()
+    signature = base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b'=').decode()
+    return f'{header}.{payload}.{signature}'
+
+
+def table_bytes(cursor, vendor, table, index):
+    if vendor == 'postgresql':
+        cursor.execute('SELECT pg_relation_size(%s), pg_relation_size(%s)', [table, index])
+        return cursor.fetchone()
+    cursor.execute('PRAGMA page_size')
+    page_size = cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_count')
+    page_count = cursor.fetchone()[0]
+    cursor.execute('PRAGMA freelist_count')
+    return None, (page_count - cursor.fetchone()[0]) * page_size
+
+
+def run_schema(connection, name, column_type, make_key, rows, probes):
+    from django.db import transaction
+
+    vendor = connection.vendor
+    table, index = f'bench_{name}', f'bench_{name}_key_uniq'
+    samples = []
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(f'CREATE TABLE {table} (id bigint PRIMARY KEY, token_key {column_type} NOT NULL)')
+        start = time.perf_counter()
+        for offset in range(0, rows, BATCH):
+            batch = [(offset + i, make_key(fake_jwt())) for i in range(min(BATCH, rows - offset))]
+            if len(samples) < probes:
+                samples.extend(key for _, key in batch[:max(1, probes // max(1, rows // BATCH))])
+            with transaction.atomic():
+                cursor.executemany(f'INSERT INTO {table} (id, token_key) VALUES (%s, %s)', batch)
+        load_seconds = time.perf_counter() - start
+
+        _, before = table_bytes(cursor, vendor, table, table)
+        cursor.execute(f'CREATE UNIQUE INDEX {index} ON {table} (token_key)')
+        index_size, after = table_bytes(cursor, vendor, table, index)
+        if index_size is None:
+            index_size = after - before
+
+        misses = [make_key(fake_jwt()) for _ in range(probes)]
+        hits = random.sample(samples, min(probes, len(samples)))
+        timings = {}
+        for label, keys in (('hit', hits), ('miss', misses)):
+            start = time.perf_counter()
+            for key in keys:
+                cursor.execute(f'SELECT 1 FROM {table} WHERE token_key = %s LIMIT 1', [key])
+                cursor.fetchone()
+            timings[label] = (time.perf_counter() - start) / len(keys) * 1e6
+        cursor.execute(f'DROP TABLE {table}')
+
+    memory = sys.getsizeof(make_key(fake_jwt()))
+    print(
+        f'{name:<8} load {load_seconds:8.1f}s  index {index_size / 2**20:10.1f} MiB  '
+        f'probe hit {timings["hit"]:7.1f} us  miss {timings["miss"]:7.1f} us  '
+        f'in-memory key {memory} B'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--probes', type=int, default=20000)
+    args = parser.parse_args()
+
+    scratch = os.path.join(tempfile.mkdtemp(), 'bench_keys.sqlite3')
+    setup(database_url=f'sqlite:///{scratch}', migrate=False)
+
+    from django.db import connection
+
+    binary = 'bytea' if connection.vendor == 'postgresql' else 'blob'
+    print(f'{args.rows} rows on {connection.vendor}')
+    run_schema(connection, 'token', 'varchar(500)', lambda token: token, args.rows, args.probes)
+    run_schema(connection, 'digest', binary, lambda token: sha256(token.encode()).digest(), args.rows, args.probes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Request latency with and without database connection reuse.
+
+    python -m benchmarks.bench_db_connections [--requests 2000]
+
+Logins (one SELECT of the user) go through the WSGI handler as they would
+under gunicorn, so Django closes or keeps the connection at the end of each
+request according to CONN_MAX_AGE; the test client would keep it open. Runs
+with CONN_MAX_AGE=0 (a new connection per request, the old behaviour), with
+reuse, and with reuse plus CONN_HEALTH_CHECKS. The default database is a
+SQLite file, where opening a connection is cheap; point DATABASE_URL at a
+local PostgreSQL to include the TCP and authentication handshake.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks._django import setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_db_')
+    os.environ.setdefault('EMAIL_FILTER_PATH', '')
+    setup(database_url=f'sqlite:///{tmp}/db.sqlite3')
+
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test import RequestFactory
+
+    from authapi.models import User
+    from authapi.views import UserLoginView
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    # Time the connection, not the throttles
+    UserLoginView.throttle_classes = []
+    User.objects.create_user(
+        email='ada@example.com', password='correct-horse-42', first_name='Ada', last_name='Lovelace', is_active=True,
+    )
+
+    handler = WSGIHandler()
+    body = json.dumps({'email': 'ada@example.com', 'password': 'correct-horse-42'}).encode()
+    environ = RequestFactory().post('/api/v1/auth/login/', body, content_type='application/json').environ
+
+    def request():
+        statuses = []
+        response = handler(
+            dict(environ, **{'wsgi.input': io.BytesIO(body)}), lambda status, headers: statuses.append(status),
+        )
+        b''.join(response)
+        # Sends request_finished, which closes the connection unless it is reused
+        response.close()
+        assert statuses[0].startswith('200'), statuses
+
+    opened = []
+    connection_created.connect(lambda **kwargs: opened.append(1), weak=False)
+    print(f"{args.requests} logins against {connection.vendor}")
+    for label, max_age, health_checks in (
+        ('CONN_MAX_AGE=0', 0, False),
+        ('CONN_MAX_AGE=60', 60, False),
+        ('CONN_MAX_AGE=60, CONN_HEALTH_CHECKS', 60, True),
+    ):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+        request()
+        opened.clear()
+        latencies = []
+        for _ in range(args.requests):
+            began = time.perf_counter()
+            request()
+            latencies.append((time.perf_counter() - began) * 1e6)
+        latencies.sort()
+        print(
+            f"{label:<40} mean {statistics.fmean(latencies):>8.1f} us  "
+            f"p50 {latencies[len(latencies) // 2]:>8.1f} us  "
+            f"p99 {latencies[int(len(latencies) * 0.99)]:>8.1f} us  "
+            f"connections opened {len(opened)}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Per-request JSON cost: DRF's stock JSONRenderer/JSONParser against
+authapi.renderers.JSONRenderer and authapi.parsers.JSONParser (orjson when
+installed).
+
+    python -m benchmarks.bench_json [--iterations 20000]
+
+Rendering is timed on the real login, refresh, profile and validation error
+responses, each first checked to come out byte for byte the same as with
+the stock renderer; parsing on the login, refresh, registration and profile
+update request bodies, and on a malformed body, which the fast parser hands
+to the stock one for its error message.
+"""
+import argparse
+import io
+
+from benchmarks._django import report, setup, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework import parsers, renderers
+    from rest_framework.exceptions import ParseError
+
+    from authapi import parsers as fast_parsers, renderers as fast_renderers
+    from authapi.models import User
+    from authapi.serializers import UserRegistrationSerializer, UserSerializer
+    from authapi.token_utils import get_tokens_for_user
+
+    if fast_renderers.orjson is None:
+        print("orjson is not installed: both columns use the stdlib json module")
+
+    user = User.objects.create_user(
+        email='ada@example.com', password='correct-horse-42', first_name='Ada', last_name='Lovelace', is_active=True,
+    )
+    tokens = get_tokens_for_user(user)
+    serializer = UserRegistrationSerializer(data={'email': 'not-an-email', 'first_name': '', 'password': 'x'})
+    serializer.is_valid()
+    responses = {
+        'login': {
+            'success': True, 'message': 'Login successful', 'tokens': tokens, 'user': UserSerializer(user).data,
+        },
+        'refresh': tokens,
+        'profile': {'success': True, 'user': UserSerializer(user).data},
+        'error': {'success': False, 'message': 'Validation failed', 'error': serializer.errors},
+    }
+    requests = {
+        'login': b'{"email":"ada@example.com","password":"correct-horse-42"}',
+        'refresh': b'{"refresh":"%s"}' % tokens['refresh'].encode(),
+        'register': (
+            b'{"email":"grace@example.com","password":"correct-horse-42","first_name":"Grace","last_name":"Hopper"}'
+        ),
+        'profile update': b'{"first_name":"Augusta","last_name":"King"}',
+    }
+
+    stock_renderer, fast_renderer = renderers.JSONRenderer(), fast_renderers.JSONRenderer()
+    for name, data in responses.items():
+        rendered = stock_renderer.render(data)
+        assert fast_renderer.render(data) == rendered, name
+        stock = timeit(lambda: stock_renderer.render(data), args.iterations)
+        fast = timeit(lambda: fast_renderer.render(data), args.iterations)
+        report(f"render {name} ({len(rendered)} B) stock", stock)
+        report(f"render {name} fast ({stock / fast:.1f}x)", fast)
+
+    stock_parser, fast_parser = parsers.JSONParser(), fast_parsers.JSONParser()
+    for name, body in requests.items():
+        assert fast_parser.parse(io.BytesIO(body)) == stock_parser.parse(io.BytesIO(body)), name
+        stock = timeit(lambda: stock_parser.parse(io.BytesIO(body)), args.iterations)
+        fast = timeit(lambda: fast_parser.parse(io.BytesIO(body)), args.iterations)
+        report(f"parse {name} ({len(body)} B) stock", stock)
+        report(f"parse {name} fast ({stock / fast:.1f}x)", fast)
+
+    def parse_error(parser, body):
+        try:
+            parser.parse(io.BytesIO(body))
+        except ParseError:
+            pass
+
+    malformed = b'{"email":"ada@example.com",}'
+    stock = timeit(lambda: parse_error(stock_parser, malformed), args.iterations)
+    fast = timeit(lambda: parse_error(fast_parser, malformed), args.iterations)
+    report(f"parse malformed ({len(malformed)} B) stock", stock)
+    report(f"parse malformed fast ({stock / fast:.1f}x)", fast)
+
+
+if __name__ == '__main__':
+    main()
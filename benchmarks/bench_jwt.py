@@ -0,0 +1,53 @@
+"""
+Token signing and verification throughput per algorithm: HS256 with
+SECRET_KEY (the default), RS256 and EdDSA keys from the key ring.
+
+    python -m benchmarks.bench_jwt [--iterations 2000]
+
+Each run signs an access token payload and verifies the result through
+KeyRingTokenBackend, as the login/refresh and authentication paths do.
+"""
+import argparse
+import shutil
+import tempfile
+
+from benchmarks._django import report, setup, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup(migrate=False)
+
+    from django.conf import settings
+
+    from authapi.jwt_keys import SigningKey, keyring, token_backend
+    from authapi.tokens import AccessToken
+
+    keys_dir = tempfile.mkdtemp(prefix='bench_jwt_')
+    try:
+        for algorithm in ('HS256', 'RS256', 'EdDSA'):
+            shutil.rmtree(keys_dir, ignore_errors=True)
+            settings.JWT_KEYS_DIR = keys_dir
+            if algorithm != 'HS256':
+                keyring.add(SigningKey.generate(algorithm))
+            keyring.reload()
+
+            token = AccessToken()
+            token['user_id'] = 1
+            payload = token.payload
+            encoded = token_backend.encode(payload)
+            assert token_backend.decode(encoded)['user_id'] == 1
+
+            sign = timeit(lambda: token_backend.encode(payload), args.iterations)
+            verify = timeit(lambda: token_backend.decode(encoded), args.iterations)
+            report(f"{algorithm} sign ({1e6 / sign:.0f}/s)", sign)
+            report(f"{algorithm} verify ({1e6 / verify:.0f}/s)", verify)
+    finally:
+        shutil.rmtree(keys_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
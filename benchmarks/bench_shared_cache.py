@@ -0,0 +1,99 @@
+"""
+Cache throughput and consistency across worker processes: LocMemCache,
+FileBasedCache and the shared-memory SharedMemoryCache.
+
+    python -m benchmarks.bench_shared_cache [--processes 4] [--ops 20000]
+
+Every process runs the same mix a throttle produces: get a key, then set it
+when missing or incr it. Afterwards each process also adds 1 to a counter
+shared by all of them; with a cache that is shared and atomic it ends at
+`processes`, anything less is lost updates or per-process copies.
+"""
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+
+from benchmarks._django import setup
+
+
+def worker(alias, ops, keys, seed, start, results):
+    from django.core.cache import caches
+
+    cache = caches[alias]
+    rng = random.Random(seed)
+    start.wait()
+    began = time.perf_counter()
+    for _ in range(ops):
+        key = f"throttle_{rng.randrange(keys)}"
+        if cache.get(key) is None:
+            cache.set(key, 1, 300)
+        else:
+            try:
+                cache.incr(key)
+            except ValueError:
+                pass
+    results.put(time.perf_counter() - began)
+    start.wait()
+    # Everyone increments the shared counter at once. FileBasedCache.incr is
+    # a get and a set, so it is not atomic.
+    cache.incr('shared_counter')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=5000, help='Operations per process')
+    parser.add_argument('--keys', type=int, default=10000)
+    args = parser.parse_args()
+
+    setup(migrate=False)
+
+    from django.conf import settings
+    from django.core.cache import caches
+
+    tmp = tempfile.mkdtemp(prefix='bench_cache_')
+    settings.CACHES = {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': args.keys * 2},
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': f'{tmp}/files',
+            'OPTIONS': {'MAX_ENTRIES': args.keys * 2},
+        },
+        'shm': {
+            'BACKEND': 'core.shm_cache.SharedMemoryCache',
+            'LOCATION': f'{tmp}/cache.bin',
+            'OPTIONS': {'MAX_ENTRIES': args.keys * 2},
+        },
+    }
+
+    context = multiprocessing.get_context('fork')
+    print(f"{args.processes} processes x {args.ops} ops over {args.keys} keys")
+    for alias, label in (('locmem', 'LocMemCache'), ('file', 'FileBasedCache'), ('shm', 'SharedMemoryCache')):
+        cache = caches[alias]
+        cache.clear()
+        cache.set('shared_counter', 0, None)
+        start = context.Barrier(args.processes)
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(alias, args.ops, args.keys, seed, start, results))
+            for seed in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        seconds = max(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        total = args.processes * args.ops
+        print(
+            f"{label:<20} {total / seconds:>10.0f} ops/s  {seconds / args.ops * 1e6:>8.2f} us/op per process  "
+            f"shared counter {cache.get('shared_counter')}/{args.processes}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Per-request cost of the login throttle across 100k distinct keys: DRF's
+SimpleRateThrottle (a list of timestamps per key) against GCRAThrottle
+(one integer per key).
+
+    python -m benchmarks.bench_throttles [--keys 100000]
+
+Three passes per rate: the first request for every key, a request for
+every key that is still under its limit, and a request for every key that
+is at its limit (the case attack traffic keeps hitting). Keys at the limit
+are pre-filled rather than driven there request by request.
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks._django import setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--rates', nargs='+', default=['5/hour', '1000/hour'])
+    args = parser.parse_args()
+
+    setup(migrate=False)
+
+    from django.conf import settings
+    from django.core.cache import caches
+
+    # A locmem cache large enough for every key, so culling is not measured
+    settings.CACHES = {'bench': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': args.keys * 4},
+    }}
+    cache = caches['bench']
+
+    from rest_framework.throttling import SimpleRateThrottle
+
+    from authapi.throttles import LoginRateThrottle
+
+    requests = [SimpleNamespace(data={'email': f'user{i}@bench.test'}, META={}) for i in range(args.keys)]
+
+    def run(throttle_class):
+        start = time.perf_counter()
+        allowed = 0
+        for request in requests:
+            allowed += throttle_class().allow_request(request, None)
+        return (time.perf_counter() - start) / len(requests) * 1e6, allowed
+
+    print(f"{args.keys} distinct keys")
+    for rate in args.rates:
+        class Legacy(SimpleRateThrottle):
+            cache_format = LoginRateThrottle.cache_format.replace('gcra', 'legacy')
+            get_cache_key = LoginRateThrottle.get_cache_key
+
+        class GCRA(LoginRateThrottle):
+            pass
+
+        for throttle_class in (Legacy, GCRA):
+            throttle_class.rate = rate
+            throttle_class.cache = cache
+
+        for label, throttle_class in (('SimpleRateThrottle', Legacy), ('GCRAThrottle', GCRA)):
+            cache.clear()
+            first, _ = run(throttle_class)
+            under, _ = run(throttle_class)
+
+            # Fill every key to its limit
+            sample = throttle_class()
+            now = time.time()
+            for request in requests:
+                key = sample.get_cache_key(request, None)
+                if throttle_class is Legacy:
+                    step = sample.duration / sample.num_requests
+                    cache.set(key, [now - i * step / 2 for i in range(sample.num_requests)], sample.duration)
+                else:
+                    cache.set(key, int(now * 1000) + sample.limit, sample.duration * 2)
+            limited, allowed = run(throttle_class)
+            assert allowed == 0, allowed
+            print(
+                f"{rate:<10} {label:<20} first {first:>7.2f} us  under limit {under:>7.2f} us  "
+                f"at limit {limited:>7.2f} us"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+The user payload of the login, OTP verification and profile responses:
+UserSerializer(user).data against FastUserSerializer(user).data.
+
+    python -m benchmarks.bench_user_serializer [--iterations 20000]
+"""
+import argparse
+
+from benchmarks._django import report, setup, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup()
+
+    from authapi.models import User
+    from authapi.serializers import FastUserSerializer, UserSerializer
+
+    User.objects.create_user(
+        email='ada@example.com', password='correct-horse-42', first_name='Ada', last_name='Lovelace',
+    )
+    user = User.objects.get(email='ada@example.com')
+    assert FastUserSerializer(user).data == UserSerializer(user).data
+
+    stock = timeit(lambda: UserSerializer(user).data, args.iterations)
+    fast = timeit(lambda: FastUserSerializer(user).data, args.iterations)
+    report("UserSerializer(user).data", stock)
+    report(f"FastUserSerializer(user).data ({stock / fast:.0f}x)", fast)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Throughput and latency of the authenticated profile endpoint under
+concurrent clients: the sync DRF views behind gunicorn against the async
+views (ASYNC_AUTH_VIEWS=true) behind an ASGI server.
+
+    python -m benchmarks.bench_wsgi_vs_asgi [--clients 64] [--seconds 10]
+
+Servers whose command is not installed are skipped; uvicorn is not a
+runtime dependency, install it to get the ASGI numbers. Uses a temporary
+SQLite file unless DATABASE_URL is set, and benchmarks.settings to lift
+the throttles.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks._django import setup
+
+SERVERS = {
+    'gunicorn-sync': (
+        ['gunicorn', 'core.wsgi:application', '--worker-class', 'gthread'],
+        {'ASYNC_AUTH_VIEWS': 'false'},
+    ),
+    'gunicorn-uvicorn': (
+        ['gunicorn', 'core.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+        {'ASYNC_AUTH_VIEWS': 'true'},
+    ),
+    'uvicorn': (
+        ['uvicorn', 'core.asgi:application', '--log-level', 'warning'],
+        {'ASYNC_AUTH_VIEWS': 'true'},
+    ),
+}
+PATH = '/api/v1/auth/profile/'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(name, port, workers, threads):
+    argv, env = SERVERS[name]
+    argv = list(argv)
+    if argv[0] == 'gunicorn':
+        argv += ['--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+        if 'gthread' in argv:
+            argv += ['--threads', str(threads)]
+    else:
+        argv += ['--port', str(port), '--workers', str(workers)]
+    return argv, env
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def hammer(port, token, clients, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def client():
+        local, failed = [], 0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', PATH, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=sorted(SERVERS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-servers-')
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(workdir, "bench.sqlite3")}')
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    setup()
+
+    from authapi.models import User
+    from authapi.token_utils import token_pair
+
+    user, _ = User.objects.get_or_create(
+        email='bench@example.com',
+        defaults={'first_name': 'Bench', 'last_name': 'User', 'is_active': True},
+    )
+    token = token_pair(user)['access']
+
+    print(f"GET {PATH} with {args.clients} clients for {args.seconds:g}s, {args.workers} workers")
+    try:
+        for name in args.servers:
+            port = free_port()
+            argv, extra_env = server_command(name, port, args.workers, args.threads)
+            if shutil.which(argv[0]) is None:
+                print(f"{name:<20} skipped ({argv[0]} not installed)")
+                continue
+            env = {
+                **os.environ,
+                **extra_env,
+                'DEBUG': 'False',
+                'EMAIL_OUTBOX_THREAD': 'false',
+            }
+            server = subprocess.Popen(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                if not wait_for(port) or server.poll() is not None:
+                    error = server.stderr.read().decode().strip().splitlines() if server.poll() is not None else []
+                    print(f"{name:<20} failed to start: {error[-1] if error else 'timed out'}")
+                    continue
+                hammer(port, token, min(args.clients, 4), 1)  # warm up every worker
+                latencies, errors, elapsed = hammer(port, token, args.clients, args.seconds)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            if not latencies:
+                print(f"{name:<20} no successful requests ({errors} errors)")
+                continue
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(
+                f"{name:<20} {len(latencies) / elapsed:>9.0f} req/s  "
+                f"p50 {statistics.median(latencies) * 1e3:>7.2f} ms  "
+                f"p99 {p99 * 1e3:>7.2f} ms  errors {errors}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
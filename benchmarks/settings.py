@@ -0,0 +1,14 @@
+"""
+Settings for benchmarks that drive a real server: the production settings
+with the request throttles lifted, so the load generator measures the views
+rather than 429 responses.
+"""
+from core.settings import *  # noqa: F401,F403
+from core.settings import REST_FRAMEWORK
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {
+        scope: '1000000/second' for scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+    },
+}
@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+from authapi.email_filter import start_email_filter  # noqa: E402
+from authapi.outbox import start_outbox_sender  # noqa: E402
+from authapi.purge import start_periodic_purge  # noqa: E402
+
+start_periodic_purge()
+start_outbox_sender()
+start_email_filter()
@@ -0,0 +1,89 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = 'db_router:pin:%s'
+
+# Per request (see ReplicaRoutingMiddleware): whether reads go to the primary,
+# and the replica chosen for the others.
+_use_primary = ContextVar('db_router_use_primary', default=False)
+_replica = ContextVar('db_router_replica', default=None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and reads of REPLICA_MODELS to the
+    DATABASE_REPLICAS.
+
+    Reads stay on the primary inside a transaction on it, for the rest of a
+    request once the request has written anything, and after use_primary() or
+    a read_your_writes() that found a recent write. A request reads from one
+    replica throughout, so it never sees the replicas disagree.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if (
+            not replicas or _use_primary.get()
+            or model._meta.label_lower not in getattr(settings, 'REPLICA_MODELS', ())
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            _replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _use_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+def begin_request():
+    """Reset the routing state; returns what end_request() needs to restore it."""
+    return _use_primary.set(False), _replica.set(None)
+
+
+def end_request(tokens):
+    _use_primary.reset(tokens[0])
+    _replica.reset(tokens[1])
+
+
+def use_primary():
+    """Read from the primary for the rest of the request."""
+    _use_primary.set(True)
+
+
+def pin(*keys):
+    """
+    Record a write to the data identified by `keys` (such as 'user:42'):
+    reads through read_your_writes() with any of them go to the primary for
+    the next REPLICA_PIN_SECONDS, however the caller reaches a worker.
+    """
+    if getattr(settings, 'DATABASE_REPLICAS', []):
+        cache.set_many(dict.fromkeys([PIN_KEY % key for key in keys], True), _pin_seconds())
+
+
+def read_your_writes(*keys):
+    """Read from the primary for the rest of the request if any of `keys` was pinned."""
+    if getattr(settings, 'DATABASE_REPLICAS', []) and not _use_primary.get():
+        if cache.get_many([PIN_KEY % key for key in keys]):
+            _use_primary.set(True)
+
+
+async def aread_your_writes(*keys):
+    if getattr(settings, 'DATABASE_REPLICAS', []) and not _use_primary.get():
+        if await cache.aget_many([PIN_KEY % key for key in keys]):
+            _use_primary.set(True)
+
+
+def _pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
@@ -0,0 +1,99 @@
+"""
+Import-free stand-ins for drf_yasg's `swagger_auto_schema` and `openapi`.
+
+Views describe themselves for the API docs at import time, which would
+import drf_yasg (and with it PyYAML, inflection and uritemplate) in every
+worker. Views use these instead: `openapi.Schema(...)` and friends are
+recorded as Deferred values and `swagger_auto_schema` only remembers its
+arguments. load(), called when core.schema is first imported, imports
+drf_yasg and applies them all. With LAZY_DOCS that happens on the first
+docs request rather than at startup.
+"""
+import threading
+
+from django.utils.module_loading import import_string
+
+
+class Deferred:
+    """A drf_yasg.openapi attribute, or a call of one, not yet evaluated."""
+
+    def __init__(self, name, args=None, kwargs=None):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, *args, **kwargs):
+        return Deferred(self.name, args, kwargs)
+
+    def __repr__(self):
+        return f'<Deferred openapi.{self.name}>'
+
+    def resolve(self, module):
+        value = getattr(module, self.name)
+        if self.args is None:
+            return value
+        return value(*resolve(self.args, module), **resolve(self.kwargs, module))
+
+
+def resolve(value, module):
+    """`value` with every Deferred in it, however nested, evaluated against `module`."""
+    if isinstance(value, Deferred):
+        return value.resolve(module)
+    if isinstance(value, dict):
+        return {resolve(k, module): resolve(v, module) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(resolve(item, module) for item in value)
+    return value
+
+
+class _DeferredOpenAPI:
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return Deferred(name)
+
+
+openapi = _DeferredOpenAPI()
+
+_lock = threading.Lock()
+_pending = []
+_loaded = False
+
+
+def swagger_auto_schema(**kwargs):
+    """drf_yasg's swagger_auto_schema, applied by load()."""
+    def decorator(view_method):
+        with _lock:
+            if not _loaded:
+                _pending.append((view_method, kwargs))
+                return view_method
+        return _apply(view_method, kwargs)
+    return decorator
+
+
+def load():
+    """Import drf_yasg and apply every swagger_auto_schema recorded so far."""
+    global _loaded
+    with _lock:
+        while _pending:
+            _apply(*_pending.pop(0))
+        _loaded = True
+
+
+def _apply(view_method, kwargs):
+    from drf_yasg import openapi as yasg_openapi
+    from drf_yasg.utils import swagger_auto_schema as yasg_swagger_auto_schema
+
+    return yasg_swagger_auto_schema(**resolve(kwargs, yasg_openapi))(view_method)
+
+
+def lazy_view(dotted_path):
+    """A view that imports the view at `dotted_path` on its first request."""
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path)
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -1,15 +1,58 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
 from django.urls.exceptions import Resolver404
 
+from . import db_router
+
+
+class ReplicaRoutingMiddleware:
+    """Give each request its own read routing state (see core.db_router)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        tokens = db_router.begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            db_router.end_request(tokens)
+
+    async def __acall__(self, request):
+        tokens = db_router.begin_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            db_router.end_request(tokens)
+
+
 class JSONError404Middleware:
     """Middleware to convert 404 errors to JSON responses"""
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
         # Return the response as is if it's not a 404
         if response.status_code != 404:
             return response
@@ -0,0 +1,209 @@
+"""
+The OpenAPI schema, generated once instead of on every docs request.
+
+Importing this module imports drf_yasg; see core.docs.
+
+`manage.py build_schema` writes swagger.json and swagger.yaml, each with a
+gzipped copy, to SCHEMA_DIR along with the code version they were built
+from. /swagger.json and /swagger.yaml serve those files; when they are
+missing or were built from other code, the schema is generated on first use
+and kept in memory for the life of the process. Either way responses carry
+an ETag, so the docs UI revalidates instead of downloading it again.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+import drf_yasg
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+from core import docs
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="Django Auth API",
+    default_version='v1',
+    description="API for user authentication, registration, and profile management",
+    terms_of_service="https://www.yourapp.com/terms/",
+    contact=openapi.Contact(email="contact@yourapp.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Create schema view for Swagger documentation
+schema_view = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+swagger_ui_view = schema_view.with_ui('swagger', cache_timeout=0)
+redoc_view = schema_view.with_ui('redoc', cache_timeout=0)
+
+# The views' swagger_auto_schema annotations
+docs.load()
+
+FORMATS = {
+    'json': ('application/json', OpenAPICodecJson),
+    'yaml': ('application/yaml', OpenAPICodecYaml),
+}
+MANIFEST = 'manifest.json'
+# The packages whose source the schema is generated from
+SOURCE_PACKAGES = ('authapi', 'core')
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """
+    CODE_VERSION if set (e.g. the git commit), else a digest of the Python
+    source the schema is generated from.
+    """
+    if getattr(settings, 'CODE_VERSION', ''):
+        return settings.CODE_VERSION
+    digest = hashlib.sha256(drf_yasg.__version__.encode())
+    for package in SOURCE_PACKAGES:
+        root = os.path.join(settings.BASE_DIR, package)
+        for directory, dirnames, filenames in sorted(os.walk(root)):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith('.py'):
+                    path = os.path.join(directory, name)
+                    digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class SchemaDocument:
+    """One rendering of the schema, plain and gzipped."""
+
+    def __init__(self, fmt, body, gzipped=None):
+        self.content_type = FORMATS[fmt][0]
+        self.body = body
+        self.gzipped = gzipped if gzipped is not None else gzip.compress(body, mtime=0)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = '"%s"' % digest
+        self.gzip_etag = '"%s-gzip"' % digest
+
+
+def generate():
+    """Render the schema in every format: {format: bytes}."""
+    generator = schema_view.generator_class(API_INFO)
+    # No request: the schema names no host, so it is valid for any host
+    swagger = generator.get_schema(request=None, public=True)
+    return {fmt: codec([]).encode(swagger) for fmt, (_, codec) in FORMATS.items()}
+
+
+def build(path):
+    """Write the schema files and their manifest to `path`; returns the version."""
+    os.makedirs(path, exist_ok=True)
+    version = code_version()
+    for fmt, body in generate().items():
+        document = SchemaDocument(fmt, body)
+        _write(os.path.join(path, f'swagger.{fmt}'), document.body)
+        _write(os.path.join(path, f'swagger.{fmt}.gz'), document.gzipped)
+    # Written last: files from an interrupted build are never used
+    _write(os.path.join(path, MANIFEST), json.dumps({'version': version}).encode())
+    return version
+
+
+def _write(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class SchemaStore:
+    """The schema documents of this process, by (code version, format)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+
+    @property
+    def path(self):
+        return getattr(settings, 'SCHEMA_DIR', '')
+
+    def get(self, fmt):
+        key = (code_version(), fmt)
+        document = self._documents.get(key)
+        if document is None:
+            with self._lock:
+                document = self._documents.get(key)
+                if document is None:
+                    self._documents.update(self._load(key[0]) or self._generate(key[0]))
+                    document = self._documents[key]
+        return document
+
+    def clear(self):
+        self._documents = {}
+
+    def _load(self, version):
+        if not self.path:
+            return None
+        try:
+            with open(os.path.join(self.path, MANIFEST), 'rb') as f:
+                built = json.load(f)['version']
+            if built != version:
+                logger.warning(
+                    "Schema in %s was built for code version %s, not %s; generating it instead",
+                    self.path, built, version,
+                )
+                return None
+            documents = {}
+            for fmt in FORMATS:
+                with open(os.path.join(self.path, f'swagger.{fmt}'), 'rb') as f:
+                    body = f.read()
+                with open(os.path.join(self.path, f'swagger.{fmt}.gz'), 'rb') as f:
+                    gzipped = f.read()
+                documents[version, fmt] = SchemaDocument(fmt, body, gzipped)
+            return documents
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            logger.exception("Unreadable schema in %s; generating it instead", self.path)
+            return None
+
+    def _generate(self, version):
+        return {(version, fmt): SchemaDocument(fmt, body) for fmt, body in generate().items()}
+
+
+schema_store = SchemaStore()
+
+
+@require_safe
+def schema_file_view(request, format):
+    """
+    The schema as JSON or YAML, gzipped for clients that accept it.
+    Cacheable for SCHEMA_MAX_AGE seconds and revalidated with its ETag.
+    """
+    fmt = format.lstrip('.')
+    if fmt not in FORMATS:
+        raise Http404
+    document = schema_store.get(fmt)
+    gzipped = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    # Each encoding is its own representation, with its own ETag
+    etag = document.gzip_etag if gzipped else document.etag
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(document.gzipped if gzipped else document.body, content_type=document.content_type)
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'SCHEMA_MAX_AGE', 300))
+    return response
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
 # Load environment variables from .env file
@@ -92,15 +93,109 @@ TEMPLATES = [
     },
 ]
 
+# The admin, and the session and message apps only it needs: the API itself
+# authenticates with JWTs. ADMIN_ENABLED=false leaves them out of workers that
+# only serve the API, for a faster start and less memory per worker.
+ADMIN_ENABLED = os.environ.get('ADMIN_ENABLED', 'true').lower() == 'true'
+if not ADMIN_ENABLED:
+    for app in ('django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages'):
+        INSTALLED_APPS.remove(app)
+    for middleware in (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ):
+        MIDDLEWARE.remove(middleware)
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove('django.contrib.messages.context_processors.messages')
+
 WSGI_APPLICATION = 'core.wsgi.application'
 
 # Database configuration
 # Use DATABASE_URL environment variable with fallback to SQLite for development
 # default_db_url = 'sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3') if DEBUG else None
+#
+# Connections are reused across requests for DB_CONN_MAX_AGE seconds (0 closes
+# them after every request, "none" keeps them open), and a reused connection
+# is checked before a request's first query so one the server dropped is
+# replaced rather than failing the request (DB_CONN_HEALTH_CHECKS).
+# DB_POOL=true instead gives each worker process a pool of
+# DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections shared by its threads or
+# async tasks, waiting up to DB_POOL_TIMEOUT seconds for a free one; use it for
+# threaded and ASGI workers, where persistent connections are per thread. It
+# needs PostgreSQL with psycopg 3 (`pip install "psycopg[binary,pool]"`).
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
+DB_CONN_MAX_AGE = None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE)
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+DB_POOL = os.environ.get('DB_POOL', 'false').lower() == 'true'
+
+def parse_database_url(url):
+    return dj_database_url.parse(
+        url,
+        # Pooled connections go back to the pool after each request
+        conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS and not DB_POOL,
+    )
+
 DATABASES = {
-    'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
+    'default': parse_database_url(os.environ.get('DATABASE_URL'))
 }
 
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of database
+# URLs. Reads of REPLICA_MODELS (comma-separated app_label.model names) go to
+# a replica; everything else, and reads inside a transaction or after a write
+# in the same request, go to the primary. After a user is saved, reads of that
+# user (by id or email) stay on the primary for REPLICA_PIN_SECONDS, which
+# should be longer than the replicas ever lag. Tests read the replicas from
+# the primary's test database.
+DATABASE_REPLICAS = []
+for url in filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')):
+    alias = f'replica{len(DATABASE_REPLICAS) + 1}'
+    DATABASES[alias] = {**parse_database_url(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+REPLICA_MODELS = os.environ.get('REPLICA_MODELS', 'authapi.user').lower().split(',')
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+    MIDDLEWARE.insert(0, 'core.middleware.ReplicaRoutingMiddleware')
+
+if DB_POOL:
+    if any(database['ENGINE'] != 'django.db.backends.postgresql' for database in DATABASES.values()):
+        raise ImproperlyConfigured('DB_POOL needs PostgreSQL for DATABASE_URL and DATABASE_REPLICA_URLS')
+    from psycopg_pool import ConnectionPool
+
+    for database in DATABASES.values():
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            # The pool's own health check, run when a connection is handed out
+            **({'check': ConnectionPool.check_connection} if DB_CONN_HEALTH_CHECKS else {}),
+        }
+
+# Cache shared by every worker on this host (throttle counters, user cache
+# versions): a memory-mapped file of CACHE_MAX_ENTRIES slots, each holding a
+# key (hashed beyond 64 bytes) and pickled value of up to CACHE_SLOT_SIZE
+# bytes; larger values are logged and not cached. Set CACHE_PATH to an empty
+# string for a per-process LocMemCache instead.
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(BASE_DIR, 'var', 'cache.bin'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 200000))
+CACHE_SLOT_SIZE = int(os.environ.get('CACHE_SLOT_SIZE', 256))
+if CACHE_PATH:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.shm_cache.SharedMemoryCache',
+            'LOCATION': CACHE_PATH,
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES, 'SLOT_SIZE': CACHE_SLOT_SIZE},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -141,15 +236,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'authapi.backends.CustomJWTAuthentication',
     ],
+    # DRF's JSON renderer and parser, using orjson when it is installed
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'authapi.renderers.JSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'authapi.parsers.JSONParser',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'authapi.throttles.AnonRateThrottle',
+        'authapi.throttles.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',
@@ -171,10 +267,101 @@ SIMPLE_JWT = {
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'AUTH_TOKEN_CLASSES': ('authapi.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Asymmetric token signing (authapi.jwt_keys): one RSA (RS256) or Ed25519
+# (EdDSA) private key per file in JWT_KEYS_DIR, named <kid>.pem and created by
+# `manage.py rotate_jwt_key`. Every key verifies and is published at
+# /.well-known/jwks.json, whose responses may be cached for JWKS_MAX_AGE
+# seconds, so a new key only signs once its file is that old: the newest such
+# kid signs unless JWT_ACTIVE_KID names another. With no keys, tokens are
+# HS256-signed with SECRET_KEY.
+JWT_KEYS_DIR = os.environ.get('JWT_KEYS_DIR', os.path.join(BASE_DIR, 'var', 'jwt_keys'))
+JWT_ACTIVE_KID = os.environ.get('JWT_ACTIVE_KID', '')
+JWKS_MAX_AGE = int(os.environ.get('JWKS_MAX_AGE', 3600))
+
+# OpenAPI schema (core.schema): `manage.py build_schema` writes it to
+# SCHEMA_DIR at deploy time; without a build for this CODE_VERSION (default: a
+# digest of the source) each worker generates it once. The docs UIs load it
+# from /swagger.json, whose responses may be cached for SCHEMA_MAX_AGE seconds.
+# With LAZY_DOCS (the default in production) drf_yasg is only imported by the
+# first docs request instead of by every worker at startup.
+SCHEMA_DIR = os.environ.get('SCHEMA_DIR', os.path.join(BASE_DIR, 'var', 'schema'))
+CODE_VERSION = os.environ.get('CODE_VERSION', '')
+SCHEMA_MAX_AGE = int(os.environ.get('SCHEMA_MAX_AGE', 300))
+LAZY_DOCS = os.environ.get('LAZY_DOCS', 'false' if DEBUG else 'true').lower() == 'true'
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+    # The Django login button needs the admin's session login
+    'USE_SESSION_AUTH': ADMIN_ENABLED,
+}
+REDOC_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+
+# Services allowed to call the batch introspection endpoint, as comma-separated
+# name:secret pairs (HTTP Basic credentials), and the most tokens per call.
+INTROSPECTION_CLIENTS = dict(
+    pair.strip().split(':', 1)
+    for pair in os.environ.get('INTROSPECTION_CLIENTS', '').split(',')
+    if ':' in pair and pair.split(':', 1)[1].strip()
+)
+INTROSPECTION_MAX_TOKENS = int(os.environ.get('INTROSPECTION_MAX_TOKENS', 100))
+
+# Serve login, refresh, profile and logout from the async views in
+# authapi.async_views (for ASGI deployments)
+ASYNC_AUTH_VIEWS = os.environ.get('ASYNC_AUTH_VIEWS', 'false').lower() == 'true'
+
+# Password hashing runs on its own pool of this many threads per worker.
+# Up to PASSWORD_HASHING_QUEUE_DEPTH more requests may wait for a thread;
+# further ones are answered with 503 and Retry-After.
+PASSWORD_HASHING_THREADS = int(os.environ.get('PASSWORD_HASHING_THREADS', 4))
+PASSWORD_HASHING_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASHING_QUEUE_DEPTH', 16))
+
+# Key of the permutation that turns allocated account ID numbers into IDs.
+# Never change it once IDs have been issued: a new key maps new numbers onto
+# IDs that may already be taken.
+ACCOUNT_ID_KEY = os.environ.get('ACCOUNT_ID_KEY', 'authapi-account-id')
+
+# Bloom filter of registered emails, memory-mapped from this file by every
+# worker; lookups for emails it has never seen skip the database. The file is
+# built at startup when missing and by `manage.py rebuild_email_filter`.
+# Set EMAIL_FILTER_PATH to an empty string to disable it.
+EMAIL_FILTER_PATH = os.environ.get('EMAIL_FILTER_PATH', os.path.join(BASE_DIR, 'var', 'email_filter.bin'))
+EMAIL_FILTER_CAPACITY = int(os.environ.get('EMAIL_FILTER_CAPACITY', 1000000))
+EMAIL_FILTER_ERROR_RATE = float(os.environ.get('EMAIL_FILTER_ERROR_RATE', 0.001))
+
+# Token blacklist index: each worker keeps BlacklistedToken in memory and polls
+# for new rows at most this often (seconds), so a logout takes up to this long
+# to reach other workers.
+TOKEN_BLACKLIST_MAX_STALENESS = float(os.environ.get('TOKEN_BLACKLIST_MAX_STALENESS', 5))
+TOKEN_BLACKLIST_INDEX_CAPACITY = int(os.environ.get('TOKEN_BLACKLIST_INDEX_CAPACITY', 100000))
+
+# Expired blacklist rows are removed by `manage.py purge_blacklist` or, when
+# TOKEN_BLACKLIST_PURGE_INTERVAL (seconds) is set, by a thread in each worker.
+TOKEN_BLACKLIST_PURGE_INTERVAL = int(os.environ.get('TOKEN_BLACKLIST_PURGE_INTERVAL', 0))
+TOKEN_BLACKLIST_PURGE_CHUNK_SIZE = int(os.environ.get('TOKEN_BLACKLIST_PURGE_CHUNK_SIZE', 1000))
+TOKEN_BLACKLIST_PURGE_BUCKETED = os.environ.get('TOKEN_BLACKLIST_PURGE_BUCKETED', 'false').lower() == 'true'
+
+# Authenticated users are cached per worker (LRU, USER_CACHE_SIZE entries, each
+# valid for USER_CACHE_TTL seconds) and invalidated through version keys in the
+# shared cache whenever a User is saved.
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+# A refresh token is refused once its user has been inactive for longer than
+# TOKEN_INACTIVITY_TIMEOUT seconds (last activity, or the token's own issue
+# time if newer).
+TOKEN_INACTIVITY_TIMEOUT = int(os.environ.get('TOKEN_INACTIVITY_TIMEOUT', 3600))
+
+# last_activity is written behind: updates closer than LAST_ACTIVITY_RESOLUTION
+# seconds are dropped and the rest flushed in one statement every
+# LAST_ACTIVITY_FLUSH_INTERVAL seconds or once LAST_ACTIVITY_BUFFER_SIZE users
+# are pending.
+LAST_ACTIVITY_RESOLUTION = int(os.environ.get('LAST_ACTIVITY_RESOLUTION', 60))
+LAST_ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('LAST_ACTIVITY_FLUSH_INTERVAL', 30))
+LAST_ACTIVITY_BUFFER_SIZE = int(os.environ.get('LAST_ACTIVITY_BUFFER_SIZE', 500))
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.hostinger.com')
@@ -184,8 +371,22 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'support@digiswitchtec
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
+# Bounds each SMTP step; the outbox sizes its send deadline from it
 EMAIL_TIMEOUT = 10
 
+# Outbound email is queued in the database (authapi.OutboundEmail) and sent by
+# `manage.py send_outbox --loop`, or by a thread in each web worker when
+# EMAIL_OUTBOX_THREAD is true (the default, for single-process deployments).
+EMAIL_OUTBOX_THREAD = os.environ.get('EMAIL_OUTBOX_THREAD', 'true').lower() == 'true'
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 50))
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', 5))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', 30))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600))
+# Sent and abandoned emails lose their body (it holds the OTP) and are
+# deleted this many seconds later
+EMAIL_OUTBOX_RETENTION = int(os.environ.get('EMAIL_OUTBOX_RETENTION', 7 * 24 * 3600))
+
 # Production-specific security settings
 if not DEBUG:
     # Comment out SECURE_SSL_REDIRECT to avoid redirect loops on Railway
@@ -0,0 +1,306 @@
+"""
+Django cache backend shared by every process on one host.
+
+Entries live in a memory-mapped file that all workers map with MAP_SHARED,
+so a throttle counter or cache version bumped by one gunicorn worker is seen
+by the others without an external cache server.
+
+The file is a fixed table of MAX_ENTRIES slots of SLOT_SIZE bytes, grouped
+into buckets of WAYS slots; a key can only live in the bucket its hash picks.
+Each bucket is guarded by one of LOCK_STRIPES byte-range locks (lockf) on
+the file plus a thread lock for the threads of one process, which makes
+add() and incr() atomic across workers and threads. Django creates a backend
+instance per thread, so the fd, mapping and thread locks are kept per
+process and shared by all of them. When a bucket is full, a new entry
+replaces the expired or soonest-expiring one. Keys longer than
+MAX_KEY_LENGTH bytes are stored as a hash of the key, so any key fits;
+values that still do not fit in a slot are not stored, with a warning.
+
+    CACHES = {'default': {
+        'BACKEND': 'core.shm_cache.SharedMemoryCache',
+        'LOCATION': '/path/to/cache.bin',
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'SLOT_SIZE': 256},
+    }}
+"""
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lockf
+    fcntl = None
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'AESC'
+FORMAT_VERSION = 1
+# magic, format version, slot size, buckets, ways
+HEADER = struct.Struct('<4sIIQI')
+HEADER_SIZE = 64
+# key hash (0 = free), expiry (unix time, 0 = never), key length, value length
+SLOT = struct.Struct('<QdHI')
+# Longer keys are stored as a NUL byte and their 32-byte BLAKE2b digest
+MAX_KEY_LENGTH = 64
+
+logger = logging.getLogger(__name__)
+
+
+class _SharedFile:
+    """The cache file as mapped by one process, with its stripe thread locks."""
+
+    def __init__(self, fd, buf, stripes):
+        self.fd = fd
+        self.map = buf
+        self.thread_locks = [threading.Lock() for _ in range(stripes)]
+
+
+# (path, pid, layout) -> _SharedFile. lockf locks belong to the process, not
+# the fd, so one fd per file and process also keeps closing an fd from
+# dropping locks another instance holds.
+_shared_files = {}
+_shared_files_lock = threading.Lock()
+
+
+class SharedMemoryCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        if fcntl is None:
+            raise ImproperlyConfigured('SharedMemoryCache needs fcntl (a POSIX system)')
+        if not location:
+            raise ImproperlyConfigured('SharedMemoryCache needs a LOCATION file path')
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._slot_size = int(options.get('SLOT_SIZE', 256))
+        self._ways = int(options.get('WAYS', 8))
+        self._buckets = max(1, -(-self._max_entries // self._ways))
+        self._stripes = min(int(options.get('LOCK_STRIPES', 64)), self._buckets)
+        self._max_item = self._slot_size - SLOT.size
+        self._pid = None
+        self._shared = None
+
+    # File
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return self._shared.map
+        pid = os.getpid()
+        key = (self._path, pid, self._slot_size, self._buckets, self._ways, self._stripes)
+        with _shared_files_lock:
+            shared = _shared_files.get(key)
+            if shared is None:
+                # First use, or the first in a forked child: locks taken by
+                # the parent are not ours, so start over with our own fd.
+                for stale in [stale for stale in _shared_files if stale[1] != pid]:
+                    os.close(_shared_files.pop(stale).fd)
+                shared = _shared_files[key] = _SharedFile(*self._map_file(), self._stripes)
+        self._shared, self._pid = shared, pid
+        return shared.map
+
+    def _map_file(self):
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self._slot_size, self._buckets, self._ways)
+        size = HEADER_SIZE + self._buckets * self._ways * self._slot_size
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Creating or replacing the file is serialized on a sidecar lock file,
+        # which unlike the cache file itself is never replaced.
+        with open(self._path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(fd).st_size != size or os.pread(fd, HEADER.size, 0) != header:
+                    # New file, or one laid out for other options. Processes
+                    # still running with the old options keep the old file.
+                    os.close(fd)
+                    tmp = f"{self._path}.{os.getpid()}.tmp"
+                    fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, header, 0)
+                    os.replace(tmp, self._path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return fd, mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    # Slots
+
+    def _locate(self, key):
+        encoded = key.encode()
+        if len(encoded) > MAX_KEY_LENGTH:
+            encoded = b'\0' + hashlib.blake2b(encoded, digest_size=32).digest()
+        digest = int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'little') or 1
+        bucket = digest % self._buckets
+        return encoded, digest, bucket, bucket % self._stripes
+
+    def _lock(self, stripe):
+        shared = self._shared
+        shared.thread_locks[stripe].acquire()
+        try:
+            fcntl.lockf(shared.fd, fcntl.LOCK_EX, 1, stripe)
+        except BaseException:
+            shared.thread_locks[stripe].release()
+            raise
+
+    def _unlock(self, stripe):
+        shared = self._shared
+        try:
+            fcntl.lockf(shared.fd, fcntl.LOCK_UN, 1, stripe)
+        finally:
+            shared.thread_locks[stripe].release()
+
+    def _find(self, buf, encoded, digest, bucket, now):
+        """
+        Return (offset of the live entry for the key or None, offset a new
+        entry should go to). Expired entries are treated as free.
+        """
+        start = HEADER_SIZE + bucket * self._ways * self._slot_size
+        free = None
+        victim, victim_expiry = start, float('inf')
+        for offset in range(start, start + self._ways * self._slot_size, self._slot_size):
+            slot_digest, expires, key_length, _ = SLOT.unpack_from(buf, offset)
+            expired = slot_digest == 0 or (expires and expires <= now)
+            if expired:
+                if free is None:
+                    free = offset
+                continue
+            if slot_digest == digest and buf[offset + SLOT.size:offset + SLOT.size + key_length] == encoded:
+                return offset, offset
+            if expires and expires < victim_expiry:
+                victim, victim_expiry = offset, expires
+        return None, free if free is not None else victim
+
+    def _read(self, buf, offset):
+        _, _, key_length, value_length = SLOT.unpack_from(buf, offset)
+        start = offset + SLOT.size + key_length
+        return pickle.loads(buf[start:start + value_length])
+
+    def _write(self, buf, offset, encoded, digest, expires, value):
+        buf[offset:offset + SLOT.size + len(encoded) + len(value)] = (
+            SLOT.pack(digest, expires, len(encoded), len(value)) + encoded + value
+        )
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        # None means never expire; 0 is how a slot stores that
+        return 0.0 if expires is None else float(expires)
+
+    def _store(self, key, value, timeout, version, only_new):
+        key = self.make_and_validate_key(key, version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            found, offset = self._find(buf, encoded, digest, bucket, time.time())
+            if found is not None and only_new:
+                return False
+            if len(encoded) + len(pickled) > self._max_item:
+                # Too large for a slot: never leave an older value behind
+                if found is not None:
+                    SLOT.pack_into(buf, found, 0, 0.0, 0, 0)
+                logger.warning(
+                    "Not caching '%s': %d-byte value does not fit a %d-byte slot",
+                    key, len(pickled), self._slot_size,
+                )
+                return False
+            self._write(buf, offset, encoded, digest, self._expiry(timeout), pickled)
+            return True
+        finally:
+            self._unlock(stripe)
+
+    # Cache API
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version, only_new=False)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            found, _ = self._find(buf, encoded, digest, bucket, time.time())
+            if found is None:
+                return default
+            return self._read(buf, found)
+        finally:
+            self._unlock(stripe)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            found, _ = self._find(buf, encoded, digest, bucket, time.time())
+            if found is None:
+                return False
+            struct.pack_into('<d', buf, found + 8, self._expiry(timeout))
+            return True
+        finally:
+            self._unlock(stripe)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            found, _ = self._find(buf, encoded, digest, bucket, time.time())
+            if found is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._read(buf, found) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            if len(encoded) + len(pickled) > self._max_item:
+                raise ValueError("Value of '%s' too large for a cache slot" % key)
+            expires = SLOT.unpack_from(buf, found)[1]
+            self._write(buf, found, encoded, digest, expires, pickled)
+            return new_value
+        finally:
+            self._unlock(stripe)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            return self._find(buf, encoded, digest, bucket, time.time())[0] is not None
+        finally:
+            self._unlock(stripe)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        encoded, digest, bucket, stripe = self._locate(key)
+        buf = self._open()
+        self._lock(stripe)
+        try:
+            found, _ = self._find(buf, encoded, digest, bucket, time.time())
+            if found is None:
+                return False
+            SLOT.pack_into(buf, found, 0, 0.0, 0, 0)
+            return True
+        finally:
+            self._unlock(stripe)
+
+    def clear(self):
+        buf = self._open()
+        for stripe in range(self._stripes):
+            self._lock(stripe)
+        try:
+            for offset in range(HEADER_SIZE, len(buf), self._slot_size):
+                SLOT.pack_into(buf, offset, 0, 0.0, 0, 0)
+        finally:
+            for stripe in reversed(range(self._stripes)):
+                self._unlock(stripe)
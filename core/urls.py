@@ -14,39 +14,37 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.views.generic.base import RedirectView
 
-# Swagger imports
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from authapi.views import jwks_view
+from core.docs import lazy_view
 
-# Create schema view for Swagger documentation
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Django Auth API",
-        default_version='v1',
-        description="API for user authentication, registration, and profile management",
-        terms_of_service="https://www.yourapp.com/terms/",
-        contact=openapi.Contact(email="contact@yourapp.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+if settings.LAZY_DOCS:
+    # drf_yasg is imported on the first docs request
+    schema_file_view = lazy_view('core.schema.schema_file_view')
+    swagger_ui_view = lazy_view('core.schema.swagger_ui_view')
+    redoc_view = lazy_view('core.schema.redoc_view')
+else:
+    from core.schema import redoc_view, schema_file_view, swagger_ui_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/v1/auth/', include('authapi.urls')),
+    # Token verification keys for other services
+    path('.well-known/jwks.json', jwks_view, name='jwks'),
     
     # Redirect root URL to swagger documentation
     path('', RedirectView.as_view(url='/swagger/'), name='index'),
     
     # Swagger documentation URLs
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('docs/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # Pre-built (`manage.py build_schema`) or generated once per process
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_file_view, name='schema-json'),
+    path('swagger/', swagger_ui_view, name='schema-swagger-ui'),
+    path('docs/', redoc_view, name='schema-redoc'),
 ]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))